@@ -114,6 +114,13 @@ def create_app(config_name=None):
             logger.error(f"数据库初始化失败: {e}")
             logger.warning("应用将继续启动，但数据库相关功能可能不可用")
     
+    # 加载FAISS向量索引（内存映射，避免首个查询时再加载）
+    try:
+        from services.search_engine import init_search_engine
+        init_search_engine(app)
+    except Exception as e:
+        logger.warning(f"FAISS索引加载失败，语义查询将在首次请求时重试: {e}")
+    
     # 注册错误处理器
     register_error_handlers(app)
     
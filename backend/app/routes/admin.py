@@ -1,3 +1,4 @@
+from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
 from flask_jwt_extended import jwt_required
 import sys
@@ -35,7 +36,17 @@ class DashboardStats(Resource):
         total_success = sum(s.success_count for s in all_sources)
         overall_success_rate = (total_success / total_fetches * 100) if total_fetches > 0 else 0
         
+        # 向量索引内存占用
+        try:
+            from services.search_engine import get_search_engine
+            from services.indexer import load_throughput
+            vector_index = get_search_engine().shards.memory_report()
+            vector_index['vectorize_throughput'] = load_throughput(current_app.config['FAISS_INDEX_PATH'])
+        except Exception as e:
+            vector_index = {'error': str(e)}
+        
         return {
+            'vector_index': vector_index,
             'data_sources': {
                 'total': data_source_stats['total'],
                 'active': data_source_stats['active'],
@@ -58,6 +69,31 @@ class DashboardStats(Resource):
             }
         }, 200
 
+@admin_ns.route('/query-latency')
+class QueryLatency(Resource):
+    @jwt_required()
+    def get(self):
+        """
+        查询分阶段耗时分位数（毫秒）：
+          ?window=3600          统计窗口（秒）
+          &type=semantic        查询类型 semantic/keyword/rag，默认全部
+          &include_cache_hits=1 包含命中结果缓存的查询（默认排除）
+        """
+        try:
+            window = int(request.args.get('window', 3600))
+        except ValueError:
+            return {'error': 'window 必须是整数（秒）'}, 400
+        if window <= 0:
+            return {'error': 'window 必须大于0'}, 400
+
+        query_type = request.args.get('type') or None
+        if query_type not in (None, 'semantic', 'keyword', 'rag'):
+            return {'error': '查询类型必须是: semantic, keyword, rag'}, 400
+        include_cache_hits = request.args.get('include_cache_hits', '').lower() in ['true', 'on', '1']
+
+        from services.query_metrics import get_query_metrics
+        return get_query_metrics(current_app.config).stats(window, query_type, include_cache_hits), 200
+
 # TODO: 实现管理员接口
 @admin_ns.route('')
 class AdminInfo(Resource):
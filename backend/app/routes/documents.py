@@ -290,13 +290,10 @@ class UploadDocument(Resource):
                 
                 elif file_ext == '.html':
                     # HTML文件
-                    from bs4 import BeautifulSoup
+                    from services.html_parser import html_to_text
                     with open(file_path, 'r', encoding='utf-8') as f:
-                        soup = BeautifulSoup(f.read(), 'html.parser')
-                        # 提取文本内容
-                        for script in soup(['script', 'style']):
-                            script.decompose()
-                        content = soup.get_text(separator='\n', strip=True)
+                        # 去掉脚本和样式后提取文本内容
+                        content = html_to_text(f.read(), current_app.config.get('HTML_PARSER'))
                 
                 elif file_ext == '.pdf':
                     # PDF文件（需要安装PyPDF2或pdfplumber）
@@ -348,6 +345,13 @@ class UploadDocument(Resource):
                 db.session.add(doc)
                 db.session.commit()
                 
+                # 增量更新关键词索引
+                try:
+                    from services.shards import index_keywords
+                    index_keywords(current_app.config, [doc])
+                except Exception as e:
+                    current_app.logger.warning(f"更新关键词索引失败: {e}")
+                
                 return {
                     'message': '文件上传成功',
                     'document': doc.to_dict_full()
@@ -1,11 +1,350 @@
+"""查询API - 语义检索、混合检索与RAG流式问答"""
+from flask import request, current_app, Response, stream_with_context
 from flask_restx import Namespace, Resource, fields
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import sys
+import os
+import time
+import json
+import logging
+from datetime import datetime
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from models.document import Document
+from models.query_log import QueryLog
+from models.database import db
+from sqlalchemy import case, func, literal
+from services.llm import build_rag_prompt, get_llm_client
+from services.query_cache import ResultCursors
+from services.query_metrics import StageTimer, get_query_metrics
+from services.search_engine import get_search_engine
+
+logger = logging.getLogger(__name__)
 
 query_ns = Namespace('query', description='查询相关操作')
 
-# TODO: 实现查询接口
+# 数据模型
+semantic_query_model = query_ns.model('SemanticQuery', {
+    'query': fields.String(description='查询文本（携带 cursor 翻页时可省略）'),
+    'cursor': fields.String(description='翻页游标（上一页返回的 next_cursor）'),
+    'top_k': fields.Integer(description='每页结果数量（默认SEARCH_RESULTS_LIMIT）'),
+    'threshold': fields.Float(description='相似度阈值（默认SIMILARITY_THRESHOLD）'),
+    'mode': fields.String(description='检索模式: hybrid（默认，向量+BM25融合）/vector/keyword'),
+    'rerank': fields.Boolean(description='是否使用交叉编码器重排（默认RERANK_ENABLED）'),
+    'source_type': fields.String(description='来源类型过滤: rss/web/upload'),
+    'source_name': fields.String(description='来源名称过滤'),
+    'start_date': fields.String(description='开始日期（YYYY-MM-DD）'),
+    'end_date': fields.String(description='结束日期（YYYY-MM-DD）')
+})
+
+rag_answer_model = query_ns.model('RagAnswer', {
+    'query': fields.String(required=True, description='问题'),
+    'top_k': fields.Integer(description='参考文档数量（默认RAG_CONTEXT_DOCS）'),
+    'mode': fields.String(description='检索模式: hybrid（默认）/vector/keyword'),
+    'source_type': fields.String(description='来源类型过滤: rss/web/upload'),
+    'source_name': fields.String(description='来源名称过滤'),
+    'start_date': fields.String(description='开始日期（YYYY-MM-DD）'),
+    'end_date': fields.String(description='结束日期（YYYY-MM-DD）')
+})
+
+
+def _parse_filters(data: dict) -> dict:
+    """解析检索过滤条件，日期格式错误时抛出 ValueError"""
+    filters = {
+        'source_type': data.get('source_type'),
+        'source_name': data.get('source_name')
+    }
+    if data.get('start_date'):
+        filters['start_time'] = datetime.strptime(data['start_date'], '%Y-%m-%d')
+    if data.get('end_date'):
+        # 设置为当天的结束时间
+        end = datetime.strptime(data['end_date'], '%Y-%m-%d')
+        filters['end_time'] = end.replace(hour=23, minute=59, second=59)
+    return filters
+
+
+def _log_query(query_text: str, query_type: str, results_count: int, response_time: float):
+    """记录查询日志（失败不影响查询结果）"""
+    try:
+        user_id = get_jwt_identity()
+        log = QueryLog(
+            user_id=int(user_id) if user_id else None,
+            query_text=query_text,
+            query_type=query_type,
+            results_count=results_count,
+            response_time=response_time
+        )
+        db.session.add(log)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"记录查询日志失败: {e}")
+
+
+def _record_metrics(query_type: str, timer: StageTimer):
+    """记录分阶段耗时（QUERY_METRICS_ENABLED 关闭时跳过）"""
+    config = current_app.config
+    if config.get('QUERY_METRICS_ENABLED', True):
+        get_query_metrics(config).record(query_type, timer)
+
+
+# 列表视图只需要的列（不加载正文）
+LIST_COLUMNS = (
+    Document.id, Document.title, Document.summary, Document.source_type,
+    Document.source_name, Document.source_url, Document.tags, Document.created_at
+)
+
+
+def _hydrate_results(hits: list) -> list:
+    """
+    一次 IN 查询回表，按检索排名输出文档及各项得分。
+    只查询列表视图需要的列；命中分块在SQL中按偏移截取，不把整篇正文读回应用。
+    """
+    if not hits:
+        return []
+    doc_ids = [hit['document_id'] for hit in hits]
+    chunk_cases = [
+        (Document.id == hit['document_id'],
+         func.substr(Document.content, hit['start'] + 1, hit['end'] - hit['start']))
+        for hit in hits if hit['start'] is not None
+    ]
+    matched_chunk = case(*chunk_cases, else_=None) if chunk_cases else literal(None)
+    rows = db.session.query(*LIST_COLUMNS, matched_chunk.label('matched_chunk')).filter(
+        Document.id.in_(doc_ids)
+    ).all()
+    row_map = {row.id: row for row in rows}
+
+    results = []
+    for hit in hits:
+        row = row_map.get(hit['document_id'])
+        if row is None:
+            # 索引中存在但文档已被删除
+            continue
+        results.append({
+            'id': row.id,
+            'title': row.title,
+            'summary': row.summary,
+            'source_type': row.source_type,
+            'source_name': row.source_name,
+            'source_url': row.source_url,
+            'tags': row.tags or [],
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'score': round(hit['score'], 4),
+            'vector_score': round(hit['vector_score'], 4) if hit['vector_score'] is not None else None,
+            'bm25_score': round(hit['bm25_score'], 4) if hit['bm25_score'] is not None else None,
+            'rerank_score': round(hit['rerank_score'], 4) if hit['rerank_score'] is not None else None,
+            # 仅关键词命中的文档没有分块
+            'matched_chunk': row.matched_chunk
+        })
+    return results
+
+
+def _sse(event: str, data) -> str:
+    """编码一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 @query_ns.route('/semantic')
 class SemanticQuery(Resource):
+    # 与原接口一致允许匿名访问；携带令牌时识别用户（查询日志、游标归属）
+    @jwt_required(optional=True)
+    @query_ns.expect(semantic_query_model)
     def post(self):
-        """语义查询"""
-        return {'message': '语义查询接口待实现'}, 200
+        """
+        语义查询（FAISS向量检索 + BM25关键词检索，RRF融合）。
+        首次查询排序 SEARCH_CURSOR_DEPTH 个候选并缓存，返回第一页与 next_cursor；
+        携带 cursor 请求后续页时只对缓存的排序结果切片并回表，不重复检索与重排。
+        """
+        data = request.get_json() or {}
+        if data.get('cursor'):
+            return self._next_page(data['cursor'])
+
+        query_text = (data.get('query') or '').strip()
+        if not query_text:
+            return {'error': '查询文本不能为空'}, 400
+
+        limit = current_app.config.get('SEARCH_RESULTS_LIMIT', 10)
+        try:
+            page_size = min(int(data.get('top_k') or limit), limit)
+            threshold = data.get('threshold')
+            threshold = float(threshold) if threshold is not None else None
+        except (TypeError, ValueError):
+            return {'error': 'top_k 或 threshold 格式错误'}, 400
+        if page_size <= 0:
+            return {'error': 'top_k 必须大于0'}, 400
+        
+        mode = data.get('mode') or 'hybrid'
+        if mode not in ('hybrid', 'vector', 'keyword'):
+            return {'error': '检索模式必须是: hybrid, vector, keyword'}, 400
+
+        try:
+            filters = _parse_filters(data)
+        except ValueError:
+            return {'error': '日期格式错误，应为 YYYY-MM-DD'}, 400
+
+        start_time = time.perf_counter()
+        timer = StageTimer()
+        try:
+            engine = get_search_engine()
+            rerank = bool(data.get('rerank', True))
+            depth = max(page_size, current_app.config.get('SEARCH_CURSOR_DEPTH', 100))
+            hits = engine.search(query_text, top_k=depth, threshold=threshold,
+                                 mode=mode, rerank=rerank, filters=filters, timer=timer)
+
+            with timer.stage('hydrate'):
+                results = _hydrate_results(hits[:page_size])
+
+            next_cursor = None
+            if len(hits) > page_size:
+                token = engine.cursors.open(str(get_jwt_identity()), query_text, mode, hits)
+                next_cursor = ResultCursors.encode(token, page_size, page_size)
+
+            response_time = time.perf_counter() - start_time
+            timer.finish()
+            query_type = 'keyword' if mode == 'keyword' else 'semantic'
+            _log_query(query_text, query_type, len(results), response_time)
+            _record_metrics(query_type, timer)
+
+            return {
+                'query': query_text,
+                'mode': mode,
+                'results': results,
+                'total': len(results),
+                'total_candidates': len(hits),
+                'next_cursor': next_cursor,
+                'response_time_ms': round(response_time * 1000, 2)
+            }, 200
+
+        except Exception as e:
+            logger.error(f"语义查询失败: {e}")
+            return {'error': f'语义查询失败: {str(e)}'}, 500
+
+    def _next_page(self, cursor: str):
+        """按游标从缓存的排序结果中取下一页"""
+        try:
+            token, offset, page_size = ResultCursors.decode(cursor)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        start_time = time.perf_counter()
+        entry = get_search_engine().cursors.get(token, str(get_jwt_identity()))
+        if entry is None:
+            return {'error': '游标已过期，请重新查询'}, 410
+
+        hits = entry['hits']
+        try:
+            results = _hydrate_results(hits[offset:offset + page_size])
+        except Exception as e:
+            logger.error(f"语义查询翻页失败: {e}")
+            return {'error': f'语义查询翻页失败: {str(e)}'}, 500
+
+        end = offset + page_size
+        return {
+            'query': entry['query'],
+            'mode': entry['mode'],
+            'results': results,
+            'total': len(results),
+            'total_candidates': len(hits),
+            'next_cursor': ResultCursors.encode(token, end, page_size) if end < len(hits) else None,
+            'response_time_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        }, 200
+
+
+@query_ns.route('/answer')
+class RagAnswer(Resource):
+    @jwt_required()
+    @query_ns.expect(rag_answer_model)
+    def post(self):
+        """
+        RAG问答（server-sent events）：
+          - event: sources  检索完成后立即发送参考文档
+          - event: token    Ollama生成的文本片段，逐块推送
+          - event: done     生成结束，附带首字延迟与总耗时
+          - event: error    生成失败（参考文档已发送，前端可降级展示）
+        """
+        data = request.get_json() or {}
+        query_text = (data.get('query') or '').strip()
+        if not query_text:
+            return {'error': '查询文本不能为空'}, 400
+
+        limit = current_app.config.get('RAG_CONTEXT_DOCS', 5)
+        try:
+            top_k = min(int(data.get('top_k') or limit), current_app.config.get('SEARCH_RESULTS_LIMIT', 10))
+        except (TypeError, ValueError):
+            return {'error': 'top_k 格式错误'}, 400
+
+        mode = data.get('mode') or 'hybrid'
+        if mode not in ('hybrid', 'vector', 'keyword'):
+            return {'error': '检索模式必须是: hybrid, vector, keyword'}, 400
+
+        try:
+            filters = _parse_filters(data)
+        except ValueError:
+            return {'error': '日期格式错误，应为 YYYY-MM-DD'}, 400
+
+        # 检索与回表在流开始前完成，数据库会话不跨越生成过程
+        start_time = time.perf_counter()
+        timer = StageTimer()
+        try:
+            hits = get_search_engine().search(query_text, top_k=top_k, mode=mode, filters=filters, timer=timer)
+            with timer.stage('hydrate'):
+                sources = _hydrate_results(hits)
+        except Exception as e:
+            logger.error(f"RAG检索失败: {e}")
+            return {'error': f'RAG检索失败: {str(e)}'}, 500
+
+        retrieval_time = time.perf_counter() - start_time
+        _log_query(query_text, 'rag', len(sources), retrieval_time)
+
+        llm = get_llm_client(current_app.config)
+        prompt = build_rag_prompt(query_text, sources, current_app.config.get('RAG_CONTEXT_CHARS', 1000))
+        metrics = get_query_metrics(current_app.config) if current_app.config.get('QUERY_METRICS_ENABLED', True) else None
+
+        def record_metrics():
+            # 流结束（完成、失败或客户端断开）时记录，包含生成阶段耗时
+            timer.finish()
+            if metrics is not None:
+                metrics.record('rag', timer)
+
+        def generate():
+            yield _sse('sources', {
+                'query': query_text,
+                'sources': sources,
+                'retrieval_time_ms': round(retrieval_time * 1000, 2)
+            })
+            if not sources:
+                record_metrics()
+                yield _sse('done', {'answer_available': False, 'total_time_ms': round(retrieval_time * 1000, 2)})
+                return
+
+            first_token_time = None
+            generate_start = time.perf_counter()
+            try:
+                for token in llm.stream_generate(prompt):
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - start_time
+                        timer.add('first_token', first_token_time * 1000)
+                    yield _sse('token', {'text': token})
+            except Exception as e:
+                logger.error(f"RAG生成失败: {e}")
+                yield _sse('error', {'error': f'生成回答失败: {str(e)}'})
+                return
+            finally:
+                timer.add('llm', (time.perf_counter() - generate_start) * 1000)
+                record_metrics()
+
+            yield _sse('done', {
+                'answer_available': True,
+                'first_token_ms': round(first_token_time * 1000, 2) if first_token_time is not None else None,
+                'total_time_ms': round((time.perf_counter() - start_time) * 1000, 2)
+            })
 
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            # 关闭反向代理（nginx）缓冲，否则事件会攒到一起才到达客户端
+            'X-Accel-Buffering': 'no'
+        })
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+HTML解析后端基准测试：在保存的真实新闻页面语料上对比 bs4 / lxml / selectolax 的
+解析吞吐（页/秒）以及与当前输出（bs4 html.parser）的提取一致率
+
+用法：
+  python benchmark_html_parser.py --save urls.txt        # 先下载 urls.txt 中的页面到语料目录
+  python benchmark_html_parser.py                        # 使用 ./data/html_corpus 下的 *.html
+  python benchmark_html_parser.py --corpus DIR --show-diff 5
+"""
+import sys
+import os
+import argparse
+import hashlib
+import re
+import time
+from difflib import SequenceMatcher
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import requests
+
+from services.html_parser import BACKENDS, available_backend, extract_article, html_to_text
+
+
+def save_pages(urls_file, corpus_dir):
+    """下载 urls_file 中的页面（每行一个URL）到语料目录，文件名为URL的sha1"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    with open(urls_file, 'r', encoding='utf-8') as f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    session = requests.Session()
+    session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; NewsRAG/1.0; +http://example.com/bot)'
+    saved = 0
+    for url in urls:
+        path = os.path.join(corpus_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html')
+        if os.path.exists(path):
+            continue
+        try:
+            response = session.get(url, timeout=30)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"  跳过 {url}: {e}")
+            continue
+        with open(path, 'wb') as f:
+            f.write(response.content)
+        saved += 1
+        time.sleep(0.5)
+    print(f"已保存 {saved} 个页面到 {corpus_dir}\n")
+
+
+def load_corpus(corpus_dir, limit=None):
+    files = sorted(name for name in os.listdir(corpus_dir) if name.endswith('.html'))[:limit]
+    pages = []
+    for name in files:
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            pages.append((name, f.read()))
+    return pages
+
+
+def normalize(text):
+    """与 WebFetcher._clean_text 一致的空白归一化，比较的是入库前的最终文本"""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def run_backend(backend, pages, repeat):
+    """返回 (提取结果列表, 详情页提取 页/秒, 纯文本提取 页/秒)，取多次运行中最快的一次"""
+    results = [extract_article(html, backend=backend) for _, html in pages]
+    best_extract = best_text = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _, html in pages:
+            extract_article(html, backend=backend)
+        best_extract = min(best_extract, time.perf_counter() - start)
+        start = time.perf_counter()
+        for _, html in pages:
+            html_to_text(html, backend=backend)
+        best_text = min(best_text, time.perf_counter() - start)
+    return results, len(pages) / best_extract, len(pages) / best_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTML解析后端吞吐与提取一致性基准测试')
+    parser.add_argument('--corpus', default='./data/html_corpus', help='语料目录（*.html）')
+    parser.add_argument('--save', help='先下载该文件中列出的URL（每行一个）到语料目录')
+    parser.add_argument('--limit', type=int, help='最多使用的页面数')
+    parser.add_argument('--repeat', type=int, default=3, help='计时重复次数')
+    parser.add_argument('--min-parity', type=float, default=0.95, help='正文与当前输出完全一致的页面比例下限')
+    parser.add_argument('--show-diff', type=int, default=0, help='每个后端打印前N个不一致的页面')
+    args = parser.parse_args()
+
+    if args.save:
+        save_pages(args.save, args.corpus)
+    if not os.path.isdir(args.corpus):
+        print(f"错误: 语料目录 {args.corpus} 不存在，请使用 --save 下载页面")
+        sys.exit(1)
+    pages = load_corpus(args.corpus, args.limit)
+    if not pages:
+        print(f"错误: 语料目录 {args.corpus} 中没有 *.html 文件")
+        sys.exit(1)
+    total_mb = sum(len(html) for _, html in pages) / 1024 / 1024
+    print(f"语料: {len(pages)} 个页面，共 {total_mb:.1f} MB\n")
+
+    # 当前输出（bs4 + html.parser）作为对照
+    reference, base_extract, base_text = run_backend('bs4', pages, args.repeat)
+    print(f"{'后端':<12}{'提取 页/秒':>12}{'纯文本 页/秒':>14}{'加速':>8}{'标题一致':>10}{'正文一致':>10}{'正文相似度':>12}")
+    print(f"{'bs4':<12}{base_extract:>12.1f}{base_text:>14.1f}{1.0:>8.2f}{'100.0%':>10}{'100.0%':>10}{1.0:>12.4f}")
+
+    failed = []
+    for backend in BACKENDS[1:]:
+        if available_backend(backend) != backend:
+            print(f"{backend:<12}未安装，跳过")
+            continue
+        results, extract_rate, text_rate = run_backend(backend, pages, args.repeat)
+        title_same = content_same = 0
+        similarities = []
+        diffs = []
+        for (name, _), expected, actual in zip(pages, reference, results):
+            title_same += normalize(expected['title']) == normalize(actual['title'])
+            expected_content, actual_content = normalize(expected['content']), normalize(actual['content'])
+            if expected_content == actual_content:
+                content_same += 1
+                similarities.append(1.0)
+            else:
+                # 长文本只比较开头，避免 SequenceMatcher 的平方复杂度
+                similarities.append(SequenceMatcher(None, expected_content[:5000], actual_content[:5000],
+                                                    autojunk=False).ratio())
+                diffs.append((name, expected_content, actual_content))
+        parity = content_same / len(pages)
+        print(f"{backend:<12}{extract_rate:>12.1f}{text_rate:>14.1f}{extract_rate / base_extract:>8.2f}"
+              f"{title_same / len(pages):>10.1%}{parity:>10.1%}{sum(similarities) / len(similarities):>12.4f}")
+        for name, expected_content, actual_content in diffs[:args.show_diff]:
+            print(f"    {name}\n      bs4:     {expected_content[:160]}\n      {backend + ':':<9}{actual_content[:160]}")
+        if parity < args.min_parity:
+            failed.append(backend)
+
+    if failed:
+        print(f"\n警告: {', '.join(failed)} 的正文一致率低于 {args.min_parity:.0%}，切换 HTML_PARSER 前请检查差异")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
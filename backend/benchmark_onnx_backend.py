@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+ONNX推理后端校验与基准测试：
+  1. 一致性：ONNX（默认int8量化）与PyTorch的句向量余弦相似度、重排得分排序一致性，
+     低于阈值时以非零状态码退出（可用于CI或上线前检查）
+  2. 速度：两种后端的编码与重排吞吐及加速比
+
+用法：
+  python benchmark_onnx_backend.py
+  python benchmark_onnx_backend.py --texts 2000 --min-cosine 0.98
+"""
+import sys
+import os
+import argparse
+import time
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import numpy as np
+
+from config.config import config
+from services.embeddings import EmbeddingService
+from services.reranker import CrossEncoderReranker
+
+SAMPLE_TEXTS = [
+    '国务院常务会议部署进一步扩大内需的政策措施',
+    '央行宣布下调金融机构存款准备金率0.25个百分点',
+    '我国成功发射新一代载人飞船试验船',
+    '多地出台新能源汽车消费支持政策',
+    '人工智能大模型在医疗影像诊断中的应用取得进展',
+    '今年夏粮产量再创历史新高',
+    'The central bank cut the reserve requirement ratio by 25 basis points.',
+    'New energy vehicle exports grew rapidly in the first half of the year.',
+]
+SAMPLE_QUERIES = ['降准', '新能源汽车', '人工智能医疗', 'grain harvest']
+
+
+def load_texts(count):
+    """优先使用数据库中的文档标题与正文开头，数据库不可用时使用内置样例"""
+    try:
+        import importlib.util
+        # 动态导入 app.py 中的 create_app（与 app 包同名）
+        spec = importlib.util.spec_from_file_location("app_module", os.path.join(backend_dir, 'app.py'))
+        app_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(app_module)
+        from models.database import db
+        from models.document import Document
+        app = app_module.create_app()
+        with app.app_context():
+            rows = db.session.query(Document.title, Document.content).limit(count).all()
+            texts = [f"{row.title or ''}\n{(row.content or '')[:400]}" for row in rows]
+            if texts:
+                return texts
+    except Exception as e:
+        print(f"读取数据库文档失败，使用内置样例: {e}")
+    return (SAMPLE_TEXTS * (count // len(SAMPLE_TEXTS) + 1))[:count]
+
+
+def timed(func, *args, repeat=3):
+    """取多次运行中最快的一次（首次运行包含预热）"""
+    func(*args)
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ONNX推理后端一致性校验与基准测试')
+    parser.add_argument('--texts', type=int, default=500, help='参与测试的文本数')
+    parser.add_argument('--batch-size', type=int, default=64, help='编码批大小')
+    parser.add_argument('--min-cosine', type=float, default=0.98, help='单条句向量余弦相似度下限')
+    parser.add_argument('--min-rank-agreement', type=float, default=0.9, help='重排得分排序一致率下限')
+    parser.add_argument('--no-quantize', action='store_true', help='对比未量化的ONNX模型')
+    args = parser.parse_args()
+
+    app_config = config[os.environ.get('FLASK_ENV', 'development')]
+    onnx_options = dict(onnx_root=app_config.ONNX_MODEL_DIR, onnx_quantized=not args.no_quantize,
+                        num_threads=app_config.ONNX_NUM_THREADS)
+    texts = load_texts(args.texts)
+    print(f"文本: {len(texts)} 条，ONNX模型: {'float32' if args.no_quantize else 'int8'}\n")
+
+    # ---- 嵌入模型 ----
+    torch_embedder = EmbeddingService(app_config.EMBEDDING_MODEL)
+    onnx_embedder = EmbeddingService(app_config.EMBEDDING_MODEL, backend='onnx', **onnx_options)
+    torch_vectors, torch_seconds = timed(torch_embedder.encode, texts, args.batch_size)
+    onnx_vectors, onnx_seconds = timed(onnx_embedder.encode, texts, args.batch_size)
+    cosine = np.sum(torch_vectors * onnx_vectors, axis=1)
+    embedding_ok = cosine.min() >= args.min_cosine
+    print(f"嵌入模型 {app_config.EMBEDDING_MODEL}")
+    print(f"  余弦相似度: 平均 {cosine.mean():.5f}，最小 {cosine.min():.5f}（下限 {args.min_cosine}）"
+          f" {'通过' if embedding_ok else '未通过'}")
+    print(f"  PyTorch: {len(texts) / torch_seconds:.1f} 条/秒，ONNX: {len(texts) / onnx_seconds:.1f} 条/秒，"
+          f"加速 {torch_seconds / onnx_seconds:.2f}x\n")
+
+    # ---- 重排模型 ----
+    torch_reranker = CrossEncoderReranker(app_config.RERANK_MODEL)
+    onnx_reranker = CrossEncoderReranker(app_config.RERANK_MODEL, backend='onnx', onnx_root=onnx_options['onnx_root'],
+                                         onnx_quantized=onnx_options['onnx_quantized'],
+                                         num_threads=onnx_options['num_threads'])
+    candidates = texts[:min(len(texts), 30)]
+    agreements = []
+    torch_total = onnx_total = 0.0
+    for query in SAMPLE_QUERIES:
+        pairs = [(query, text) for text in candidates]
+        torch_scores, seconds = timed(torch_reranker.model.predict, pairs)
+        torch_total += seconds
+        onnx_scores, seconds = timed(onnx_reranker.model.predict, pairs)
+        onnx_total += seconds
+        # 成对排序一致率：两种后端对候选两两先后关系判断一致的比例
+        torch_diff = np.sign(np.subtract.outer(torch_scores, torch_scores))
+        onnx_diff = np.sign(np.subtract.outer(onnx_scores, onnx_scores))
+        upper = np.triu_indices(len(candidates), k=1)
+        agreements.append(np.mean(torch_diff[upper] == onnx_diff[upper]))
+    agreement = float(np.mean(agreements))
+    rerank_ok = agreement >= args.min_rank_agreement
+    pair_count = len(candidates) * len(SAMPLE_QUERIES)
+    print(f"重排模型 {torch_reranker.model_name}")
+    print(f"  排序一致率: {agreement:.4f}（下限 {args.min_rank_agreement}） {'通过' if rerank_ok else '未通过'}")
+    print(f"  PyTorch: {pair_count / torch_total:.1f} 对/秒，ONNX: {pair_count / onnx_total:.1f} 对/秒，"
+          f"加速 {torch_total / onnx_total:.2f}x")
+
+    if not (embedding_ok and rerank_ok):
+        print("\n错误: ONNX后端与PyTorch输出不一致，请勿切换 INFERENCE_BACKEND")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+FAISS索引基准测试：对比 Flat / IVF / HNSW 各配置的 recall@k 与单查询延迟（p50/p99），
+以及 fp16 / PQ 压缩（不重打分与按 FAISS_RESCORE_FACTOR 全精度重打分）相对未压缩索引的召回损失
+
+用法：
+  python benchmark_vector_index.py                      # 使用 FAISS_INDEX_PATH 下的全精度向量
+  python benchmark_vector_index.py --synthetic 500000   # 使用随机合成向量
+"""
+import sys
+import os
+import argparse
+import time
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import numpy as np
+import faiss
+
+from config.config import config
+from services.index_builder import apply_search_params, build_index, choose_index_spec
+from services.vector_store import VectorStore
+
+
+def load_corpus(args, app_config):
+    """加载语料向量（真实索引的全精度向量或合成向量）"""
+    dimension = app_config.VECTOR_DIMENSION
+    if args.synthetic:
+        rng = np.random.default_rng(42)
+        vectors = rng.standard_normal((args.synthetic, dimension), dtype='float32')
+    else:
+        store = VectorStore(args.index_path or app_config.FAISS_INDEX_PATH, dimension)
+        raw = store.raw_vectors()
+        if len(raw) == 0:
+            print("错误: 未找到全精度向量文件，请先运行向量化任务或使用 --synthetic")
+            sys.exit(1)
+        # 复制到内存（归一化需要可写数组）
+        vectors = np.array(raw[:args.limit] if args.limit else raw, dtype='float32')
+    if args.limit:
+        vectors = vectors[:args.limit]
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_queries(vectors, count, seed=7):
+    """从语料中采样并加入噪声作为查询，模拟“相近但不完全相同”的真实查询"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), size=count, replace=False)].copy()
+    queries += rng.standard_normal(queries.shape, dtype='float32') * 0.05
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def search_rescored(index, query, k, vectors, factor):
+    """与 VectorStore 一致：多取 factor 倍候选，用全精度向量重新计算内积后取 top-k"""
+    _, candidates = index.search(query, k * factor)
+    candidates = candidates[0][candidates[0] >= 0]
+    order = np.argsort(-(vectors[candidates] @ query[0]))[:k]
+    found = np.full(k, -1, dtype='int64')
+    found[:len(order)] = candidates[order]
+    return found
+
+
+def measure(index, queries, ground_truth, k, vectors=None, rescore_factor=1):
+    """逐条查询测延迟，并计算 recall@k（传入全精度向量与 rescore_factor>1 时先重打分）"""
+    latencies = []
+    found = np.zeros((len(queries), k), dtype='int64')
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        if rescore_factor > 1:
+            found[i] = search_rescored(index, queries[i:i + 1], k, vectors, rescore_factor)
+        else:
+            _, ids = index.search(queries[i:i + 1], k)
+            found[i] = ids[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+    recall = np.mean([len(set(found[i]) & set(ground_truth[i])) / k for i in range(len(queries))])
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FAISS索引召回率与延迟基准测试')
+    parser.add_argument('--index-path', help='索引目录（默认 FAISS_INDEX_PATH）')
+    parser.add_argument('--synthetic', type=int, default=0, help='使用N条随机向量代替真实语料')
+    parser.add_argument('--limit', type=int, default=0, help='最多使用的语料向量数')
+    parser.add_argument('--queries', type=int, default=500, help='查询条数')
+    parser.add_argument('--k', type=int, default=10, help='recall@k 中的k')
+    parser.add_argument('--threads', type=int, default=0, help='FAISS线程数（0为默认）')
+    args = parser.parse_args()
+
+    app_config = config[os.environ.get('FLASK_ENV', 'development')]
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+
+    vectors = load_corpus(args, app_config)
+    ids = np.arange(len(vectors), dtype='int64')
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    dimension = vectors.shape[1]
+    print(f"语料: {len(vectors)} 条 × {dimension} 维，查询 {len(queries)} 条，k={args.k}")
+
+    # 精确检索作为基准答案
+    exact = build_index({'type': 'flat', 'dimension': dimension}, vectors, ids)
+    _, ground_truth = exact.search(queries, args.k)
+
+    settings = {key: getattr(app_config, key) for key in dir(app_config) if key.startswith('FAISS_')}
+    auto_spec = choose_index_spec(len(vectors), dimension, dict(settings, FAISS_INDEX_TYPE='auto'))
+    print(f"自动选型: {auto_spec}\n")
+
+    print(f"{'配置':<32}{'recall@k':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'构建(s)':>10}")
+    print('-' * 72)
+
+    recall, p50, p99 = measure(exact, queries, ground_truth, args.k)
+    print(f"{'flat':<32}{recall:>10.4f}{p50:>10.3f}{p99:>10.3f}{'-':>10}")
+
+    # 未压缩索引的召回率，作为压缩后召回损失的基准
+    baseline = {'flat': recall}
+
+    ivf_spec = choose_index_spec(len(vectors), dimension,
+                                 dict(settings, FAISS_INDEX_TYPE='ivf', FAISS_VECTOR_COMPRESSION='none'))
+    start = time.perf_counter()
+    ivf = build_index(ivf_spec, vectors, ids)
+    build_seconds = time.perf_counter() - start
+    for nprobe in sorted({1, 8, 16, 32, 64, 128, ivf_spec['nprobe']}):
+        if nprobe > ivf_spec['nlist']:
+            continue
+        apply_search_params(ivf, dict(ivf_spec, nprobe=nprobe))
+        recall, p50, p99 = measure(ivf, queries, ground_truth, args.k)
+        if nprobe == ivf_spec['nprobe']:
+            baseline['ivf'] = recall
+        label = f"ivf nlist={ivf_spec['nlist']} nprobe={nprobe}"
+        print(f"{label:<32}{recall:>10.4f}{p50:>10.3f}{p99:>10.3f}{build_seconds:>10.1f}")
+
+    hnsw_spec = choose_index_spec(len(vectors), dimension, dict(settings, FAISS_INDEX_TYPE='hnsw'))
+    start = time.perf_counter()
+    hnsw = build_index(hnsw_spec, vectors, ids)
+    build_seconds = time.perf_counter() - start
+    for ef_search in sorted({16, 32, 64, 128, 256, hnsw_spec['ef_search']}):
+        apply_search_params(hnsw, dict(hnsw_spec, ef_search=ef_search))
+        recall, p50, p99 = measure(hnsw, queries, ground_truth, args.k)
+        label = f"hnsw M={hnsw_spec['M']} efSearch={ef_search}"
+        print(f"{label:<32}{recall:>10.4f}{p50:>10.3f}{p99:>10.3f}{build_seconds:>10.1f}")
+
+    # 向量压缩：召回损失 = 同类型未压缩索引（默认检索参数）的召回率 - 压缩后的召回率
+    factor = int(settings.get('FAISS_RESCORE_FACTOR', 4))
+    print(f"\n{'压缩配置':<32}{'recall@k':>10}{'召回损失':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'构建(s)':>10}")
+    print('-' * 82)
+    for index_type in ('flat', 'ivf'):
+        for compression in ('fp16', 'pq'):
+            spec = choose_index_spec(len(vectors), dimension,
+                                     dict(settings, FAISS_INDEX_TYPE=index_type, FAISS_VECTOR_COMPRESSION=compression))
+            if spec['compression'] != compression:
+                print(f"{index_type + '+' + compression:<32}语料过少，选型退化为 {spec['compression']}，跳过")
+                continue
+            start = time.perf_counter()
+            index = build_index(spec, vectors, ids)
+            build_seconds = time.perf_counter() - start
+            for rescore in (1, factor):
+                recall, p50, p99 = measure(index, queries, ground_truth, args.k, vectors, rescore)
+                label = f"{index_type}+{compression}" + (f" 重打分x{rescore}" if rescore > 1 else '')
+                loss = baseline[index_type] - recall
+                print(f"{label:<32}{recall:>10.4f}{loss:>10.4f}{p50:>10.3f}{p99:>10.3f}{build_seconds:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
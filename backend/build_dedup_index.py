@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""为数据库中已有文档计算SimHash指纹并写入近重复索引，同时导入已记录的近重复链接（新文档在抓取时增量写入）"""
+import sys
+import os
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import importlib.util
+
+# 动态导入 app.py 中的 create_app
+app_path = os.path.join(backend_dir, 'app.py')
+spec = importlib.util.spec_from_file_location("app_module", app_path)
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+create_app = app_module.create_app
+from models.database import db
+from models.document import Document
+from services.dedup import fingerprint, get_near_duplicate_index
+
+BATCH_SIZE = 500
+
+def build_dedup_index():
+    """按主键游标分批读取文档并写入近重复索引"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            dedup_index = get_near_duplicate_index(app.config['NEAR_DUPLICATE_INDEX_PATH'],
+                                                   app.config['NEAR_DUPLICATE_MAX_DISTANCE'])
+            max_chars = app.config['NEAR_DUPLICATE_TEXT_CHARS']
+            print(f"开始构建近重复索引: {dedup_index.db_path}")
+
+            last_id = 0
+            total = 0
+            links = 0
+            while True:
+                rows = db.session.query(
+                    Document.id, Document.title, Document.content, Document.extra_metadata
+                ).filter(Document.id > last_id).order_by(Document.id).limit(BATCH_SIZE).all()
+                if not rows:
+                    break
+                total += dedup_index.add(
+                    (row.id, fingerprint(row.title, row.content, max_chars)) for row in rows
+                )
+                links += dedup_index.add_links(
+                    (item.get('source_name'), item.get('url'), row.id)
+                    for row in rows for item in (row.extra_metadata or {}).get('duplicates', [])
+                    if item.get('source_name')
+                )
+                last_id = rows[-1].id
+                print(f"  已索引 {total} 篇文档（ID <= {last_id}）")
+
+            print(f"\n构建完成，共写入 {total} 个指纹（过短的文档不计算指纹），{links} 个近重复链接")
+
+        except Exception as e:
+            print(f"\n错误: 构建近重复索引失败 - {e}")
+            import traceback
+            traceback.print_exc()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    build_dedup_index()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""为数据库中已有文档重建关键词倒排索引（新文档在抓取时增量索引）"""
+import sys
+import os
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import importlib.util
+
+# 动态导入 app.py 中的 create_app
+app_path = os.path.join(backend_dir, 'app.py')
+spec = importlib.util.spec_from_file_location("app_module", app_path)
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+create_app = app_module.create_app
+from models.database import db
+from models.document import Document
+from services.shards import ShardLayout, index_keywords
+
+BATCH_SIZE = 500
+
+def build_keyword_index():
+    """按主键游标分批读取文档并写入关键词索引"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            layout = ShardLayout(app.config)
+            print(f"开始构建关键词索引: {layout.keyword_path}（分片方式: {layout.partition}）")
+
+            last_id = 0
+            total = 0
+            while True:
+                rows = db.session.query(
+                    Document.id, Document.title, Document.content, Document.summary,
+                    Document.source_type, Document.source_name, Document.created_at
+                ).filter(Document.id > last_id).order_by(Document.id).limit(BATCH_SIZE).all()
+                if not rows:
+                    break
+                total += index_keywords(app.config, rows)
+                last_id = rows[-1].id
+                print(f"  已索引 {total} 篇文档（ID <= {last_id}）")
+
+            print(f"\n构建完成，共索引 {total} 篇文档")
+
+        except Exception as e:
+            print(f"\n错误: 构建关键词索引失败 - {e}")
+            import traceback
+            traceback.print_exc()
+            sys.exit(1)
+
+if __name__ == '__main__':
+    build_keyword_index()
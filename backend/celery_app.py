@@ -26,6 +26,10 @@ def make_celery(app=None):
                 'task': 'services.tasks.fetch_all_data_sources',
                 'schedule': 30.0,  # 每30秒检查一次
             },
+            'vectorize-documents': {
+                'task': 'services.tasks.vectorize_documents',
+                'schedule': 60.0,  # 每60秒增量向量化一次
+            },
         },
     )
     
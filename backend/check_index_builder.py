@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+索引选型检查：小语料下 choose_index_spec 不会选出无法训练的IVF/PQ规格，
+并且按选出的规格能在随机向量上实际构建与检索（含强制指定 FAISS_INDEX_TYPE=ivf）。
+
+用法：
+  python check_index_builder.py
+"""
+import sys
+import os
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import numpy as np
+
+from services.index_builder import build_index, choose_index_spec, needs_rebuild
+
+DIMENSION = 96
+# 覆盖：不足一个聚类中心、不足默认 nlist、不足PQ码本、正常规模
+CORPUS_SIZES = [1, 10, 38, 39, 100, 255, 1000, 5000]
+CONFIGS = [
+    {'FAISS_INDEX_TYPE': 'ivf'},
+    {'FAISS_INDEX_TYPE': 'ivf', 'FAISS_VECTOR_COMPRESSION': 'pq', 'FAISS_PQ_M': 12},
+    {'FAISS_INDEX_TYPE': 'flat', 'FAISS_VECTOR_COMPRESSION': 'pq', 'FAISS_PQ_M': 12},
+    {'FAISS_INDEX_TYPE': 'auto', 'FAISS_VECTOR_COMPRESSION': 'fp16'},
+]
+
+
+def check(condition, message):
+    if not condition:
+        print(f"  失败: {message}")
+        sys.exit(1)
+    print(f"  通过: {message}")
+
+
+def random_vectors(n, seed=7):
+    vectors = np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def check_config(config):
+    print(f"配置 {config}")
+    for ntotal in CORPUS_SIZES:
+        spec = choose_index_spec(ntotal, DIMENSION, config)
+        if spec['type'] == 'ivf':
+            check(39 * spec['nlist'] <= ntotal and 1 <= spec['nprobe'] <= spec['nlist'],
+                  f"{ntotal} 条: IVF nlist={spec['nlist']} nprobe={spec['nprobe']} 可训练")
+        if spec['compression'] == 'pq':
+            check(ntotal >= max(256, spec.get('nlist', 0)), f"{ntotal} 条: PQ 码本可训练")
+
+        vectors = random_vectors(ntotal)
+        ids = np.arange(ntotal, dtype='int64')
+        index = build_index(spec, vectors, ids)
+        _, found = index.search(vectors[:1], min(5, ntotal))
+        check(index.ntotal == ntotal and found[0][0] >= 0,
+              f"{ntotal} 条: 构建 {spec['type']}/{spec['compression']} 并检索成功")
+        check(not needs_rebuild(spec, ntotal, DIMENSION, config), f"{ntotal} 条: 构建后不再触发重建")
+
+
+def main():
+    for config in CONFIGS:
+        check_config(config)
+        print()
+    print("全部检查通过")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+RAG流式问答检查：启动本地模拟 Ollama 服务（/api/generate 按行返回JSON），验证
+  1. OllamaClient.stream_generate 逐块产出文本，模型报错与无法解析的数据都抛出 RuntimeError
+  2. /api/query/answer 的事件顺序为 sources、token…、done；生成失败时为 sources、token…、error
+检索与回表替换为固定的参考文档，只检查流式生成链路，不依赖向量索引与业务数据库。
+
+用法：
+  python check_rag_stream.py
+"""
+import sys
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+import importlib.util
+
+# 动态导入 app.py 中的 create_app
+app_path = os.path.join(backend_dir, 'app.py')
+spec = importlib.util.spec_from_file_location("app_module", app_path)
+app_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app_module)
+create_app = app_module.create_app
+
+from flask_jwt_extended import create_access_token
+
+from models.database import db
+from services.llm import OllamaClient
+
+TOKENS = ['根据参考资料，', '今天北京', '晴。[1]']
+STREAM_OK = [json.dumps({'response': token, 'done': False}, ensure_ascii=False) for token in TOKENS] + \
+            [json.dumps({'response': '', 'done': True})]
+STREAM_MALFORMED = STREAM_OK[:1] + ['{"response": "截断']
+STREAM_MODEL_ERROR = [json.dumps({'error': "model 'qwen2.5:3b' not found"})]
+
+SOURCE = {
+    'id': 1, 'title': '北京天气', 'summary': '今天北京晴。', 'source_type': 'rss', 'source_name': '测试源',
+    'source_url': 'http://example.com/1', 'tags': [], 'created_at': None, 'score': 1.0,
+    'matched_chunk': '今天北京晴，最高气温25度。'
+}
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    """按 server.lines 逐行返回（HTTP/1.0，连接关闭即流结束）"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.server.requests.append(json.loads(self.rfile.read(length) or b'{}'))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for line in self.server.lines:
+            self.wfile.write(line.encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_ollama():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOllamaHandler)
+    server.lines = STREAM_OK
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_events(body):
+    """解析 server-sent events，返回 [(event, data)]"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        events.append((fields.get('event'), json.loads(fields.get('data', 'null'))))
+    return events
+
+
+def check(condition, message):
+    if not condition:
+        print(f"  失败: {message}")
+        sys.exit(1)
+    print(f"  通过: {message}")
+
+
+def check_client(server, base_url):
+    print("OllamaClient.stream_generate")
+    client = OllamaClient(base_url=base_url)
+
+    server.lines = STREAM_OK
+    check(list(client.stream_generate('问题')) == TOKENS, "逐块产出全部文本片段")
+    check(server.requests[-1].get('stream') is True, "请求体 stream=True")
+
+    for lines, name in ((STREAM_MALFORMED, '无法解析的数据'), (STREAM_MODEL_ERROR, '模型报错')):
+        server.lines = lines
+        received = []
+        try:
+            for token in client.stream_generate('问题'):
+                received.append(token)
+            raised = None
+        except Exception as e:
+            raised = e
+        check(isinstance(raised, RuntimeError), f"{name}时抛出 RuntimeError（已产出 {len(received)} 个片段）")
+
+
+def check_answer_endpoint(server, base_url):
+    print("/api/query/answer 事件顺序")
+    app = create_app('testing')
+    app.config['OLLAMA_BASE_URL'] = base_url
+    app.config['QUERY_METRICS_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        token = create_access_token(identity='1')
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    engine = mock.Mock()
+    engine.search.return_value = [{'doc_id': 1, 'score': 1.0}]
+    with mock.patch('app.routes.query.get_search_engine', return_value=engine), \
+            mock.patch('app.routes.query._hydrate_results', return_value=[SOURCE]):
+        server.lines = STREAM_OK
+        response = client.post('/api/query/answer', json={'query': '北京天气'}, headers=headers)
+        check(response.status_code == 200 and response.mimetype == 'text/event-stream',
+              f"返回 text/event-stream（状态码 {response.status_code}）")
+        events = parse_events(response.get_data(as_text=True))
+        names = [name for name, _ in events]
+        check(names == ['sources'] + ['token'] * len(TOKENS) + ['done'], f"事件顺序 {names}")
+        check(events[0][1]['sources'][0]['title'] == SOURCE['title'], "sources 事件包含参考文档")
+        check(''.join(data['text'] for name, data in events if name == 'token') == ''.join(TOKENS),
+              "token 事件拼接为完整回答")
+        check(events[-1][1]['answer_available'] is True, "done 事件 answer_available=True")
+
+        server.lines = STREAM_MALFORMED
+        response = client.post('/api/query/answer', json={'query': '北京天气'}, headers=headers)
+        names = [name for name, _ in parse_events(response.get_data(as_text=True))]
+        check(names == ['sources', 'token', 'error'], f"生成中断时事件顺序 {names}")
+
+
+def main():
+    server = start_mock_ollama()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"模拟Ollama: {base_url}\n")
+    try:
+        check_client(server, base_url)
+        print()
+        check_answer_endpoint(server, base_url)
+    finally:
+        server.shutdown()
+    print("\n全部检查通过")
+
+
+if __name__ == '__main__':
+    main()
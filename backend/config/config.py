@@ -40,10 +40,104 @@ class Config:
     OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL') or 'qwen2.5:3b'
     EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL') or 'all-MiniLM-L6-v2'
     RERANK_MODEL = os.environ.get('RERANK_MODEL') or 'ms-marco-MiniLM-L-6-v2'
+    INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND') or 'torch'  # torch/onnx（嵌入与重排模型共用）
+    ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR') or './data/onnx_models'  # export_onnx_models.py 的导出目录
+    ONNX_QUANTIZED = os.environ.get('ONNX_QUANTIZED', 'true').lower() in ['true', 'on', '1']  # 使用int8量化模型
+    ONNX_NUM_THREADS = int(os.environ.get('ONNX_NUM_THREADS') or 0)  # 每个推理会话的线程数（0为默认）
     
     # FAISS配置
     FAISS_INDEX_PATH = os.environ.get('FAISS_INDEX_PATH') or './data/faiss_index'
     VECTOR_DIMENSION = 384  # all-MiniLM-L6-v2的维度
+    FAISS_USE_MMAP = os.environ.get('FAISS_USE_MMAP', 'true').lower() in ['true', 'on', '1']  # 只读加载时内存映射：精确索引直接检索 vectors.f32，IVF映射倒排表
+    FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE') or 'auto'  # auto/flat/ivf/hnsw
+    FAISS_IVF_THRESHOLD = 200000  # 向量数达到该值后由精确检索切换为IVF
+    FAISS_HNSW_THRESHOLD = 2000000  # 向量数达到该值后切换为HNSW
+    FAISS_IVF_NPROBE = None  # IVF检索的倒排桶数（None为按nlist自动设置）
+    FAISS_HNSW_M = 32
+    FAISS_HNSW_EF_CONSTRUCTION = 200
+    FAISS_HNSW_EF_SEARCH = 64
+    FAISS_VECTOR_COMPRESSION = os.environ.get('FAISS_VECTOR_COMPRESSION') or 'none'  # none/fp16/pq
+    FAISS_PQ_M = 48  # PQ子空间数（每向量编码字节数），需整除VECTOR_DIMENSION
+    FAISS_RESCORE_FACTOR = 4  # 压缩索引多取候选的倍数，候选用全精度向量重打分
+    FAISS_FILTER_BRUTE_FORCE_MAX = 50000  # 过滤后候选分块不超过该数量时直接对全精度向量精确检索
+    FAISS_KEEP_VERSIONS = 3  # 保留的索引版本数（每次发布新版本后清理更早的版本）
+    
+    # 增量向量化配置
+    VECTORIZE_BATCH_SIZE = int(os.environ.get('VECTORIZE_BATCH_SIZE') or 512)  # 每批从数据库读取的文档数
+    EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE') or 64)  # 模型前向计算的批大小
+    VECTORIZE_MAX_BATCHES = int(os.environ.get('VECTORIZE_MAX_BATCHES') or 20)  # 单次任务最多处理的批数
+    VECTORIZE_SAVE_EVERY = int(os.environ.get('VECTORIZE_SAVE_EVERY') or 5)  # 每N批持久化一次索引
+    CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE') or 500)  # 分块最大字符数
+    CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP') or 50)  # 相邻分块重叠字符数
+    EMBEDDING_POOL_PROCESSES = int(os.environ.get('EMBEDDING_POOL_PROCESSES') or 1)  # 向量化进程数（1为进程内编码，不使用进程池；0为CPU核数）
+    EMBEDDING_POOL_SHARD_SIZE = 256  # 每个进程一次编码的文本数
+    EMBEDDING_POOL_MAX_PENDING = 0  # 在途分片上限（0为进程数的2倍），超过时阻塞读取新批次
+    VECTORIZE_PIPELINE_DEPTH = 2  # 同时在编码中的批次数
+    
+    # 关键词索引配置（jieba分词 + BM25）
+    KEYWORD_INDEX_PATH = os.environ.get('KEYWORD_INDEX_PATH') or './data/keyword_index.db'
+    RRF_K = 60  # 倒数排名融合常数
+    HYBRID_FUSION_DEPTH = 50  # 混合检索时每一路参与融合的候选数
+    
+    # 索引分片配置（按时间窗口切分向量与关键词索引）
+    SEARCH_SHARD_BY = os.environ.get('SEARCH_SHARD_BY') or 'none'  # none/month
+    SEARCH_REMOTE_SHARDS = os.environ.get('SEARCH_REMOTE_SHARDS')  # 远程分片，如 '202301=http://10.0.0.2:5101,202302=http://10.0.0.2:5101'
+    SEARCH_SHARD_TOKEN = os.environ.get('SEARCH_SHARD_TOKEN')  # 分片服务的访问令牌（X-Shard-Token）
+    SEARCH_SHARD_TIMEOUT = 2.0  # 单个分片检索超时（秒），超时的分片被忽略
+    SEARCH_SHARD_FANOUT_WORKERS = 8  # 分片扇出线程数
+    
+    # 重排配置（交叉编码器）
+    RERANK_ENABLED = os.environ.get('RERANK_ENABLED', 'true').lower() in ['true', 'on', '1']
+    RERANK_TOP_N = int(os.environ.get('RERANK_TOP_N') or 30)  # 参与重排的候选数
+    RERANK_LATENCY_BUDGET_MS = float(os.environ.get('RERANK_LATENCY_BUDGET_MS') or 300)  # 单次重排延迟预算
+    RERANK_CACHE_SIZE = 10000  # (查询, 分块) → 得分 缓存条数
+    RERANK_CACHE_TTL = 3600  # 得分缓存有效期（秒）
+    
+    # 查询缓存配置（进程内LRU + Redis）
+    QUERY_CACHE_ENABLED = os.environ.get('QUERY_CACHE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    QUERY_CACHE_USE_REDIS = True  # 使用 REDIS_URL 在多个worker间共享缓存
+    QUERY_CACHE_SIZE = 1024  # 每级进程内缓存条数
+    QUERY_EMBEDDING_CACHE_TTL = 86400  # 查询向量缓存有效期（秒）
+    QUERY_RESULT_CACHE_TTL = 600  # 检索结果缓存有效期（秒），索引更新时按代数自动失效
+    
+    # 查询分阶段耗时统计（embed/ann/bm25/rerank/hydrate/llm）
+    QUERY_METRICS_ENABLED = os.environ.get('QUERY_METRICS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    QUERY_METRICS_RETENTION = 7 * 86400  # 耗时样本保留时长（秒）
+    QUERY_METRICS_MAX_SAMPLES = 200000  # 样本条数上限（每条约60字节）
+    
+    # 近重复检测配置（SimHash）
+    NEAR_DUPLICATE_ENABLED = os.environ.get('NEAR_DUPLICATE_ENABLED', 'true').lower() in ['true', 'on', '1']
+    NEAR_DUPLICATE_INDEX_PATH = os.environ.get('NEAR_DUPLICATE_INDEX_PATH') or './data/near_duplicate.db'
+    NEAR_DUPLICATE_MAX_DISTANCE = 3  # 指纹汉明距离不超过该值视为近重复
+    NEAR_DUPLICATE_TEXT_CHARS = 2000  # 参与指纹计算的正文字符数
+    NEAR_DUPLICATE_ACTION = os.environ.get('NEAR_DUPLICATE_ACTION') or 'link'  # link: 记录到原文档; skip: 直接丢弃
+    
+    # 网页抓取配置（列表页详情并发下载）
+    CRAWL_CONCURRENCY = int(os.environ.get('CRAWL_CONCURRENCY') or 16)  # 全局同时在途的请求数
+    CRAWL_HOST_CONCURRENCY = 4  # 同一主机同时在途的请求数
+    CRAWL_HOST_INTERVAL = float(os.environ.get('CRAWL_HOST_INTERVAL') or 0.25)  # 同一主机相邻请求的最小间隔（秒），所有抓取器共用；Crawl-delay 更大时以其为准
+    CRAWL_TIMEOUT = 30  # 单页请求超时（秒）
+    CRAWL_HOST_BURST = 2  # 按主机令牌桶容量（允许的突发请求数）
+    CRAWL_RATE_MAX_WAIT = 5.0  # 异步抓取引擎中令牌桶等待超过该值（秒）时跳过该页面
+    CRAWL_RATE_INLINE_WAIT = 1.0  # 同步抓取器原地等待令牌的上限（秒），超过时任务改期执行，不占用worker空等
+    CRAWL_MAX_DEFERRALS = 20  # 因主机限速连续改期的次数上限（不计入失败重试次数），超过后等待下一轮调度
+    CRAWL_PENDING_TTL = 900  # 数据源排队/改期标记的有效期（秒），worker异常退出未清除时到期失效
+    ROBOTS_CACHE_TTL = int(os.environ.get('ROBOTS_CACHE_TTL') or 3600)  # robots.txt 缓存有效期（秒，进程内 + Redis）
+    ROBOTS_ERROR_TTL = 300  # robots.txt 下载失败时（按允许处理）的缓存有效期（秒）
+    HTML_PARSER = os.environ.get('HTML_PARSER') or 'bs4'  # HTML解析后端: bs4 / lxml / selectolax（未安装时回退到bs4；切换前先用 benchmark_html_parser.py 确认提取一致率）
+    
+    # 共享HTTP客户端配置（每个worker进程一个连接池，抓取与Ollama调用共用）
+    HTTP_CLIENT_TIMEOUT = 30  # 默认请求超时（秒）
+    HTTP_CLIENT_HTTP2 = os.environ.get('HTTP_CLIENT_HTTP2', 'true').lower() in ['true', 'on', '1']  # 对支持的HTTPS站点使用HTTP/2（需安装h2）
+    HTTP_POOL_MAX_CONNECTIONS = int(os.environ.get('HTTP_POOL_MAX_CONNECTIONS') or 100)  # 进程内同时打开的连接上限
+    HTTP_POOL_MAX_KEEPALIVE = int(os.environ.get('HTTP_POOL_MAX_KEEPALIVE') or 32)  # 空闲时保持的keep-alive连接数
+    HTTP_POOL_KEEPALIVE_EXPIRY = 90  # 空闲连接保持时长（秒），同一轮调度中抓取同一站点的任务可复用连接
+    FETCH_MAX_BYTES = int(os.environ.get('FETCH_MAX_BYTES') or 5 * 1024 * 1024)  # 单个网页/订阅源解压后的最大字节数，超过即中止下载
+    
+    # RAG问答配置
+    RAG_CONTEXT_DOCS = int(os.environ.get('RAG_CONTEXT_DOCS') or 5)  # 作为参考资料的文档数
+    RAG_CONTEXT_CHARS = 1000  # 每篇参考资料最多截取的字符数
+    RAG_STREAM_READ_TIMEOUT = 60  # 等待Ollama下一个数据块的最长时间（秒）
     
     # 文件上传配置
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or './uploads'
@@ -55,6 +149,8 @@ class Config:
     # 搜索配置
     SEARCH_RESULTS_LIMIT = 10
     SIMILARITY_THRESHOLD = 0.7
+    SEARCH_CURSOR_DEPTH = 100  # 首次查询排序并缓存的候选数（可翻页的结果上限）
+    SEARCH_CURSOR_TTL = 900  # 分页游标有效期（秒）
 
 class DevelopmentConfig(Config):
     """开发环境配置"""
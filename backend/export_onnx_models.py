@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+导出嵌入模型（EMBEDDING_MODEL）与重排模型（RERANK_MODEL）为ONNX，并做int8动态量化。
+导出后设置 INFERENCE_BACKEND=onnx 即可切换推理后端。
+
+用法：
+  python export_onnx_models.py                 # 导出两个模型到 ONNX_MODEL_DIR
+  python export_onnx_models.py --only embedding
+"""
+import sys
+import os
+import argparse
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from config.config import config
+from services.onnx_backend import export_model, onnx_model_dir
+
+
+def hub_name(model_name: str, organization: str) -> str:
+    """与 sentence-transformers 一致：不带组织名的模型发布在对应组织下"""
+    return model_name if '/' in model_name else f'{organization}/{model_name}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出并量化ONNX推理模型')
+    parser.add_argument('--only', choices=['embedding', 'rerank'], help='只导出其中一个模型')
+    parser.add_argument('--no-quantize', action='store_true', help='不生成int8量化模型')
+    parser.add_argument('--output', help='导出根目录（默认 ONNX_MODEL_DIR）')
+    args = parser.parse_args()
+
+    app_config = config[os.environ.get('FLASK_ENV', 'development')]
+    root = args.output or app_config.ONNX_MODEL_DIR
+
+    try:
+        if args.only in (None, 'embedding'):
+            name = app_config.EMBEDDING_MODEL
+            output_dir = onnx_model_dir(root, name)
+            print(f"导出嵌入模型: {name} -> {output_dir}")
+            export_model(hub_name(name, 'sentence-transformers'), output_dir, quantize=not args.no_quantize)
+
+        if args.only in (None, 'rerank'):
+            name = hub_name(app_config.RERANK_MODEL, 'cross-encoder')
+            output_dir = onnx_model_dir(root, name)
+            print(f"导出重排模型: {name} -> {output_dir}")
+            export_model(name, output_dir, cross_encoder=True, quantize=not args.no_quantize)
+
+        print("\n导出完成")
+    except Exception as e:
+        print(f"\n错误: 导出ONNX模型失败 - {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
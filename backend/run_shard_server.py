@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+启动索引分片服务：在本机加载指定的时间分片，供查询节点通过 SEARCH_REMOTE_SHARDS 远程检索。
+
+用法：
+  python run_shard_server.py --port 5101                        # 加载本机全部分片
+  python run_shard_server.py --port 5101 --shards 202301,202302 # 只加载指定分片
+生产环境可用 gunicorn 多worker运行（精确索引的全精度向量与IVF倒排表由各worker内存映射共享）。
+"""
+import sys
+import os
+import argparse
+
+# 添加项目路径
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+from config.config import config
+from services.shard_server import create_shard_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='索引分片服务')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5101)
+    parser.add_argument('--shards', help='逗号分隔的分片键（YYYYMM），默认加载本机全部分片')
+    args = parser.parse_args()
+
+    app_config = config[os.environ.get('FLASK_ENV', 'development')]
+    if getattr(app_config, 'SEARCH_SHARD_BY', 'none') == 'none':
+        print("错误: 分片服务需要 SEARCH_SHARD_BY=month")
+        sys.exit(1)
+    keys = [key.strip() for key in args.shards.split(',') if key.strip()] if args.shards else None
+    app = create_shard_app(app_config, keys)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
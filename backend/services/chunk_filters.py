@@ -0,0 +1,158 @@
+"""分块元数据过滤 - 与向量索引对齐的列式属性存储，用于检索前过滤"""
+import calendar
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def to_timestamp(value: Optional[datetime]) -> int:
+    """将（UTC naive）datetime 转为秒级时间戳，None 记为0"""
+    if value is None:
+        return 0
+    return calendar.timegm(value.utctimetuple())
+
+
+class ChunkAttributes:
+    """
+    分块属性列存（chunk_attrs.bin，与 chunks.bin / vectors.f32 按分块ID对齐）。
+
+    每个分块一条 13 字节记录 (source_type: uint8, source_name: uint32, created_at: int64)，
+    字符串属性编码为整数，字典保存在 chunk_attrs.json（编码0表示未知）。
+    过滤时对内存映射的属性列做向量化比较得到允许的分块ID集合，
+    同一过滤条件的结果按属性文件长度缓存，索引增长后自动重新计算。
+    """
+
+    FILE = 'chunk_attrs.bin'
+    DICT_FILE = 'chunk_attrs.json'
+    DTYPE = np.dtype([('source_type', 'u1'), ('source_name', '<u4'), ('created_at', '<i8')])
+    FIELDS = ('source_type', 'source_name')
+
+    def __init__(self, index_path: str, cache_size: int = 64):
+        self.index_path = index_path
+        self._codes: Dict[str, Dict[str, int]] = {}
+        self._codes_mtime: Optional[float] = None
+        self._records: Optional[np.ndarray] = None
+        self._allowed_cache = TTLCache(maxsize=cache_size, ttl=3600)
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.index_path, self.FILE)
+
+    @property
+    def dict_path(self) -> str:
+        return os.path.join(self.index_path, self.DICT_FILE)
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self.path) // self.DTYPE.itemsize
+        except OSError:
+            return 0
+
+    def _load_codes(self) -> Dict[str, Dict[str, int]]:
+        """读取属性字典（文件变化后重新加载）"""
+        try:
+            mtime = os.stat(self.dict_path).st_mtime
+        except OSError:
+            return {field: {} for field in self.FIELDS}
+        if mtime != self._codes_mtime:
+            with open(self.dict_path, 'r', encoding='utf-8') as f:
+                self._codes = json.load(f)
+            self._codes_mtime = mtime
+        return self._codes
+
+    def _encode(self, codes: Dict[str, Dict[str, int]], field: str, value: Optional[str]) -> int:
+        if not value:
+            return 0
+        mapping = codes.setdefault(field, {})
+        if value not in mapping:
+            mapping[value] = len(mapping) + 1
+        return mapping[value]
+
+    def write(self, chunk_ids: np.ndarray, attrs: Iterable[Tuple[str, str, Optional[datetime]]]):
+        """
+        按分块ID写入属性 (source_type, source_name, created_at)。
+        调用方需持有索引写锁；先写字典再写属性，读者不会遇到无法解码的编码。
+        """
+        codes = {field: dict(mapping) for field, mapping in self._load_codes().items()}
+        data = np.array([
+            (self._encode(codes, 'source_type', source_type),
+             self._encode(codes, 'source_name', source_name),
+             to_timestamp(created_at))
+            for source_type, source_name, created_at in attrs
+        ], dtype=self.DTYPE)
+        if len(data) == 0:
+            return
+
+        os.makedirs(self.index_path, exist_ok=True)
+        tmp_path = self.dict_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(codes, f, ensure_ascii=False)
+        os.replace(tmp_path, self.dict_path)
+
+        chunk_ids = np.asarray(chunk_ids, dtype='int64')
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        with open(self.path, mode) as f:
+            if np.all(np.diff(chunk_ids) == 1):
+                f.seek(int(chunk_ids[0]) * self.DTYPE.itemsize)
+                f.write(data.tobytes())
+            else:
+                for chunk_id, record in zip(chunk_ids, data):
+                    f.seek(int(chunk_id) * self.DTYPE.itemsize)
+                    f.write(record.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _mapped(self) -> np.ndarray:
+        """内存映射属性文件，文件增长后重新映射"""
+        count = len(self)
+        records = self._records
+        if records is None or len(records) != count:
+            with self._lock:
+                if count == 0:
+                    return np.zeros(0, dtype=self.DTYPE)
+                records = np.memmap(self.path, dtype=self.DTYPE, mode='r', shape=(count,))
+                self._records = records
+        return records
+
+    def allowed_ids(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """
+        根据过滤条件返回允许的分块ID（升序数组）；无过滤条件时返回None。
+        支持的条件：source_type、source_name（精确匹配）、start_time/end_time（datetime，闭区间）。
+        """
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        if not filters:
+            return None
+
+        records = self._mapped()
+        cache_key = (tuple(sorted((key, str(value)) for key, value in filters.items())), len(records))
+        cached = self._allowed_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        codes = self._load_codes()
+        mask = np.ones(len(records), dtype=bool)
+        for field in self.FIELDS:
+            if field in filters:
+                code = codes.get(field, {}).get(filters[field])
+                if code is None:
+                    mask[:] = False
+                    break
+                mask &= records[field] == code
+        if 'start_time' in filters:
+            mask &= records['created_at'] >= to_timestamp(filters['start_time'])
+        if 'end_time' in filters:
+            mask &= records['created_at'] <= to_timestamp(filters['end_time'])
+
+        allowed = np.flatnonzero(mask).astype('int64')
+        self._allowed_cache.set(cache_key, allowed)
+        return allowed
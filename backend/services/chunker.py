@@ -0,0 +1,149 @@
+"""文档分块 - 中文句子边界感知的流式分块器与紧凑的分块偏移存储"""
+import logging
+import os
+import re
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 句末标点（中英文）及其后紧跟的右引号/右括号
+_SENTENCE_END_RE = re.compile(r'[。！？!?；;…\n]+[”’"」』）)]*')
+
+
+def iter_sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """按句子边界切分，产出 (start, end) 字符偏移，跳过纯空白片段"""
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        end = match.end()
+        if text[start:end].strip():
+            yield start, end
+        start = end
+    if start < len(text) and text[start:].strip():
+        yield start, len(text)
+
+
+def iter_chunks(text: str, chunk_size: int = 500, overlap: int = 50) -> Iterator[Tuple[int, int]]:
+    """
+    流式分块，产出 (start, end) 字符偏移，不复制文本：
+      - 尽量在句子边界处切分，每块不超过 chunk_size 个字符
+      - 相邻块之间保留不超过 overlap 个字符的完整句子作为重叠
+      - 超长句子按 chunk_size 硬切分，硬切分处同样保留 overlap 重叠
+    """
+    if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+        raise ValueError('chunk_size 必须为正数，且 0 <= overlap < chunk_size')
+
+    current: List[Tuple[int, int]] = []
+
+    def flush() -> Iterator[Tuple[int, int]]:
+        chunk_start, chunk_end = current[0][0], current[-1][1]
+        yield chunk_start, chunk_end
+        # 保留末尾若干完整句子作为下一块的重叠部分
+        carry = []
+        for span in reversed(current):
+            if chunk_end - span[0] > overlap:
+                break
+            carry.insert(0, span)
+        if len(carry) == len(current):
+            carry = []
+        current[:] = carry
+
+    for start, end in iter_sentence_spans(text):
+        # 超长句子：先输出已累积的块，再硬切分
+        if end - start > chunk_size:
+            if current:
+                yield from flush()
+                current.clear()
+            step = chunk_size - overlap
+            while end - start > chunk_size:
+                yield start, start + chunk_size
+                start += step
+        if current and end - current[0][0] > chunk_size:
+            yield from flush()
+            # 重叠部分加上当前句子仍超长时放弃重叠
+            if current and end - current[0][0] > chunk_size:
+                current.clear()
+        current.append((start, end))
+
+    if current:
+        yield current[0][0], current[-1][1]
+
+
+class ChunkStore:
+    """
+    分块偏移的紧凑存储（chunks.bin，位于索引目录下）。
+
+    每个分块一条 12 字节的定长记录 (doc_id: int32, start: uint32, end: uint32)，
+    行号即分块ID（也是FAISS中的向量ID）。只追加写入，读取时内存映射，
+    百万级分块仅占十余MB；分块文本按需从 Document.content 切片获得。
+    """
+
+    FILE = 'chunks.bin'
+    DTYPE = np.dtype([('doc_id', '<i4'), ('start', '<u4'), ('end', '<u4')])
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._records: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.index_path, self.FILE)
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self.path) // self.DTYPE.itemsize
+        except OSError:
+            return 0
+
+    def append(self, doc_id: int, spans: Iterable[Tuple[int, int]]) -> np.ndarray:
+        """追加单个文档的分块，返回分配的分块ID"""
+        return self.append_many((doc_id, start, end) for start, end in spans)
+
+    def append_many(self, records: Iterable[Tuple[int, int, int]]) -> np.ndarray:
+        """
+        批量追加 (doc_id, start, end) 记录，返回分配的分块ID。
+        调用方需持有索引写锁；写入后 fsync，保证索引引用的分块ID一定已落盘。
+        """
+        data = np.array(list(records), dtype=self.DTYPE)
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            # 截掉上次崩溃可能留下的不完整记录
+            size = f.seek(0, os.SEEK_END)
+            remainder = size % self.DTYPE.itemsize
+            if remainder:
+                f.truncate(size - remainder)
+                size -= remainder
+                f.seek(size)
+            first_id = size // self.DTYPE.itemsize
+            f.write(data.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return np.arange(first_id, first_id + len(data), dtype='int64')
+
+    def _mapped(self, min_size: int) -> np.ndarray:
+        """内存映射分块文件，文件增长后重新映射"""
+        records = self._records
+        if records is None or len(records) < min_size:
+            with self._lock:
+                count = len(self)
+                if count == 0:
+                    return np.zeros(0, dtype=self.DTYPE)
+                records = np.memmap(self.path, dtype=self.DTYPE, mode='r', shape=(count,))
+                self._records = records
+        return records
+
+    def get(self, chunk_ids) -> np.ndarray:
+        """按分块ID读取记录（结构化数组，字段 doc_id/start/end）"""
+        chunk_ids = np.asarray(chunk_ids, dtype='int64')
+        if len(chunk_ids) == 0:
+            return np.zeros(0, dtype=self.DTYPE)
+        records = self._mapped(int(chunk_ids.max()) + 1)
+        return np.asarray(records[chunk_ids])
+
+
+def slice_chunk(content: Optional[str], start: int, end: int) -> str:
+    """从文档正文中切出分块文本"""
+    return (content or '')[start:end]
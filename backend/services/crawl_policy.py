@@ -0,0 +1,158 @@
+"""抓取策略缓存 - 按主机缓存 robots.txt 规则与 Crawl-delay（进程内 + Redis，多个worker共享）"""
+import json
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from services.cache import TTLCache
+from services.http_client import USER_AGENT, SharedHttpClient, get_http_client
+
+logger = logging.getLogger(__name__)
+
+# robots.txt 大小上限（与主流搜索引擎一致的 500KiB），超过时按下载失败处理
+ROBOTS_MAX_BYTES = 500 * 1024
+
+
+class CrawlPolicy:
+    """单个主机的抓取策略（解析后的 robots.txt）"""
+
+    def __init__(self, host: str, status: Optional[int], body: str = ''):
+        self.host = host
+        self.status = status
+        self._parser = RobotFileParser()
+        # 与 RobotFileParser.read 的约定一致：401/403 全部禁止，其他错误（含404）全部允许
+        if status in (401, 403):
+            self._parser.disallow_all = True
+        elif status is None or status >= 400:
+            self._parser.allow_all = True
+        else:
+            self._parser.parse(body.splitlines())
+
+    def can_fetch(self, url: str, user_agent: str = USER_AGENT) -> bool:
+        return self._parser.can_fetch(user_agent, url)
+
+    def crawl_delay(self, user_agent: str = USER_AGENT) -> float:
+        """robots.txt 声明的 Crawl-delay（秒），未声明时为0"""
+        try:
+            delay = self._parser.crawl_delay(user_agent)
+        except Exception:
+            delay = None
+        return float(delay) if delay else 0.0
+
+
+class CrawlPolicyCache:
+    """
+    robots.txt 缓存：
+      - 一级：进程内 host → 解析后的 CrawlPolicy（同一进程内不重复解析）
+      - 二级：Redis host → robots.txt 原文与状态码（所有worker共享，每个主机每 ttl 只下载一次）
+    下载失败（网络错误）按允许处理，但只缓存 error_ttl，尽快重试。
+    """
+
+    REDIS_PREFIX = 'news_rag:robots:'
+
+    def __init__(self, redis_client=None, ttl: float = 3600, error_ttl: float = 300,
+                 maxsize: int = 4096, timeout: float = 10, http_client: Optional[SharedHttpClient] = None):
+        self.redis = redis_client
+        self.http = http_client or get_http_client()
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis_hits = 0
+        self.downloads = 0
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    def policy(self, url: str) -> CrawlPolicy:
+        host = self.host_key(url)
+        policy = self.local.get(host)
+        if policy is not None:
+            return policy
+
+        entry = self._redis_get(host)
+        if entry is not None:
+            self.redis_hits += 1
+            ttl = self.ttl
+        else:
+            entry = self._download(host)
+            ttl = self.ttl if entry['status'] is not None else self.error_ttl
+            self._redis_set(host, entry, ttl)
+
+        policy = CrawlPolicy(host, entry['status'], entry['body'])
+        self.local.set(host, policy, ttl=ttl)
+        return policy
+
+    def can_fetch(self, url: str) -> bool:
+        return self.policy(url).can_fetch(url)
+
+    def crawl_delay(self, url: str) -> float:
+        return self.policy(url).crawl_delay()
+
+    def _download(self, host: str) -> Dict:
+        self.downloads += 1
+        try:
+            response, body = self.http.fetch_bounded(f"{host}/robots.txt", ROBOTS_MAX_BYTES, None,
+                                                     timeout=self.timeout)
+            return {'status': response.status_code, 'body': body.decode('utf-8', errors='replace')}
+        except Exception as e:
+            logger.warning(f"获取 {host}/robots.txt 失败: {e}，允许访问")
+            return {'status': None, 'body': ''}
+
+    def _redis_get(self, host: str) -> Optional[Dict]:
+        if self.redis is None:
+            return None
+        try:
+            data = self.redis.get(self.REDIS_PREFIX + host)
+        except Exception as e:
+            logger.warning(f"读取robots缓存失败: {e}")
+            return None
+        return json.loads(data) if data is not None else None
+
+    def _redis_set(self, host: str, entry: Dict, ttl: float):
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self.REDIS_PREFIX + host, json.dumps(entry), ex=int(ttl))
+        except Exception as e:
+            logger.warning(f"写入robots缓存失败: {e}")
+
+    def stats(self) -> Dict:
+        return dict(self.local.stats(), redis_hits=self.redis_hits, downloads=self.downloads)
+
+
+# ========== 进程内共享的抓取策略缓存 ==========
+_policy_cache: Optional[CrawlPolicyCache] = None
+_policy_cache_lock = threading.Lock()
+
+
+def get_crawl_policy_cache(config=None) -> CrawlPolicyCache:
+    """获取进程内共享的抓取策略缓存（首次调用时按配置连接Redis）"""
+    global _policy_cache
+    if _policy_cache is None:
+        with _policy_cache_lock:
+            if _policy_cache is None:
+                if config is None:
+                    # 抓取器可能在应用上下文之外创建，此时直接读取默认配置
+                    from config.config import Config
+                    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+                redis_client = None
+                redis_url = config.get('REDIS_URL')
+                if redis_url:
+                    try:
+                        import redis
+                        redis_client = redis.Redis.from_url(redis_url, socket_timeout=0.5,
+                                                            socket_connect_timeout=0.5)
+                    except Exception as e:
+                        logger.warning(f"初始化Redis robots缓存失败，仅使用进程内缓存: {e}")
+                _policy_cache = CrawlPolicyCache(
+                    redis_client,
+                    ttl=config.get('ROBOTS_CACHE_TTL', 3600),
+                    error_ttl=config.get('ROBOTS_ERROR_TTL', 300),
+                    http_client=get_http_client(config)
+                )
+    return _policy_cache
@@ -0,0 +1,227 @@
+"""近重复文章检测 - SimHash指纹 + 分段LSH索引，在入库前发现跨来源转载"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 计算指纹前去掉空白与标点，转载稿常见的排版差异不影响指纹
+_STRIP_RE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 终结函数（向量化），将滚动哈希打散为均匀的64位哈希"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xbf58476d1ce4e5b9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+
+def simhash(text: str, shingle: int = 4) -> int:
+    """
+    64位SimHash：对字符 n-gram（对中文比分词更稳定、也更快）逐位加权投票。
+    全部计算在 numpy 中完成，千字级文本约几十微秒。
+    """
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype='<u4').astype('uint64')
+    if len(codes) < shingle:
+        return 0
+    # n-gram 多项式哈希：h = c0*P^(n-1) + ... + c(n-1)，uint64 溢出即取模
+    hashes = np.zeros(len(codes) - shingle + 1, dtype='uint64')
+    for offset in range(shingle):
+        hashes = hashes * np.uint64(1000003) + codes[offset:offset + len(hashes)]
+    hashes = _mix64(hashes)
+
+    bits = np.unpackbits(hashes.view('uint8').reshape(-1, 8), axis=1, bitorder='little')
+    votes = bits.sum(axis=0, dtype='int64') * 2 > len(hashes)
+    return int.from_bytes(np.packbits(votes, bitorder='little').tobytes(), 'little')
+
+
+def fingerprint(title: Optional[str], content: Optional[str], max_chars: int = 2000,
+                min_chars: int = 50) -> Optional[int]:
+    """
+    文章指纹：标题 + 正文前 max_chars 个字符（转载稿的改动多在文末的来源、编辑署名）。
+    去标点后不足 min_chars 的短文本不计算指纹，避免短讯之间误判。
+    """
+    text = _STRIP_RE.sub('', f"{title or ''}{(content or '')[:max_chars]}").lower()
+    if len(text) < min_chars:
+        return None
+    return simhash(text)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _to_signed(value: int) -> int:
+    """SQLite 整数为有符号64位"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class NearDuplicateIndex:
+    """
+    SimHash 近重复索引（SQLite文件，WAL模式，多个抓取worker共享）。
+
+    汉明距离不超过 max_distance 的两个指纹，按鸽巢原理把64位切成 max_distance+1 段后
+    至少有一段完全相同。因此每段建一个B树索引，查询时各段精确匹配取候选、再校验汉明距离，
+    每次查询只是几次索引查找，不随语料规模线性增长。
+    duplicate_links 表记录判定为近重复、未单独入库的文章链接（按来源），
+    抓取器据此在下载前跳过，不再每轮重新下载、重新判定。
+    """
+
+    def __init__(self, db_path: str, max_distance: int = 3):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        widths = [64 // bands + (1 if i < 64 % bands else 0) for i in range(bands)]
+        self.bands: List[Tuple[int, int]] = []
+        shift = 0
+        for width in widths:
+            self.bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """每个线程一个连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            band_columns = ''.join(f', band{i} INTEGER NOT NULL' for i in range(len(self.bands)))
+            conn.execute(f'CREATE TABLE IF NOT EXISTS fingerprints '
+                         f'(doc_id INTEGER PRIMARY KEY, simhash INTEGER NOT NULL{band_columns})')
+            for i in range(len(self.bands)):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_fingerprints_band{i} ON fingerprints (band{i})')
+            conn.execute('CREATE TABLE IF NOT EXISTS duplicate_links (source_name TEXT NOT NULL, url TEXT NOT NULL, '
+                         'doc_id INTEGER, PRIMARY KEY (source_name, url))')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _band_values(self, value: int) -> List[int]:
+        return [(value >> shift) & mask for shift, mask in self.bands]
+
+    def find(self, value: Optional[int]) -> Optional[int]:
+        """返回与指纹近重复的已入库文档ID（取汉明距离最小者），没有则返回None"""
+        if value is None:
+            return None
+        where = ' OR '.join(f'band{i} = ?' for i in range(len(self.bands)))
+        rows = self.conn.execute(f'SELECT doc_id, simhash FROM fingerprints WHERE {where}',
+                                 self._band_values(value)).fetchall()
+        best_id, best_distance = None, self.max_distance + 1
+        for doc_id, stored in rows:
+            distance = hamming_distance(value, stored & _MASK64)
+            if distance < best_distance:
+                best_id, best_distance = doc_id, distance
+        return best_id
+
+    def add(self, entries: Iterable[Tuple[int, Optional[int]]]) -> int:
+        """写入 (doc_id, 指纹)，单个事务提交；指纹为None的条目跳过"""
+        rows = [(doc_id, _to_signed(value), *self._band_values(value))
+                for doc_id, value in entries if value is not None]
+        if not rows:
+            return 0
+        placeholders = ', '.join('?' * (2 + len(self.bands)))
+        with self.conn:
+            self.conn.executemany(f'INSERT OR REPLACE INTO fingerprints VALUES ({placeholders})', rows)
+        return len(rows)
+
+    def add_links(self, entries: Iterable[Tuple[str, str, Optional[int]]]) -> int:
+        """记录近重复文章的 (来源名称, 链接, 原文档ID)，已记录的链接忽略"""
+        rows = [(source_name, url, doc_id) for source_name, url, doc_id in entries if url]
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO duplicate_links VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def linked_urls(self, source_name: str) -> set:
+        """某来源已判定为近重复的文章链接"""
+        rows = self.conn.execute('SELECT url FROM duplicate_links WHERE source_name = ?', (source_name,)).fetchall()
+        return {row[0] for row in rows}
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class DuplicateChecker:
+    """
+    单次抓取任务内的近重复检查：先查持久化索引，再查本批次尚未提交的文档
+    （同一RSS里同一稿件的多个频道版本会在同一批次出现）。
+    """
+
+    def __init__(self, index: NearDuplicateIndex, max_chars: int = 2000):
+        self.index = index
+        self.max_chars = max_chars
+        self._pending: List[Tuple[int, object]] = []
+        self._pending_links: List[Tuple[str, str, object]] = []
+
+    def check(self, title: Optional[str], content: Optional[str]) -> Tuple[Optional[int], object]:
+        """
+        返回 (指纹, 重复对象)：重复对象为已入库文档ID或本批次的待提交文档，无重复时为None。
+        """
+        value = fingerprint(title, content, self.max_chars)
+        if value is None:
+            return None, None
+        duplicate = self.index.find(value)
+        if duplicate is not None:
+            return value, duplicate
+        for pending_value, pending_doc in self._pending:
+            if hamming_distance(value, pending_value) <= self.index.max_distance:
+                return value, pending_doc
+        return value, None
+
+    def remember(self, value: Optional[int], doc):
+        """记录本批次新增文档的指纹（提交后通过 commit_pending 写入索引）"""
+        if value is not None:
+            self._pending.append((value, doc))
+
+    def remember_link(self, source_name: str, url: str, duplicate):
+        """记录本批次判定为近重复的文章链接（duplicate 为原文档ID或待提交文档，提交后写入索引）"""
+        if url:
+            self._pending_links.append((source_name, url, duplicate))
+
+    def commit_pending(self) -> int:
+        """文档提交取得ID后写入持久化索引（失败不影响抓取结果）"""
+        try:
+            count = self.index.add((doc.id, value) for value, doc in self._pending if doc.id is not None)
+            self.index.add_links((source_name, url, getattr(duplicate, 'id', duplicate))
+                                 for source_name, url, duplicate in self._pending_links)
+        except Exception as e:
+            logger.error(f"更新近重复索引失败: {e}")
+            count = 0
+        self._pending = []
+        self._pending_links = []
+        return count
+
+
+# ========== 进程内共享的近重复索引 ==========
+_dedup_indexes = {}
+_dedup_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index(db_path: str, max_distance: int = 3) -> NearDuplicateIndex:
+    """获取进程内共享的近重复索引实例"""
+    index = _dedup_indexes.get(db_path)
+    if index is None:
+        with _dedup_index_lock:
+            index = _dedup_indexes.get(db_path)
+            if index is None:
+                index = NearDuplicateIndex(db_path, max_distance)
+                _dedup_indexes[db_path] = index
+    return index
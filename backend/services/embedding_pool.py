@@ -0,0 +1,180 @@
+"""多进程向量化 - 按CPU核数分片并行编码，工作进程以 spawn 方式启动并各自加载模型"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.embeddings import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内的模型实例（由 _init_worker 加载）
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, onnx_root: Optional[str], onnx_quantized: bool,
+                 threads: int):
+    """子进程初始化：限制每个进程的计算线程数（避免 进程数 × 线程数 超订CPU）后加载模型"""
+    global _worker_model
+    if backend != 'onnx':
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    service = EmbeddingService(model_name, backend=backend, onnx_root=onnx_root,
+                               onnx_quantized=onnx_quantized, num_threads=threads)
+    _worker_model = service.model
+
+
+def _encode_shard(texts: List[str], batch_size: int) -> np.ndarray:
+    vectors = _worker_model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+    return np.ascontiguousarray(vectors, dtype='float32')
+
+
+class PendingEncoding:
+    """一次异步编码的句柄，get() 按提交顺序拼接各分片结果"""
+
+    def __init__(self, parts: List, dimension: int, size: int, started: float, pool: 'EmbeddingPool'):
+        self._parts = parts
+        self._dimension = dimension
+        self._size = size
+        self._started = started
+        self._pool = pool
+
+    def get(self) -> np.ndarray:
+        if not self._parts:
+            return np.zeros((0, self._dimension), dtype='float32')
+        vectors = np.concatenate([part.get() for part in self._parts])
+        self._pool._record(self._size, time.perf_counter() - self._started)
+        return vectors
+
+
+class EmbeddingPool:
+    """
+    嵌入模型进程池：
+      - 使用 billiard（Celery 的 multiprocessing 分支，允许在 prefork 的守护子进程中再建子进程）
+        以 spawn 方式启动 processes 个工作进程，每个进程在初始化时各自加载模型。
+        不 fork 当前进程：Celery 子进程中已有模型的 OpenMP 线程池、Redis 连接与HTTP客户端的事件循环线程，
+        在多线程进程中 fork 可能死锁。代价是内存占用随进程数线性增长
+      - encode 将文本切成 shard_size 的分片分发到各进程，结果按原顺序拼接
+      - 在途分片数超过 max_pending 时提交阻塞（背压），上游不会无限读取待向量化文档
+    进程数按本机核数分给所有并发向量化的 Celery 子进程，默认不启用（EMBEDDING_POOL_PROCESSES=1）。
+    """
+
+    def __init__(self, service: EmbeddingService, processes: int = 0,
+                 shard_size: int = 256, max_pending: int = 0):
+        cpu_count = os.cpu_count() or 1
+        self.service = service
+        self.processes = processes or cpu_count
+        self.shard_size = shard_size
+        self.max_pending = max_pending or self.processes * 2
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._torch_threads = max(1, cpu_count // self.processes)
+
+        # 吞吐统计
+        self._texts = 0
+        self._seconds = 0.0
+        self._blocked_seconds = 0.0
+
+    @property
+    def dimension(self) -> int:
+        return self.service.dimension
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    import billiard
+                    service = self.service
+                    context = billiard.get_context('spawn')
+                    self._pool = context.Pool(self.processes, initializer=_init_worker,
+                                              initargs=(service.model_name, service.backend, service.onnx_root,
+                                                        service.onnx_quantized, self._torch_threads))
+                    logger.info(f"嵌入进程池已启动: {self.processes} 个进程，每进程 {self._torch_threads} 个线程")
+        return self._pool
+
+    def encode_async(self, texts: List[str], batch_size: int = 32) -> PendingEncoding:
+        """提交编码任务（进程池饱和时阻塞等待空位），返回 PendingEncoding"""
+        started = time.perf_counter()
+        if not texts:
+            return PendingEncoding([], self.dimension, 0, started, self)
+        pool = self._ensure_pool()
+        parts = []
+        for start in range(0, len(texts), self.shard_size):
+            wait_start = time.perf_counter()
+            self._slots.acquire()
+            self._blocked_seconds += time.perf_counter() - wait_start
+            release = lambda _: self._slots.release()
+            parts.append(pool.apply_async(_encode_shard, (texts[start:start + self.shard_size], batch_size),
+                                          callback=release, error_callback=release))
+        return PendingEncoding(parts, self.dimension, len(texts), started, self)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """同步编码，与 EmbeddingService.encode 接口一致"""
+        return self.encode_async(texts, batch_size).get()
+
+    def encode_query(self, query: str) -> np.ndarray:
+        # 单条查询走进程内模型，避免进程间传输的开销
+        return self.service.encode_query(query)
+
+    def _record(self, count: int, seconds: float):
+        self._texts += count
+        self._seconds += seconds
+
+    def stats(self) -> Dict:
+        return {
+            'processes': self.processes,
+            'max_pending': self.max_pending,
+            'texts': self._texts,
+            'texts_per_sec': round(self._texts / self._seconds, 2) if self._seconds else None,
+            'blocked_seconds': round(self._blocked_seconds, 3)
+        }
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+
+# ========== 进程内共享的嵌入进程池 ==========
+_embedding_pool: Optional[EmbeddingPool] = None
+_embedding_pool_lock = threading.Lock()
+
+
+def get_embedding_encoder(config):
+    """
+    获取批量向量化使用的编码器：EMBEDDING_POOL_PROCESSES 为1（默认）时直接使用进程内模型，
+    否则返回进程内共享的进程池（0表示按CPU核数）。
+    """
+    from services.embeddings import get_embedding_service
+
+    service = get_embedding_service(config['EMBEDDING_MODEL'], config)
+    processes = config.get('EMBEDDING_POOL_PROCESSES', 1)
+    if processes == 1:
+        return service
+
+    global _embedding_pool
+    if _embedding_pool is None:
+        with _embedding_pool_lock:
+            if _embedding_pool is None:
+                _embedding_pool = EmbeddingPool(
+                    service,
+                    processes=processes,
+                    shard_size=config.get('EMBEDDING_POOL_SHARD_SIZE', 256),
+                    max_pending=config.get('EMBEDDING_POOL_MAX_PENDING', 0)
+                )
+    return _embedding_pool
@@ -0,0 +1,101 @@
+"""文本向量化服务 - 基于 Sentence Transformers"""
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CompletedEncoding:
+    """已完成的编码结果（与进程池的异步句柄接口一致）"""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def get(self) -> np.ndarray:
+        return self.vectors
+
+
+class EmbeddingService:
+    """
+    文本嵌入模型封装（懒加载，输出L2归一化的float32向量）。
+    backend 为 torch（sentence-transformers）或 onnx（onnx_root 下导出的int8量化模型）。
+    """
+
+    def __init__(self, model_name: str, device: Optional[str] = None, backend: str = 'torch',
+                 onnx_root: Optional[str] = None, onnx_quantized: bool = True, num_threads: int = 0):
+        self.model_name = model_name
+        self.device = device
+        self.backend = backend
+        self.onnx_root = onnx_root
+        self.onnx_quantized = onnx_quantized
+        self.num_threads = num_threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """懒加载模型，避免在不需要向量化的进程中占用内存"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from services.onnx_backend import load_embedding_model
+                    logger.info(f"加载嵌入模型: {self.model_name}（{self.backend}）")
+                    self._model = load_embedding_model(
+                        self.model_name, self.backend, self.onnx_root,
+                        self.onnx_quantized, self.num_threads, self.device
+                    )
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """批量编码文本，返回形状为 (n, dim) 的归一化向量（内积即余弦相似度）"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype='float32')
+        vectors = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(vectors, dtype='float32')
+
+    def encode_async(self, texts: List[str], batch_size: int = 32) -> CompletedEncoding:
+        """进程内同步编码，返回与 EmbeddingPool.encode_async 相同形式的句柄"""
+        return CompletedEncoding(self.encode(texts, batch_size))
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """编码单条查询，返回形状为 (1, dim) 的向量"""
+        return self.encode([query], batch_size=1)
+
+
+# ========== 进程内共享的嵌入模型实例 ==========
+_embedding_services = {}
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_service(model_name: str, config=None) -> EmbeddingService:
+    """获取进程内共享的嵌入服务（同名模型、同一推理后端只加载一次）"""
+    config = config or {}
+    backend = config.get('INFERENCE_BACKEND', 'torch')
+    key = (model_name, backend)
+    service = _embedding_services.get(key)
+    if service is None:
+        with _embedding_lock:
+            service = _embedding_services.get(key)
+            if service is None:
+                service = EmbeddingService(
+                    model_name,
+                    backend=backend,
+                    onnx_root=config.get('ONNX_MODEL_DIR'),
+                    onnx_quantized=config.get('ONNX_QUANTIZED', True),
+                    num_threads=config.get('ONNX_NUM_THREADS', 0)
+                )
+                _embedding_services[key] = service
+    return service
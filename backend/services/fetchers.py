@@ -1,32 +1,82 @@
 """数据获取服务 - RSS、网页抓取、智能代理"""
 import feedparser
-import requests
-from bs4 import BeautifulSoup
-from urllib.robotparser import RobotFileParser
-from urllib.parse import urljoin, urlparse
-import time
+from urllib.parse import urljoin
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import re
 
+from services.crawl_engine import AsyncCrawler
+from services.crawl_policy import CrawlPolicyCache, get_crawl_policy_cache
+from services.html_parser import HtmlFeed, HtmlNode, extract_article, html_to_text
+from services.http_client import (DEFAULT_MAX_BYTES, FEED_CONTENT_TYPES, PAGE_CONTENT_TYPES, DownloadRejected,
+                                  SharedHttpClient, get_http_client)
+from services.rate_limiter import HostRateLimiter, RateLimited, get_rate_limiter
+
 logger = logging.getLogger(__name__)
 
+# DataSource.config 中保存上次响应校验器的键
+HTTP_VALIDATORS_KEY = 'http_validators'
+
+
+def conditional_headers(validators: Optional[Dict]) -> Dict:
+    """根据上次响应的校验器构造条件请求头（If-None-Match / If-Modified-Since）"""
+    validators = validators or {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def response_validators(response) -> Dict:
+    """提取响应中的校验器（ETag / Last-Modified），没有时返回空字典"""
+    validators = {}
+    if response.headers.get('ETag'):
+        validators['etag'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        validators['last_modified'] = response.headers['Last-Modified']
+    return validators
+
+
 class RSSFetcher:
-    """RSS订阅源获取器"""
+    """
+    RSS订阅源获取器。
+    fetch 传入上次保存的 validators 时发送条件请求；调用后 not_modified 表示源未变化（304，
+    未解析、返回空列表），validators 为本次响应的校验器，供调用方保存。
+    传入 known（提供 links / titles 两个集合的已入库条目）时，已知条目在任何网络请求之前
+    直接跳过（不返回），跳过的条数记录在 skipped_known。known 只在源有变化时才被访问，
+    调用方可以延迟载入。
+    订阅源与原始链接都流式下载，正文超过 max_bytes 或类型不符时中止传输。
+    """
     
-    def __init__(self, respect_robots=True, delay=1.0, fetch_full_content=True):
+    def __init__(self, respect_robots=True, fetch_full_content=True,
+                 policies: Optional[CrawlPolicyCache] = None, html_parser: Optional[str] = None,
+                 limiter: Optional[HostRateLimiter] = None, http_client: Optional[SharedHttpClient] = None,
+                 max_bytes: Optional[int] = None):
         self.respect_robots = respect_robots
-        self.delay = delay
         self.fetch_full_content = fetch_full_content
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (compatible; NewsRAG/1.0; +http://example.com/bot)'
-        })
+        # 单个响应解压后的最大字节数
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self.policies = policies or get_crawl_policy_cache()
+        self.limiter = limiter or get_rate_limiter()
+        # HTML解析后端（bs4 / lxml / selectolax），为空时使用配置项 HTML_PARSER
+        self.html_parser = html_parser
+        self.not_modified = False
+        self.validators: Dict = {}
+        self.skipped_known = 0
+        # 进程内共享的HTTP客户端（keep-alive 连接池），不再每个抓取器新建会话
+        self.http = http_client or get_http_client()
         # 使用WebFetcher来获取完整内容
-        self.web_fetcher = WebFetcher(respect_robots=respect_robots, delay=0.5) if fetch_full_content else None
+        self.web_fetcher = WebFetcher(respect_robots=respect_robots, policies=self.policies,
+                                      html_parser=html_parser, limiter=self.limiter,
+                                      http_client=self.http, max_bytes=self.max_bytes) if fetch_full_content else None
     
-    def fetch(self, url: str) -> List[Dict]:
-        """获取RSS源内容"""
+    def fetch(self, url: str, validators: Optional[Dict] = None, known=None) -> List[Dict]:
+        """获取RSS源内容（validators 为上次响应的 ETag / Last-Modified）"""
+        self.not_modified = False
+        self.validators = validators or {}
+        self.skipped_known = 0
         try:
             # 检查robots.txt
             if self.respect_robots:
@@ -34,18 +84,34 @@ class RSSFetcher:
                     logger.warning(f"RSS源 {url} 被robots.txt禁止访问")
                     return []
             
-            # 获取RSS内容
-            response = self.session.get(url, timeout=30)
+            # 获取RSS内容（条件请求，源未变化时服务器返回304且不带正文）
+            self._throttle(url)
+            response, body = self.http.fetch_bounded(url, self.max_bytes, FEED_CONTENT_TYPES,
+                                                     headers=conditional_headers(validators))
+            if response.status_code == 304:
+                self.not_modified = True
+                logger.info(f"RSS源 {url} 未变化（304），跳过解析")
+                return []
             response.raise_for_status()
+            self.validators = response_validators(response)
             
             # 解析RSS
-            feed = feedparser.parse(response.content)
+            feed = feedparser.parse(body)
             
             if feed.bozo:
                 logger.warning(f"RSS解析警告: {feed.bozo_exception}")
             
+            known_links = known.links if known is not None else set()
+            known_titles = known.titles if known is not None else set()
             articles = []
             for entry in feed.entries:
+                # 已入库的条目直接跳过：不清理HTML，也不访问原始链接
+                link = entry.get('link', '')
+                title = entry.get('title', '')
+                if (link and link in known_links) or (title and title in known_titles):
+                    self.skipped_known += 1
+                    continue
+                
                 # 首先尝试从RSS feed中获取内容
                 # 有些RSS源会在content字段中提供完整内容
                 content = ''
@@ -65,7 +131,6 @@ class RSSFetcher:
                     content = self._clean_html(content)
                 
                 # 如果内容太短（可能是摘要），且启用了完整内容获取，则访问原始链接
-                link = entry.get('link', '')
                 if self.fetch_full_content and link and len(content) < 500:
                     try:
                         logger.info(f"RSS内容较短，尝试从原始链接获取完整内容: {link}")
@@ -73,11 +138,14 @@ class RSSFetcher:
                         if full_content and len(full_content) > len(content):
                             content = full_content
                             logger.info(f"成功获取完整内容，长度: {len(content)}")
+                    except RateLimited as e:
+                        # 原文主机限速：该条目使用RSS摘要，不放弃本次已处理的条目
+                        logger.info(f"原始链接限速，使用RSS摘要: {e}")
                     except Exception as e:
                         logger.warning(f"获取完整内容失败，使用RSS摘要: {e}")
                 
                 article = {
-                    'title': entry.get('title', ''),
+                    'title': title,
                     'content': content,
                     'link': link,
                     'published': entry.get('published', '') or entry.get('updated', ''),
@@ -86,12 +154,15 @@ class RSSFetcher:
                 }
                 articles.append(article)
             
-            # 遵守爬虫规范：延迟
-            time.sleep(self.delay)
-            
-            logger.info(f"成功获取RSS源 {url}，共 {len(articles)} 篇文章")
+            logger.info(f"成功获取RSS源 {url}，共 {len(articles)} 篇新文章，跳过 {self.skipped_known} 篇已入库")
             return articles
             
+        except RateLimited:
+            # 主机限速需要等待较久：交给调用方改期，不占用worker空等
+            raise
+        except DownloadRejected as e:
+            logger.warning(f"RSS源 {url} 不是可解析的订阅源: {e}")
+            return []
         except Exception as e:
             logger.error(f"获取RSS源 {url} 失败: {e}")
             return []
@@ -104,6 +175,8 @@ class RSSFetcher:
         try:
             result = self.web_fetcher.fetch(url)
             return result.get('content', '')
+        except RateLimited:
+            raise
         except Exception as e:
             logger.warning(f"获取完整内容失败 {url}: {e}")
             return ''
@@ -111,53 +184,74 @@ class RSSFetcher:
     def _clean_html(self, html_content: str) -> str:
         """清理HTML标签，只保留纯文本"""
         try:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            # 移除脚本和样式
-            for script in soup(['script', 'style']):
-                script.decompose()
-            # 获取纯文本
-            text = soup.get_text(separator='\n', strip=True)
+            # 移除脚本和样式后获取纯文本
+            text = html_to_text(html_content, self.html_parser)
             # 清理多余空白
             text = re.sub(r'\n\s*\n', '\n\n', text)  # 多个换行合并为两个
             text = re.sub(r'[ \t]+', ' ', text)  # 多个空格合并为一个
             return text.strip()
         except Exception as e:
             logger.warning(f"清理HTML失败: {e}，返回原始内容")
-            # 如果BeautifulSoup失败，使用简单的正则表达式移除标签
+            # 如果HTML解析失败，使用简单的正则表达式移除标签
             text = re.sub(r'<[^>]+>', '', html_content)
             text = re.sub(r'\s+', ' ', text)
             return text.strip()
     
+    def _throttle(self, url: str):
+        """
+        请求前按主机令牌桶限速（主机的请求间隔由限速器统一确定，见 HostRateLimiter.interval_for）。
+        令牌可用时立即返回，只需等待不超过 CRAWL_RATE_INLINE_WAIT 时原地等待，
+        更长的等待不预约令牌、直接抛出 RateLimited 交给调用方改期，不占用worker空等。
+        """
+        self.limiter.wait(url)
+    
     def _check_robots(self, url: str) -> bool:
-        """检查robots.txt"""
+        """检查robots.txt（按主机缓存，多个worker共享）"""
         try:
-            parsed = urlparse(url)
-            robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
-            rp = RobotFileParser()
-            rp.set_url(robots_url)
-            rp.read()
-            return rp.can_fetch(self.session.headers['User-Agent'], url)
+            return self.policies.can_fetch(url)
         except Exception as e:
             logger.warning(f"检查robots.txt失败: {e}，允许访问")
             return True
 
 
 class WebFetcher:
-    """网页抓取器"""
+    """
+    网页抓取器。
+    fetch / fetch_list 传入 validators 时对单页或列表页发送条件请求，
+    not_modified 与 validators 的含义同 RSSFetcher。
+    fetch_list 传入 known 时，列表中已入库的详情页不再下载（计入 skipped_known）。
+    页面流式下载：响应类型不是HTML、内容为二进制或解压后超过 max_bytes 时立即中止传输；
+    使用 lxml 后端时边下载边解析，不在内存中保留原始HTML。
+    """
     
-    def __init__(self, respect_robots=True, delay=2.0):
+    def __init__(self, respect_robots=True, crawler: Optional[AsyncCrawler] = None,
+                 policies: Optional[CrawlPolicyCache] = None, html_parser: Optional[str] = None,
+                 limiter: Optional[HostRateLimiter] = None, http_client: Optional[SharedHttpClient] = None,
+                 max_bytes: Optional[int] = None):
         self.respect_robots = respect_robots
-        self.delay = delay
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (compatible; NewsRAG/1.0; +http://example.com/bot)'
-        })
+        # 单个页面解压后的最大字节数
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self.policies = policies or get_crawl_policy_cache()
+        self.limiter = limiter or get_rate_limiter()
+        # HTML解析后端（bs4 / lxml / selectolax），为空时使用配置项 HTML_PARSER
+        self.html_parser = html_parser
+        # 列表页的详情页通过异步引擎并发下载，由引擎按主机控制并发与间隔
+        # 进程内共享的HTTP客户端（keep-alive 连接池），不再每个抓取器新建会话
+        self.http = http_client or get_http_client()
+        self.crawler = crawler or AsyncCrawler(policies=self.policies if respect_robots else None,
+                                               http_client=self.http, max_bytes=self.max_bytes)
+        self.not_modified = False
+        self.validators: Dict = {}
+        self.skipped_known = 0
     
-    def fetch(self, url: str, config: Optional[Dict] = None) -> Dict:
+    def fetch(self, url: str, config: Optional[Dict] = None, validators: Optional[Dict] = None) -> Dict:
         """抓取单页内容（向后兼容：返回单篇文章字典）"""
-        return self._fetch_single(url, config)
+        self.not_modified = False
+        self.validators = validators or {}
+        return self._fetch_single(url, config, validators)
 
-    def fetch_list(self, url: str, config: Optional[Dict] = None) -> List[Dict]:
+    def fetch_list(self, url: str, config: Optional[Dict] = None,
+                   validators: Optional[Dict] = None, known=None) -> List[Dict]:
         """
         抓取列表页并遍历详情页：
         config 可选字段：
@@ -165,7 +259,11 @@ class WebFetcher:
           - link_selector: 列表内链接选择器，默认 'a'
           - max_links: 最大抓取链接数，默认 5
           - detail_config: 详情页选择器配置（同 fetch 的 config）
+        详情页由 AsyncCrawler 并发下载（按主机限制并发数与请求间隔），不再逐页等待。
         """
+        self.not_modified = False
+        self.validators = validators or {}
+        self.skipped_known = 0
         config = config or {}
         list_selector = config.get('list_selector')
         link_selector = config.get('link_selector', 'a')
@@ -181,18 +279,26 @@ class WebFetcher:
                 logger.warning(f"列表页 {url} 被robots.txt禁止访问")
                 return []
 
-            response = self.session.get(url, timeout=30)
+            self._throttle(url)
+            page = HtmlFeed(self.html_parser)
+            response, _ = self.http.fetch_bounded(url, self.max_bytes, PAGE_CONTENT_TYPES, sink=page.feed,
+                                                  headers=conditional_headers(validators))
+            if response.status_code == 304:
+                self.not_modified = True
+                logger.info(f"列表页 {url} 未变化（304），跳过解析")
+                return []
             response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'html.parser')
+            self.validators = response_validators(response)
+            root = page.close()
 
-            container = soup.select_one(list_selector)
-            if not container:
+            container = root.select_one(list_selector)
+            if container is None or container.empty():
                 logger.warning(f"列表页未找到容器 {list_selector}: {url}")
                 return []
 
             links = []
             for a in container.select(link_selector):
-                href = a.get('href')
+                href = a.attr('href')
                 if not href:
                     continue
                 full = urljoin(url, href)
@@ -202,19 +308,39 @@ class WebFetcher:
                 if len(links) >= max_links:
                     break
 
+            # 已入库的详情页不再下载
+            if known is not None:
+                new_links = [link for link in links if link not in known.links]
+                self.skipped_known = len(links) - len(new_links)
+                links = new_links
+
+            if self.respect_robots:
+                allowed = [link for link in links if self._check_robots(link)]
+                if len(allowed) < len(links):
+                    logger.warning(f"列表页 {url} 中 {len(links) - len(allowed)} 个链接被robots.txt禁止访问")
+                links = allowed
+
             articles: List[Dict] = []
-            for link in links:
-                art = self._fetch_single(link, detail_config)
+            for page in self.crawler.fetch_all(links):
+                if page['content'] is None:
+                    continue
+                art = self._parse_page(page['url'], page['content'], detail_config)
                 if art:
                     articles.append(art)
 
             return articles
+        except RateLimited:
+            raise
+        except DownloadRejected as e:
+            logger.warning(f"列表页 {url} 不是可解析的网页: {e}")
+            return []
         except Exception as e:
             logger.error(f"抓取列表页 {url} 失败: {e}")
             return []
 
-    def _fetch_single(self, url: str, config: Optional[Dict] = None) -> Dict:
-        """抓取单个详情页内容"""
+    def _fetch_single(self, url: str, config: Optional[Dict] = None,
+                      validators: Optional[Dict] = None) -> Dict:
+        """抓取单个详情页内容（传入 validators 时发送条件请求）"""
         try:
             # 检查robots.txt
             if self.respect_robots:
@@ -222,82 +348,66 @@ class WebFetcher:
                     logger.warning(f"网页 {url} 被robots.txt禁止访问")
                     return {}
             
-            # 获取网页
-            response = self.session.get(url, timeout=30)
+            # 获取网页（按主机限速，边下载边解析）
+            self._throttle(url)
+            page = HtmlFeed(self.html_parser)
+            response, _ = self.http.fetch_bounded(url, self.max_bytes, PAGE_CONTENT_TYPES, sink=page.feed,
+                                                  headers=conditional_headers(validators))
+            if response.status_code == 304:
+                self.not_modified = True
+                logger.info(f"网页 {url} 未变化（304），跳过解析")
+                return {}
             response.raise_for_status()
+            if validators is not None:
+                self.validators = response_validators(response)
             
-            # 解析HTML
-            soup = BeautifulSoup(response.content, 'html.parser')
+            return self._parse_page(url, page.close(), config)
             
-            # 提取内容（支持配置选择器）
-            config = config or {}
-            title_selector = config.get('title_selector', 'h1, title')
-            content_selector = config.get('content_selector', 'article, .content, main, .post-content')
-            
-            # 提取标题
-            title_elem = soup.select_one(title_selector) or soup.find('title')
-            title = title_elem.get_text(strip=True) if title_elem else ''
-            
-            # 提取正文
-            content_elem = soup.select_one(content_selector)
-            if content_elem:
-                # 移除脚本和样式
-                for script in content_elem(['script', 'style', 'nav', 'footer', 'aside']):
-                    script.decompose()
-                content = content_elem.get_text(separator='\n', strip=True)
-            else:
-                # 回退：提取所有段落
-                paragraphs = soup.find_all('p')
-                content = '\n'.join([p.get_text(strip=True) for p in paragraphs])
-            
-            # 清理内容
-            content = self._clean_text(content)
-            
-            # 提取元数据
-            meta = {
-                'description': self._extract_meta(soup, 'description'),
-                'keywords': self._extract_meta(soup, 'keywords'),
-                'author': self._extract_meta(soup, 'author'),
-                'published_time': self._extract_meta(soup, 'article:published_time') or 
-                                 self._extract_meta(soup, 'og:published_time')
-            }
-            
-            # 遵守爬虫规范：延迟
-            time.sleep(self.delay)
+        except RateLimited:
+            raise
+        except DownloadRejected as e:
+            logger.warning(f"跳过网页 {url}: {e}")
+            return {}
+        except Exception as e:
+            logger.error(f"抓取网页 {url} 失败: {e}")
+            return {}
+    
+    def _parse_page(self, url: str, html: Union[bytes, HtmlNode], config: Optional[Dict] = None) -> Dict:
+        """解析详情页HTML（或已增量解析的根节点），提取标题、正文与元数据（支持配置选择器）"""
+        try:
+            article = extract_article(html, config, self.html_parser)
             
             result = {
-                'title': title,
-                'content': content,
+                'title': article['title'],
+                # 清理内容
+                'content': self._clean_text(article['content']),
                 'link': url,
-                'meta': meta
+                'meta': article['meta']
             }
             
             logger.info(f"成功抓取网页 {url}")
             return result
             
         except Exception as e:
-            logger.error(f"抓取网页 {url} 失败: {e}")
+            logger.error(f"解析网页 {url} 失败: {e}")
             return {}
     
+    def _throttle(self, url: str):
+        """
+        请求前按主机令牌桶限速（主机的请求间隔由限速器统一确定，见 HostRateLimiter.interval_for）。
+        令牌可用时立即返回，只需等待不超过 CRAWL_RATE_INLINE_WAIT 时原地等待，
+        更长的等待不预约令牌、直接抛出 RateLimited 交给调用方改期，不占用worker空等。
+        """
+        self.limiter.wait(url)
+    
     def _check_robots(self, url: str) -> bool:
-        """检查robots.txt"""
+        """检查robots.txt（按主机缓存，多个worker共享）"""
         try:
-            parsed = urlparse(url)
-            robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
-            rp = RobotFileParser()
-            rp.set_url(robots_url)
-            rp.read()
-            return rp.can_fetch(self.session.headers['User-Agent'], url)
+            return self.policies.can_fetch(url)
         except Exception as e:
             logger.warning(f"检查robots.txt失败: {e}，允许访问")
             return True
     
-    def _extract_meta(self, soup: BeautifulSoup, name: str) -> Optional[str]:
-        """提取meta标签内容"""
-        meta = soup.find('meta', attrs={'name': name}) or \
-               soup.find('meta', attrs={'property': name})
-        return meta.get('content', '').strip() if meta else None
-    
     def _clean_text(self, text: str) -> str:
         """清理文本"""
         # 移除多余空白
@@ -310,10 +420,13 @@ class WebFetcher:
 class AgentFetcher:
     """智能代理工具 - 使用AI辅助的智能抓取"""
     
-    def __init__(self, ollama_url: str = None, model: str = None):
+    def __init__(self, ollama_url: str = None, model: str = None,
+                 http_client: Optional[SharedHttpClient] = None):
         self.ollama_url = ollama_url or 'http://localhost:11434'
         self.model = model or 'qwen2.5:3b'
-        self.web_fetcher = WebFetcher()
+        # Ollama 调用与网页抓取共用进程内的连接池
+        self.http = http_client or get_http_client()
+        self.web_fetcher = WebFetcher(http_client=self.http)
     
     def fetch(self, url: str, query: Optional[str] = None) -> Dict:
         """使用智能代理抓取并提取关键信息"""
@@ -365,7 +478,7 @@ class AgentFetcher:
     "relevant_text": "相关文本片段"
 }}"""
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.ollama_url}/api/generate",
                 json={
                     'model': self.model,
@@ -405,7 +518,7 @@ class AgentFetcher:
     "entities": ["实体1", "实体2"]
 }}"""
             
-            response = requests.post(
+            response = self.http.post(
                 f"{self.ollama_url}/api/generate",
                 json={
                     'model': self.model,
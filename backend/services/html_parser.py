@@ -0,0 +1,313 @@
+"""HTML解析后端 - 统一的选择器/文本提取接口，可按配置切换 BeautifulSoup、lxml 或 selectolax"""
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('bs4', 'lxml', 'selectolax')
+
+# 与 BeautifulSoup.get_text 一致：这些标签内的文本不属于页面文本
+_NON_TEXT_TAGS = ('script', 'style', 'template')
+
+Html = Union[str, bytes]
+
+
+class HtmlNode:
+    """解析树节点的统一接口（文档根节点也是 HtmlNode）"""
+
+    def select(self, selector: str) -> List['HtmlNode']:
+        raise NotImplementedError
+
+    def select_one(self, selector: str) -> Optional['HtmlNode']:
+        raise NotImplementedError
+
+    def attr(self, name: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def text(self, separator: str = '', strip: bool = False) -> str:
+        """
+        与 BeautifulSoup.get_text 语义一致：按文档顺序连接后代文本节点（不含注释与
+        script/style/template 内容）；strip 时去掉每段首尾空白并丢弃空段。
+        """
+        raise NotImplementedError
+
+    def remove(self, tags: Iterable[str]):
+        """删除指定标签的后代节点（保留其后的兄弟文本）"""
+        raise NotImplementedError
+
+    def empty(self) -> bool:
+        """没有任何子节点（包括文本）"""
+        raise NotImplementedError
+
+
+def _join(parts: Iterable[str], separator: str, strip: bool) -> str:
+    if strip:
+        parts = (part.strip() for part in parts)
+        parts = [part for part in parts if part]
+    return separator.join(parts)
+
+
+# ========== BeautifulSoup（html.parser，最慢，作为对照基准） ==========
+class _SoupNode(HtmlNode):
+    def __init__(self, element):
+        self.element = element
+
+    def select(self, selector):
+        return [_SoupNode(element) for element in self.element.select(selector)]
+
+    def select_one(self, selector):
+        element = self.element.select_one(selector)
+        return _SoupNode(element) if element is not None else None
+
+    def attr(self, name):
+        value = self.element.get(name)
+        # class 等多值属性返回列表
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def text(self, separator='', strip=False):
+        return self.element.get_text(separator=separator, strip=strip)
+
+    def remove(self, tags):
+        for element in self.element(list(tags)):
+            element.decompose()
+
+    def empty(self):
+        return not self.element.contents
+
+
+def _parse_bs4(html: Html) -> HtmlNode:
+    from bs4 import BeautifulSoup
+    return _SoupNode(BeautifulSoup(html, 'html.parser'))
+
+
+# ========== lxml（libxml2 解析 + cssselect 编译为XPath） ==========
+@lru_cache(maxsize=256)
+def _css_selector(selector: str):
+    from lxml.cssselect import CSSSelector
+    # html 转换器：标签名与属性名不区分大小写，:checked 等伪类按HTML语义处理，与 soupsieve 一致
+    return CSSSelector(selector, translator='html')
+
+
+def _lxml_strings(element):
+    # 注释、处理指令的 tag 不是字符串，跳过其文本但保留其后的 tail
+    if isinstance(element.tag, str):
+        if element.tag in _NON_TEXT_TAGS:
+            return
+        if element.text:
+            yield element.text
+    for child in element:
+        yield from _lxml_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+class _LxmlNode(HtmlNode):
+    def __init__(self, element):
+        self.element = element
+
+    def select(self, selector):
+        return [_LxmlNode(element) for element in _css_selector(selector)(self.element)]
+
+    def select_one(self, selector):
+        elements = _css_selector(selector)(self.element)
+        return _LxmlNode(elements[0]) if elements else None
+
+    def attr(self, name):
+        return self.element.get(name)
+
+    def text(self, separator='', strip=False):
+        return _join(_lxml_strings(self.element), separator, strip)
+
+    def remove(self, tags):
+        for element in list(self.element.iterdescendants(*tags)):
+            element.drop_tree()
+
+    def empty(self):
+        return len(self.element) == 0 and not self.element.text
+
+
+_XML_DECLARATION_RE = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+def _parse_lxml(html: Html) -> HtmlNode:
+    import lxml.html
+    from lxml.etree import ParserError
+
+    if isinstance(html, str):
+        # 带编码声明的 str 不能交给 lxml 解析
+        html = _XML_DECLARATION_RE.sub('', html, count=1)
+    try:
+        return _LxmlNode(lxml.html.document_fromstring(html))
+    except ParserError:
+        # 空文档
+        return _LxmlNode(lxml.html.document_fromstring('<html></html>'))
+
+
+# ========== selectolax（Lexbor 引擎，C实现的解析与CSS选择器） ==========
+class _LexborNode(HtmlNode):
+    def __init__(self, node):
+        self.node = node
+
+    def select(self, selector):
+        return [_LexborNode(node) for node in self.node.css(selector)]
+
+    def select_one(self, selector):
+        node = self.node.css_first(selector)
+        return _LexborNode(node) if node is not None else None
+
+    def attr(self, name):
+        return self.node.attributes.get(name)
+
+    def text(self, separator='', strip=False):
+        parts = (
+            node.text_content for node in self.node.traverse(include_text=True)
+            if node.tag == '-text' and node.parent is not None and node.parent.tag not in _NON_TEXT_TAGS
+        )
+        return _join((part for part in parts if part), separator, strip)
+
+    def remove(self, tags):
+        for tag in tags:
+            # 逐个标签重新查询、由内向外删除，避免访问已随父节点释放的子节点
+            for node in reversed(self.node.css(tag)):
+                node.decompose()
+
+    def empty(self):
+        return self.node.child is None
+
+
+def _parse_selectolax(html: Html) -> HtmlNode:
+    from selectolax.lexbor import LexborHTMLParser
+    return _LexborNode(LexborHTMLParser(html).root)
+
+
+_PARSERS = {
+    'bs4': _parse_bs4,
+    'lxml': _parse_lxml,
+    'selectolax': _parse_selectolax
+}
+
+_default_backend: Optional[str] = None
+
+
+def available_backend(name: Optional[str]) -> str:
+    """返回可用的解析后端：未安装对应库时回退到 bs4"""
+    global _default_backend
+    if name is None:
+        if _default_backend is None:
+            from config.config import Config
+            _default_backend = available_backend(getattr(Config, 'HTML_PARSER', 'bs4'))
+        return _default_backend
+    if name not in BACKENDS:
+        raise ValueError(f"不支持的HTML解析后端: {name}")
+    try:
+        if name == 'lxml':
+            import lxml.html  # noqa: F401
+            import cssselect  # noqa: F401
+        elif name == 'selectolax':
+            import selectolax.lexbor  # noqa: F401
+    except ImportError:
+        logger.warning(f"HTML解析后端 {name} 未安装，回退到 bs4")
+        return 'bs4'
+    return name
+
+
+def parse_html(html: Union[Html, HtmlNode], backend: Optional[str] = None) -> HtmlNode:
+    """解析HTML，backend 为空时使用配置项 HTML_PARSER；传入已解析的节点（如 HtmlFeed 的结果）时原样返回"""
+    if isinstance(html, HtmlNode):
+        return html
+    return _PARSERS[available_backend(backend)](html)
+
+
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+
+
+class HtmlFeed:
+    """
+    增量解析：下载过程中逐块 feed，close() 返回解析树根节点（可直接传给 extract_article）。
+    lxml 后端边下载边解析，不保留原始字节；bs4 / selectolax 没有增量接口，缓存字节后一次解析。
+    """
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = available_backend(backend)
+        self._parser = None
+        self._chunks: List[bytes] = []
+
+    def _lxml_parser(self, head: bytes):
+        import lxml.html
+        # 与一次性解析一致，按页面开头 <meta charset> 声明的编码解码
+        match = _META_CHARSET_RE.search(head[:4096])
+        if match:
+            try:
+                return lxml.html.HTMLParser(encoding=match.group(1).decode('ascii'))
+            except LookupError:
+                pass
+        return lxml.html.HTMLParser()
+
+    def feed(self, chunk: bytes):
+        if self.backend != 'lxml':
+            self._chunks.append(chunk)
+            return
+        if self._parser is None:
+            self._parser = self._lxml_parser(chunk)
+        self._parser.feed(chunk)
+
+    def close(self) -> HtmlNode:
+        if self.backend != 'lxml':
+            html, self._chunks = b''.join(self._chunks), []
+            return parse_html(html, self.backend)
+        root = None
+        if self._parser is not None:
+            try:
+                root = self._parser.close()
+            except Exception:
+                # 空文档
+                root = None
+        return _LxmlNode(root) if root is not None else parse_html('<html></html>', 'lxml')
+
+
+def html_to_text(html: Html, backend: Optional[str] = None) -> str:
+    """HTML转纯文本：去掉 script/style 后按块换行拼接（RSS摘要、上传的HTML文件）"""
+    root = parse_html(html, backend)
+    root.remove(('script', 'style'))
+    return root.text(separator='\n', strip=True)
+
+
+def _meta_content(root: HtmlNode, name: str) -> Optional[str]:
+    meta = root.select_one(f'meta[name="{name}"]') or root.select_one(f'meta[property="{name}"]')
+    return (meta.attr('content') or '').strip() if meta is not None else None
+
+
+def extract_article(html: Union[Html, HtmlNode], config: Optional[Dict] = None,
+                    backend: Optional[str] = None) -> Dict:
+    """
+    从详情页（HTML或已解析的根节点）提取标题、正文（未清理空白）与元数据：
+      - title_selector 默认 'h1, title'，找不到时取 <title>
+      - content_selector 默认 'article, .content, main, .post-content'，
+        去掉 script/style/nav/footer/aside 后取文本；找不到时拼接所有 <p>
+    """
+    config = config or {}
+    root = parse_html(html, backend)
+
+    # 命中的元素为空（如空的 <h1>）时按未命中处理
+    title_elem = root.select_one(config.get('title_selector', 'h1, title'))
+    if title_elem is None or title_elem.empty():
+        title_elem = root.select_one('title')
+    title = title_elem.text(strip=True) if title_elem is not None and not title_elem.empty() else ''
+
+    content_elem = root.select_one(config.get('content_selector', 'article, .content, main, .post-content'))
+    if content_elem is not None and not content_elem.empty():
+        content_elem.remove(('script', 'style', 'nav', 'footer', 'aside'))
+        content = content_elem.text(separator='\n', strip=True)
+    else:
+        content = '\n'.join(p.text(strip=True) for p in root.select('p'))
+
+    meta = {
+        'description': _meta_content(root, 'description'),
+        'keywords': _meta_content(root, 'keywords'),
+        'author': _meta_content(root, 'author'),
+        'published_time': _meta_content(root, 'article:published_time') or
+                          _meta_content(root, 'og:published_time')
+    }
+    return {'title': title, 'content': content, 'meta': meta}
@@ -0,0 +1,274 @@
+"""共享HTTP客户端 - 每个worker进程一个连接池（keep-alive、gzip/brotli解压、可选HTTP/2），跨任务复用连接"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (compatible; NewsRAG/1.0; +http://example.com/bot)'
+
+# 允许下载的 Content-Type（响应未声明类型时按开头内容判断）
+PAGE_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+FEED_CONTENT_TYPES = ('application/rss+xml', 'application/atom+xml', 'application/rdf+xml', 'application/xml',
+                      'text/xml', 'text/html', 'text/plain')
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+
+# 常见二进制格式的文件头（PDF、压缩包、图片、音视频）
+_BINARY_SIGNATURES = (b'%PDF', b'PK\x03\x04', b'\x1f\x8b', b'Rar!', b'7z\xbc\xaf', b'\x89PNG', b'GIF8',
+                      b'\xff\xd8\xff', b'RIFF', b'ID3', b'OggS', b'fLaC', b'\x1aE\xdf\xa3')
+
+
+class DownloadRejected(Exception):
+    """响应不是可解析的页面（类型不在允许列表、超过大小上限或内容为二进制），传输已中止"""
+
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"已中止下载 {url}: {reason}")
+        self.url = url
+        self.reason = reason
+
+
+class _BoundedBody:
+    """
+    按块累计解压后的字节数（同时防御压缩炸弹），超过 max_bytes 即中止；
+    首块按文件头与 NUL 字节识别二进制内容。sink 不为空时逐块交给 sink（增量解析），不在内存中保留正文。
+    """
+
+    def __init__(self, url: str, max_bytes: int, sink: Optional[Callable[[bytes], None]] = None):
+        self.url = url
+        self.max_bytes = max_bytes
+        self.sink = sink
+        self.size = 0
+        self.chunks = []
+
+    def check_headers(self, response: httpx.Response, allowed_types: Optional[Iterable[str]]):
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if allowed_types is not None and content_type and content_type not in allowed_types:
+            raise DownloadRejected(self.url, f"Content-Type {content_type} 不在允许列表中")
+        length = response.headers.get('Content-Length', '')
+        # Content-Length 是压缩后的长度，超过上限时解压后必然更大
+        if length.isdigit() and int(length) > self.max_bytes:
+            raise DownloadRejected(self.url, f"Content-Length {length} 超过上限 {self.max_bytes} 字节")
+
+    def feed(self, chunk: bytes):
+        if not chunk:
+            return
+        if self.size == 0 and (chunk.startswith(_BINARY_SIGNATURES) or b'\x00' in chunk[:1024]):
+            raise DownloadRejected(self.url, "内容为二进制文件")
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise DownloadRejected(self.url, f"正文超过上限 {self.max_bytes} 字节")
+        if self.sink is not None:
+            self.sink(chunk)
+        else:
+            self.chunks.append(chunk)
+
+    def value(self) -> bytes:
+        return b''.join(self.chunks)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("未安装 h2，HTTP/2 不可用，使用 HTTP/1.1")
+        return False
+    return True
+
+
+class SharedHttpClient:
+    """
+    进程内共享的HTTP客户端：
+      - 同步请求（get / post / stream）使用一个 httpx.Client，RSS、列表页、robots.txt、Ollama 调用共用连接池
+      - 异步请求（aget / afetch_bounded）使用一个 httpx.AsyncClient，运行在进程内常驻的事件循环线程上，
+        通过 run(coro) 提交协程；连接池绑定事件循环，因此不能每次 asyncio.run 新建循环
+      - 连接按源站（scheme + host + port）保持 keep-alive，同一新闻站点不再每个任务重新握手TLS
+      - 响应按 Accept-Encoding 自动解压（gzip/deflate，安装 brotli 后支持 br）
+      - http2=True 且安装了 h2 时，对支持的HTTPS站点使用 HTTP/2（单连接多路复用）
+    通过 httpcore 的 trace 扩展统计连接池命中：每个发出的请求计一次，
+    新建TCP连接计一次未命中，stats() 返回命中率与TLS握手次数。
+    抓取页面使用 fetch_bounded / afetch_bounded 流式下载，正文大小与类型受限，不会整体缓冲未知大小的响应。
+    """
+
+    def __init__(self, timeout: float = 30, max_connections: int = 100, max_keepalive: int = 32,
+                 keepalive_expiry: float = 90, http2: bool = False, headers: Optional[Dict] = None):
+        self.pid = os.getpid()
+        self.http2 = http2 and _http2_available()
+        self._options = dict(
+            headers=dict({'User-Agent': USER_AGENT}, **(headers or {})),
+            timeout=timeout,
+            follow_redirects=True,
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                keepalive_expiry=keepalive_expiry)
+        )
+        self.client = httpx.Client(**self._options)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+        self.aborted_downloads = 0
+
+    # ========== 连接池统计 ==========
+    def _trace(self, event_name: str, info: Dict):
+        if event_name == 'connection.connect_tcp.started':
+            with self._stats_lock:
+                self.new_connections += 1
+        elif event_name == 'connection.start_tls.complete':
+            with self._stats_lock:
+                self.tls_handshakes += 1
+        elif event_name.endswith('.send_request_headers.started'):
+            with self._stats_lock:
+                self.requests += 1
+                if event_name.startswith('http2.'):
+                    self.http2_requests += 1
+
+    async def _atrace(self, event_name: str, info: Dict):
+        # 异步客户端要求 trace 回调是协程函数
+        self._trace(event_name, info)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            requests, new_connections = self.requests, self.new_connections
+            tls_handshakes, http2_requests = self.tls_handshakes, self.http2_requests
+            aborted_downloads = self.aborted_downloads
+        reused = max(0, requests - new_connections)
+        return {
+            'requests': requests,
+            'pool_hits': reused,
+            'pool_misses': new_connections,
+            'hit_rate': round(reused / requests, 4) if requests else 0.0,
+            'tls_handshakes': tls_handshakes,
+            'http2_requests': http2_requests,
+            'http2': self.http2,
+            'aborted_downloads': aborted_downloads
+        }
+
+    # ========== 同步接口 ==========
+    def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return self.client.request(method, url, extensions={'trace': self._trace}, **kwargs)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request('POST', url, **kwargs)
+
+    def stream(self, method: str, url: str, **kwargs):
+        """流式请求（上下文管理器），用法同 httpx.Client.stream"""
+        return self.client.stream(method, url, extensions={'trace': self._trace}, **kwargs)
+
+    def _count_aborted(self):
+        with self._stats_lock:
+            self.aborted_downloads += 1
+
+    def fetch_bounded(self, url: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                      allowed_types: Optional[Iterable[str]] = PAGE_CONTENT_TYPES,
+                      sink: Optional[Callable[[bytes], None]] = None, **kwargs) -> Tuple[httpx.Response, bytes]:
+        """
+        流式 GET：读取响应头后先检查类型与 Content-Length，再逐块读取并累计大小，
+        任一检查不通过时抛出 DownloadRejected 并立即关闭连接（不再接收剩余数据）。
+        返回 (响应, 正文字节)；传入 sink 时正文逐块交给 sink，返回的正文为空。
+        非 2xx 响应（如 304、404）不读取正文，由调用方检查状态码。allowed_types 为 None 时不限类型。
+        """
+        with self.stream('GET', url, **kwargs) as response:
+            if not response.is_success:
+                return response, b''
+            body = _BoundedBody(url, max_bytes, sink)
+            try:
+                body.check_headers(response, allowed_types)
+                for chunk in response.iter_bytes():
+                    body.feed(chunk)
+            except DownloadRejected:
+                self._count_aborted()
+                raise
+        return response, body.value()
+
+    # ========== 异步接口（只能在 run 提交的协程中使用） ==========
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._options)
+        return self._async_client
+
+    async def aget(self, url: str, **kwargs) -> httpx.Response:
+        return await self._get_async_client().get(url, extensions={'trace': self._atrace}, **kwargs)
+
+    async def afetch_bounded(self, url: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                             allowed_types: Optional[Iterable[str]] = PAGE_CONTENT_TYPES,
+                             **kwargs) -> Tuple[httpx.Response, bytes]:
+        """fetch_bounded 的异步版本"""
+        async with self._get_async_client().stream('GET', url, extensions={'trace': self._atrace},
+                                                   **kwargs) as response:
+            if not response.is_success:
+                return response, b''
+            body = _BoundedBody(url, max_bytes)
+            try:
+                body.check_headers(response, allowed_types)
+                async for chunk in response.aiter_bytes():
+                    body.feed(chunk)
+            except DownloadRejected:
+                self._count_aborted()
+                raise
+        return response, body.value()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._loop_thread = threading.Thread(target=loop.run_forever, name='http-client-loop',
+                                                         daemon=True)
+                    self._loop_thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def run(self, coro):
+        """在共享事件循环上运行协程并等待结果（可从任意线程调用，包括已有运行中事件循环的线程）"""
+        loop = self._event_loop()
+        if threading.current_thread() is self._loop_thread:
+            coro.close()
+            raise RuntimeError("不能在共享事件循环线程内同步等待协程")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def close(self):
+        self.client.close()
+        if self._loop is not None:
+            if self._async_client is not None:
+                asyncio.run_coroutine_threadsafe(self._async_client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+# ========== 进程内共享的HTTP客户端 ==========
+_http_client: Optional[SharedHttpClient] = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client(config=None) -> SharedHttpClient:
+    """
+    获取进程内共享的HTTP客户端（首次调用时按配置创建）。
+    Celery prefork 子进程不能沿用父进程的连接与事件循环线程，检测到进程号变化时重新创建。
+    """
+    global _http_client
+    if _http_client is None or _http_client.pid != os.getpid():
+        with _http_client_lock:
+            if _http_client is None or _http_client.pid != os.getpid():
+                if config is None:
+                    # 抓取器可能在应用上下文之外创建，此时直接读取默认配置
+                    from config.config import Config
+                    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+                _http_client = SharedHttpClient(
+                    timeout=config.get('HTTP_CLIENT_TIMEOUT', 30),
+                    max_connections=config.get('HTTP_POOL_MAX_CONNECTIONS', 100),
+                    max_keepalive=config.get('HTTP_POOL_MAX_KEEPALIVE', 32),
+                    keepalive_expiry=config.get('HTTP_POOL_KEEPALIVE_EXPIRY', 90),
+                    http2=config.get('HTTP_CLIENT_HTTP2', False)
+                )
+    return _http_client
@@ -0,0 +1,167 @@
+"""FAISS索引选型与构建 - 按语料规模在 Flat / IVF / HNSW 之间自动选择，可选float16/PQ压缩"""
+import logging
+import math
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw')
+COMPRESSIONS = ('none', 'fp16', 'pq')
+
+
+def choose_index_spec(ntotal: int, dimension: int, config: Optional[Dict] = None) -> Dict:
+    """
+    根据向量数量选择索引类型及参数：
+      - ntotal < FAISS_IVF_THRESHOLD:  精确检索 IndexFlatIP
+      - ntotal < FAISS_HNSW_THRESHOLD: IndexIVFFlat，nlist ≈ 4√n，nprobe ≈ nlist/64
+      - 更大规模:                      IndexHNSWFlat
+    FAISS_INDEX_TYPE 可强制指定类型（auto 为自动选择）。
+    IVF 每个聚类中心至少需要 39 条训练样本：向量数不足 39*nlist 时 nlist 缩小为 ntotal/39，
+    不足 39 条（无法训练任何聚类中心）时退化为 Flat；强制指定 ivf 的小语料同样适用。
+    FAISS_VECTOR_COMPRESSION 指定索引内向量的存储方式：
+      - none: float32（每维4字节）
+      - fp16: 标量量化为float16（每维2字节，内存减半，召回几乎无损）
+      - pq:   乘积量化编码（每向量 FAISS_PQ_M 字节）；HNSW 不支持内积PQ，退化为fp16；
+              向量数少于 max(256, nlist) 时无法训练码本（每个子空间256个中心）与聚类中心，同样退化为fp16
+    压缩索引检索时按 FAISS_RESCORE_FACTOR 倍多取候选，再用全精度向量精确重打分。
+    needs_rebuild 使用同一选型，语料增长到可训练规模后自动重建为PQ。
+    """
+    config = config or {}
+    forced = config.get('FAISS_INDEX_TYPE', 'auto')
+    if forced in INDEX_TYPES:
+        index_type = forced
+    elif ntotal < config.get('FAISS_IVF_THRESHOLD', 200000):
+        index_type = 'flat'
+    elif ntotal < config.get('FAISS_HNSW_THRESHOLD', 2000000):
+        index_type = 'ivf'
+    else:
+        index_type = 'hnsw'
+
+    compression = config.get('FAISS_VECTOR_COMPRESSION', 'none')
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"不支持的向量压缩方式: {compression}")
+    nlist = 0
+    if index_type == 'ivf':
+        nlist = min(int(min(65536, max(64, 4 * math.sqrt(max(ntotal, 1))))), ntotal // 39)
+        if nlist < 1:
+            index_type = 'flat'
+            nlist = 0
+    if compression == 'pq' and (index_type == 'hnsw' or ntotal < max(256, nlist)):
+        compression = 'fp16'
+
+    spec = {'type': index_type, 'dimension': dimension, 'trained_ntotal': ntotal, 'compression': compression}
+    if compression == 'pq':
+        spec['pq_m'] = config.get('FAISS_PQ_M', 48)
+    if index_type == 'ivf':
+        spec['nlist'] = nlist
+        spec['nprobe'] = min(nlist, config.get('FAISS_IVF_NPROBE') or max(8, nlist // 64))
+    elif index_type == 'hnsw':
+        spec['M'] = config.get('FAISS_HNSW_M', 32)
+        spec['ef_construction'] = config.get('FAISS_HNSW_EF_CONSTRUCTION', 200)
+        spec['ef_search'] = config.get('FAISS_HNSW_EF_SEARCH', 64)
+    return spec
+
+
+def needs_rebuild(current: Dict, ntotal: int, dimension: int, config: Optional[Dict] = None) -> bool:
+    """
+    判断是否需要重建索引：选型发生变化，或IVF的训练规模已落后实际规模4倍以上
+    （聚类中心过少，倒排链过长）。
+    """
+    target = choose_index_spec(ntotal, dimension, config)
+    current_type = current.get('type', 'flat')
+    if target['type'] != current_type:
+        return True
+    if target['compression'] != current.get('compression', 'none'):
+        return True
+    if current_type == 'ivf' and ntotal > 4 * max(1, current.get('trained_ntotal', 0)):
+        return True
+    return False
+
+
+def create_index(spec: Dict):
+    """按规格创建空索引（外层包装 IndexIDMap2，向量ID为分块ID）"""
+    import faiss
+
+    dimension = spec['dimension']
+    index_type = spec['type']
+    compression = spec.get('compression', 'none')
+    metric = faiss.METRIC_INNER_PRODUCT
+    if index_type == 'flat':
+        if compression == 'fp16':
+            base = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric)
+        elif compression == 'pq':
+            base = faiss.IndexPQ(dimension, spec['pq_m'], 8, metric)
+        else:
+            base = faiss.IndexFlatIP(dimension)
+    elif index_type == 'ivf':
+        quantizer = faiss.IndexFlatIP(dimension)
+        if compression == 'fp16':
+            base = faiss.IndexIVFScalarQuantizer(quantizer, dimension, spec['nlist'],
+                                                 faiss.ScalarQuantizer.QT_fp16, metric)
+        elif compression == 'pq':
+            base = faiss.IndexIVFPQ(quantizer, dimension, spec['nlist'], spec['pq_m'], 8, metric)
+        else:
+            base = faiss.IndexIVFFlat(quantizer, dimension, spec['nlist'], metric)
+    elif index_type == 'hnsw':
+        if compression == 'fp16':
+            base = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_fp16, spec['M'], metric)
+        else:
+            base = faiss.IndexHNSWFlat(dimension, spec['M'], metric)
+        base.hnsw.efConstruction = spec['ef_construction']
+    else:
+        raise ValueError(f"不支持的索引类型: {index_type}")
+    index = faiss.IndexIDMap2(base)
+    apply_search_params(index, spec)
+    return index
+
+
+def apply_search_params(index, spec: Dict):
+    """设置检索参数（nprobe / efSearch）；这些参数不随索引文件持久化，加载后需重新设置"""
+    import faiss
+
+    base = faiss.downcast_index(index.index) if hasattr(index, 'id_map') else index
+    if spec.get('type') == 'ivf' and 'nprobe' in spec:
+        faiss.extract_index_ivf(base).nprobe = int(spec['nprobe'])
+    elif spec.get('type') == 'hnsw' and 'ef_search' in spec:
+        base.hnsw.efSearch = int(spec['ef_search'])
+
+
+def build_index(spec: Dict, vectors: np.ndarray, ids: np.ndarray, train_size: int = 0, seed: int = 1234):
+    """构建并填充索引；IVF/PQ 先在随机采样上训练聚类中心与码本"""
+    index = create_index(spec)
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    ids = np.ascontiguousarray(ids, dtype='int64')
+
+    if not index.is_trained:
+        # IVF 需要 nlist*64 条样本训练聚类中心；PQ 码本至少需要 256*39 条
+        train_size = train_size or min(len(vectors), max(spec.get('nlist', 0) * 64, 256 * 39))
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(len(vectors), size=train_size, replace=False))]
+        logger.info(f"训练索引: {spec}，训练样本 {train_size} 条")
+        index.train(sample)
+
+    # 分批添加，避免大规模语料一次性复制
+    batch = 100000
+    for start in range(0, len(vectors), batch):
+        index.add_with_ids(vectors[start:start + batch], ids[start:start + batch])
+    return index
+
+
+def exact_knn(queries: np.ndarray, vectors: np.ndarray, k: int, batch: int = 100000) -> np.ndarray:
+    """分批暴力计算内积 top-k（vectors 可为内存映射数组），返回行号"""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype='float32')
+    best_ids = np.zeros((len(queries), 0), dtype='int64')
+    for start in range(0, len(vectors), batch):
+        block = np.asarray(vectors[start:start + batch], dtype='float32')
+        scores = queries @ block.T
+        ids = np.broadcast_to(np.arange(start, start + len(block), dtype='int64'), scores.shape)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_ids = np.concatenate([best_ids, ids], axis=1)
+        if best_scores.shape[1] > k:
+            top = np.argpartition(-best_scores, k, axis=1)[:, :k]
+            best_scores = np.take_along_axis(best_scores, top, axis=1)
+            best_ids = np.take_along_axis(best_ids, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
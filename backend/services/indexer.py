@@ -0,0 +1,264 @@
+"""增量向量化 - 将未向量化的文档分批写入FAISS索引"""
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from services.chunk_filters import ChunkAttributes
+from services.chunker import ChunkStore, iter_chunks, slice_chunk
+from services.embedding_pool import EmbeddingPool
+from services.embeddings import EmbeddingService
+from services.shards import ShardLayout
+from services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+
+def build_embedding_text(title: str, chunk_text: str) -> str:
+    """拼接用于向量化的文本（标题为每个分块提供上下文）"""
+    parts = [title or '', chunk_text or '']
+    return '\n'.join(part for part in parts if part)
+
+
+class _ShardWriter:
+    """一个分片的写入端：持有写锁、完整加载到内存的索引及分块存储"""
+
+    def __init__(self, vector_store: VectorStore):
+        self.vector_store = vector_store
+        self.chunk_store = ChunkStore(vector_store.index_path)
+        self.chunk_attrs = ChunkAttributes(vector_store.index_path)
+        self.dirty = False
+
+
+@contextmanager
+def _run_lock(index_root: str, blocking: bool = True):
+    """整轮向量化的跨进程互斥锁（与各分片的索引写锁分开，避免同一进程重复加锁）"""
+    os.makedirs(index_root, exist_ok=True)
+    with open(os.path.join(index_root, '.vectorize.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class DocumentVectorizer:
+    """
+    增量向量化器：
+      1. 按主键游标流式读取 is_vectorized=False 的文档（每批 batch_size 条，只取需要的列）
+      2. 按句子边界分块，整批分块提交编码（进程池并行，与下一批的读取、分块重叠），
+         编码完成后按文档所属分片（见 ShardLayout）写入：分块偏移追加到 ChunkStore、
+         过滤属性写入 ChunkAttributes、向量追加到该分片内存中的索引
+      3. 每 save_every 批持久化一次有变化的分片，随后每批执行一次批量 UPDATE 标记已向量化
+    先持久化索引再标记文档，进程中途崩溃时文档只会被重新向量化，不会丢失向量。
+    """
+
+    def __init__(self, layout: ShardLayout, embedder: Union[EmbeddingService, EmbeddingPool],
+                 batch_size: int = 512, embed_batch_size: int = 64, save_every: int = 10,
+                 chunk_size: int = 500, chunk_overlap: int = 50, pipeline_depth: int = 2):
+        self.layout = layout
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.embed_batch_size = embed_batch_size
+        self.save_every = max(1, save_every)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.pipeline_depth = max(1, pipeline_depth)
+
+    def _iter_pending_batches(self, max_batches: int) -> Iterator[List]:
+        """按主键游标分批读取未向量化文档，避免 OFFSET 扫描和一次性加载"""
+        from models.document import Document
+        from models.database import db
+
+        last_id = 0
+        for _ in range(max_batches):
+            rows = db.session.query(
+                Document.id, Document.title, Document.content,
+                Document.source_type, Document.source_name, Document.created_at
+            ).filter(
+                Document.is_vectorized == False,  # noqa: E712
+                Document.id > last_id
+            ).order_by(Document.id).limit(self.batch_size).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1].id
+
+    def _chunk_batch(self, rows) -> Tuple[List[Optional[str]], List[Tuple[int, int, int]], List[str], List[Tuple]]:
+        """对一批文档分块，返回各分块所属分片、(doc_id, start, end) 记录、对应的向量化文本及过滤属性"""
+        keys = []
+        records = []
+        texts = []
+        attrs = []
+        for row in rows:
+            key = self.layout.key_for(row.created_at)
+            content = row.content or ''
+            spans = list(iter_chunks(content, self.chunk_size, self.chunk_overlap))
+            if not spans:
+                # 正文为空时仅以标题向量化
+                spans = [(0, 0)]
+            for start, end in spans:
+                keys.append(key)
+                records.append((row.id, start, end))
+                texts.append(build_embedding_text(row.title, slice_chunk(content, start, end)))
+                attrs.append((row.source_type, row.source_name, row.created_at))
+        return keys, records, texts, attrs
+
+    def _backfill_attributes(self, writer: _ShardWriter, batch: int = 100000):
+        """为早于属性文件的分块补写过滤属性（按分块ID区间分批回表）"""
+        from models.document import Document
+        from models.database import db
+
+        total = len(writer.chunk_store)
+        start = len(writer.chunk_attrs)
+        if start >= total:
+            return
+        logger.info(f"补写分块过滤属性: 分块 {start}-{total - 1}")
+        for first in range(start, total, batch):
+            chunk_ids = np.arange(first, min(first + batch, total), dtype='int64')
+            doc_ids = writer.chunk_store.get(chunk_ids)['doc_id']
+            attrs_by_doc = {}
+            unique_ids = [int(doc_id) for doc_id in np.unique(doc_ids)]
+            for i in range(0, len(unique_ids), 1000):
+                rows = db.session.query(
+                    Document.id, Document.source_type, Document.source_name, Document.created_at
+                ).filter(Document.id.in_(unique_ids[i:i + 1000])).all()
+                attrs_by_doc.update({row.id: (row.source_type, row.source_name, row.created_at) for row in rows})
+            writer.chunk_attrs.write(chunk_ids, [attrs_by_doc.get(int(doc_id), (None, None, None))
+                                               for doc_id in doc_ids])
+
+    def _mark_vectorized(self, id_batches: List[List[int]]):
+        """每批一次批量 UPDATE"""
+        from models.document import Document
+        from models.database import db
+
+        for ids in id_batches:
+            Document.query.filter(Document.id.in_(ids)).update(
+                {Document.is_vectorized: True}, synchronize_session=False
+            )
+            db.session.commit()
+
+    def run(self, max_batches: int = 20, wait_for_lock: bool = True) -> Dict:
+        """
+        执行一轮增量向量化，返回统计信息（含 docs_per_sec 吞吐）。
+        编码以流水线方式进行：第 n 批在进程池中编码时，读取并分块第 n+1 批；
+        在途批次达到 pipeline_depth 时先等待最早的批次完成，再读取下一批（背压）。
+        wait_for_lock=False 时若已有向量化在运行则立即抛出 BlockingIOError。
+        """
+        vectorized = 0
+        chunks = 0
+        batches = 0
+        pending: List[List[int]] = []
+        in_flight = deque()
+        writers: Dict[Optional[str], _ShardWriter] = {}
+        started = time.perf_counter()
+
+        with _run_lock(self.layout.index_root, blocking=wait_for_lock), ExitStack() as locks:
+
+            def writer_for(key: Optional[str]) -> _ShardWriter:
+                """首次写入某分片时加写锁并完整加载（与该分片的后台重建互斥）"""
+                writer = writers.get(key)
+                if writer is None:
+                    vector_store = self.layout.vector_store(key)
+                    locks.enter_context(vector_store.write_lock())
+                    vector_store.load(writable=True)
+                    writer = _ShardWriter(vector_store)
+                    self._backfill_attributes(writer)
+                    writers[key] = writer
+                return writer
+
+            def save_dirty():
+                for writer in writers.values():
+                    if writer.dirty:
+                        writer.vector_store.save()
+                        writer.dirty = False
+
+            def drain_one():
+                nonlocal vectorized, chunks, batches, pending
+                ids, keys, records, attrs, encoding = in_flight.popleft()
+                vectors = encoding.get()
+                positions: Dict[Optional[str], List[int]] = {}
+                for position, key in enumerate(keys):
+                    positions.setdefault(key, []).append(position)
+                for key, rows in positions.items():
+                    writer = writer_for(key)
+                    chunk_ids = writer.chunk_store.append_many([records[i] for i in rows])
+                    writer.chunk_attrs.write(chunk_ids, [attrs[i] for i in rows])
+                    writer.vector_store.add(vectors[rows], chunk_ids)
+                    writer.dirty = True
+
+                pending.append(ids)
+                batches += 1
+                vectorized += len(ids)
+                chunks += len(records)
+                logger.info(f"向量化批次 {batches}: {len(ids)} 篇文档，{len(records)} 个分块，"
+                            f"ID {ids[0]}-{ids[-1]}，分片 {sorted(key or '-' for key in positions)}")
+
+                if len(pending) >= self.save_every:
+                    save_dirty()
+                    self._mark_vectorized(pending)
+                    pending = []
+
+            if not self.layout.sharded:
+                # 单一分片：与此前一致，开始时即加载并补写属性
+                writer_for(None)
+
+            for rows in self._iter_pending_batches(max_batches):
+                keys, records, texts, attrs = self._chunk_batch(rows)
+                encoding = self.embedder.encode_async(texts, batch_size=self.embed_batch_size)
+                in_flight.append(([row.id for row in rows], keys, records, attrs, encoding))
+                if len(in_flight) >= self.pipeline_depth:
+                    drain_one()
+            while in_flight:
+                drain_one()
+
+            if pending:
+                save_dirty()
+                self._mark_vectorized(pending)
+
+        elapsed = time.perf_counter() - started
+        stats = {
+            'vectorized': vectorized,
+            'chunks': chunks,
+            'batches': batches,
+            'seconds': round(elapsed, 3),
+            'docs_per_sec': round(vectorized / elapsed, 2) if vectorized else None,
+            'chunks_per_sec': round(chunks / elapsed, 2) if chunks else None,
+            'shards': sorted(key for key in writers if key is not None),
+            'index_total': sum(writer.vector_store.ntotal for writer in writers.values()),
+            'generation': sum(writer.vector_store.generation for writer in writers.values()),
+            'rebuild_shards': [key for key, writer in writers.items() if writer.vector_store.needs_rebuild()]
+        }
+        stats['rebuild_needed'] = bool(stats['rebuild_shards'])
+        if vectorized:
+            save_throughput(self.layout.index_root, dict(stats, finished_at=time.time()))
+        return stats
+
+
+THROUGHPUT_FILE = 'vectorize_throughput.json'
+
+
+def save_throughput(index_path: str, stats: Dict):
+    """记录最近一轮向量化的吞吐（用于评估硬件规模），失败只记录警告"""
+    try:
+        tmp_path = os.path.join(index_path, THROUGHPUT_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, os.path.join(index_path, THROUGHPUT_FILE))
+    except OSError as e:
+        logger.warning(f"记录向量化吞吐失败: {e}")
+
+
+def load_throughput(index_path: str) -> Dict:
+    """读取最近一轮向量化的吞吐统计，没有记录时返回空字典"""
+    try:
+        with open(os.path.join(index_path, THROUGHPUT_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
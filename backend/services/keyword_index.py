@@ -0,0 +1,227 @@
+"""关键词检索 - 基于jieba分词的持久化倒排索引与BM25打分"""
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import jieba
+
+from services.chunk_filters import to_timestamp
+
+logger = logging.getLogger(__name__)
+
+# 只保留包含中文、英文或数字的词元
+_TOKEN_RE = re.compile(r'[\u4e00-\u9fa5a-zA-Z0-9]')
+
+
+def tokenize(text: str) -> List[str]:
+    """搜索引擎模式分词（长词同时产出细粒度子词），统一小写并过滤标点空白"""
+    if not text:
+        return []
+    return [token.lower() for token in jieba.cut_for_search(text)
+            if len(token.strip()) > 0 and _TOKEN_RE.search(token)]
+
+
+class KeywordIndex:
+    """
+    持久化的BM25倒排索引（SQLite文件，WAL模式支持多进程并发读）。
+
+    表结构：
+      - postings(term, doc_id, tf): 以 term 为聚簇主键，按词查倒排链为一次范围扫描
+      - terms(term, df):            文档频率
+      - docs(doc_id, length, ...):  文档长度（词元数）及过滤属性（来源类型、来源名称、创建时间戳）
+      - stats(key, value):          文档总数与总长度，用于计算平均文档长度
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id INTEGER NOT NULL, '
+        'tf INTEGER NOT NULL, PRIMARY KEY (term, doc_id)) WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings (doc_id)',
+        'CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS docs (doc_id INTEGER PRIMARY KEY, length INTEGER NOT NULL, '
+        'source_type TEXT, source_name TEXT, created_at INTEGER)',
+        'CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    ]
+    # 早期索引文件的 docs 表缺少过滤属性列，打开时补齐
+    DOC_ATTR_COLUMNS = {'source_type': 'TEXT', 'source_name': 'TEXT', 'created_at': 'INTEGER'}
+
+    def __init__(self, db_path: str, k1: float = 1.5, b: float = 0.75):
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        self._local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """每个线程一个连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(docs)')}
+            for column, column_type in self.DOC_ATTR_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE docs ADD COLUMN {column} {column_type}')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def _get_stat(self, key: str) -> int:
+        row = self.conn.execute('SELECT value FROM stats WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _add_stat(self, key: str, delta: int):
+        self.conn.execute(
+            'INSERT INTO stats (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value',
+            (key, delta)
+        )
+
+    def _remove_doc(self, doc_id: int):
+        """移除文档的旧倒排记录（重复索引同一文档时使用）"""
+        conn = self.conn
+        row = conn.execute('SELECT length FROM docs WHERE doc_id = ?', (doc_id,)).fetchone()
+        if row is None:
+            return
+        terms = [r[0] for r in conn.execute('SELECT term FROM postings WHERE doc_id = ?', (doc_id,))]
+        conn.executemany('UPDATE terms SET df = df - 1 WHERE term = ?', [(t,) for t in terms])
+        conn.execute('DELETE FROM postings WHERE doc_id = ?', (doc_id,))
+        conn.execute('DELETE FROM docs WHERE doc_id = ?', (doc_id,))
+        self._add_stat('doc_count', -1)
+        self._add_stat('total_length', -row[0])
+
+    def add_documents(self, documents: Iterable[Tuple]) -> int:
+        """
+        增量索引 (doc_id, text) 或 (doc_id, text, attrs)，单个事务提交，返回索引的文档数。
+        attrs 为过滤属性字典：source_type、source_name、created_at（datetime）。
+        """
+        conn = self.conn
+        count = 0
+        with conn:
+            for entry in documents:
+                doc_id, text = entry[0], entry[1]
+                attrs = entry[2] if len(entry) > 2 else {}
+                self._remove_doc(doc_id)
+                tf = Counter(tokenize(text))
+                length = sum(tf.values())
+                conn.executemany(
+                    'INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)',
+                    [(term, doc_id, freq) for term, freq in tf.items()]
+                )
+                conn.executemany(
+                    'INSERT INTO terms (term, df) VALUES (?, 1) '
+                    'ON CONFLICT(term) DO UPDATE SET df = df + 1',
+                    [(term,) for term in tf]
+                )
+                conn.execute(
+                    'INSERT INTO docs (doc_id, length, source_type, source_name, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (doc_id, length, attrs.get('source_type'), attrs.get('source_name'),
+                     to_timestamp(attrs['created_at']) if attrs.get('created_at') else None)
+                )
+                self._add_stat('doc_count', 1)
+                self._add_stat('total_length', length)
+                count += 1
+        return count
+
+    @staticmethod
+    def _filter_clause(filters: Optional[Dict]) -> Tuple[str, List]:
+        """将过滤条件转换为 docs 表上的 SQL 条件"""
+        clauses = []
+        params = []
+        filters = filters or {}
+        for field in ('source_type', 'source_name'):
+            if filters.get(field):
+                clauses.append(f'd.{field} = ?')
+                params.append(filters[field])
+        if filters.get('start_time'):
+            clauses.append('d.created_at >= ?')
+            params.append(to_timestamp(filters['start_time']))
+        if filters.get('end_time'):
+            clauses.append('d.created_at <= ?')
+            params.append(to_timestamp(filters['end_time']))
+        return ''.join(f' AND {clause}' for clause in clauses), params
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict] = None) -> List[Dict]:
+        """
+        BM25检索，返回 [{'document_id': int, 'score': float}, ...]（按得分降序）。
+        filters 与向量检索一致（source_type/source_name/start_time/end_time），在倒排链扫描时过滤。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        conn = self.conn
+        doc_count = self._get_stat('doc_count')
+        if doc_count <= 0:
+            return []
+        avg_length = self._get_stat('total_length') / doc_count
+
+        filter_sql, filter_params = self._filter_clause(filters)
+        scores: Dict[int, float] = {}
+        for term in terms:
+            row = conn.execute('SELECT df FROM terms WHERE term = ?', (term,)).fetchone()
+            if not row or row[0] <= 0:
+                continue
+            df = row[0]
+            # 出现在半数以上文档中的词区分度很低，多词查询时跳过，避免扫描超长倒排链
+            if len(terms) > 1 and df > doc_count / 2:
+                continue
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            postings = conn.execute(
+                'SELECT p.doc_id, p.tf, d.length FROM postings p '
+                'JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ?' + filter_sql,
+                [term] + filter_params
+            )
+            for doc_id, tf, length in postings:
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [{'document_id': doc_id, 'score': score} for doc_id, score in ranked]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def document_text(title: Optional[str], content: Optional[str], summary: Optional[str] = None) -> str:
+    """拼接参与关键词索引的文本（与文档列表的LIKE搜索字段一致）"""
+    return '\n'.join(part for part in (title, summary, content) if part)
+
+
+def document_entry(doc) -> Tuple[int, str, Dict]:
+    """由文档对象（或含相同字段的查询行）生成 add_documents 的索引条目"""
+    return (
+        doc.id,
+        document_text(doc.title, doc.content, doc.summary),
+        {'source_type': doc.source_type, 'source_name': doc.source_name, 'created_at': doc.created_at}
+    )
+
+
+# ========== 进程内共享的关键词索引 ==========
+_keyword_indexes = {}
+_keyword_index_lock = threading.Lock()
+
+
+def get_keyword_index(db_path: str) -> KeywordIndex:
+    """获取进程内共享的关键词索引实例"""
+    index = _keyword_indexes.get(db_path)
+    if index is None:
+        with _keyword_index_lock:
+            index = _keyword_indexes.get(db_path)
+            if index is None:
+                index = KeywordIndex(db_path)
+                _keyword_indexes[db_path] = index
+    return index
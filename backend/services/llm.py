@@ -0,0 +1,83 @@
+"""大模型生成 - Ollama 流式生成与RAG提示词构建"""
+import json
+import logging
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from services.http_client import SharedHttpClient, get_http_client
+
+logger = logging.getLogger(__name__)
+
+
+class OllamaClient:
+    """
+    Ollama /api/generate 客户端（stream=True）。
+    Ollama 以换行分隔的JSON逐块返回生成结果，每收到一块即产出其中的文本片段，
+    调用方无需等待整段回答生成完毕。请求经进程内共享的HTTP客户端发出，连接在多次问答之间复用。
+    """
+
+    def __init__(self, base_url: str = None, model: str = None,
+                 connect_timeout: float = 5, read_timeout: float = 60,
+                 http_client: Optional[SharedHttpClient] = None):
+        self.base_url = (base_url or 'http://localhost:11434').rstrip('/')
+        self.model = model or 'qwen2.5:3b'
+        # 读超时是两个数据块之间的最长间隔，而不是整段生成的总时长
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.http = http_client or get_http_client()
+
+    def stream_generate(self, prompt: str, options: Optional[Dict] = None) -> Iterator[str]:
+        """流式生成，逐块产出文本；连接失败、模型报错或返回无法解析的数据时抛出 RuntimeError"""
+        payload = {'model': self.model, 'prompt': prompt, 'stream': True}
+        if options:
+            payload['options'] = options
+        try:
+            with self.http.stream('POST', f"{self.base_url}/api/generate", json=payload,
+                                  timeout=self.timeout) as response:
+                if response.status_code != 200:
+                    raise RuntimeError(f"Ollama返回错误状态码: {response.status_code}")
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except ValueError as e:
+                        raise RuntimeError(f"Ollama返回了无法解析的数据: {line[:200]}") from e
+                    if chunk.get('error'):
+                        raise RuntimeError(f"Ollama生成失败: {chunk['error']}")
+                    if chunk.get('response'):
+                        yield chunk['response']
+                    if chunk.get('done'):
+                        break
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"请求Ollama失败: {e}") from e
+
+
+def build_rag_prompt(question: str, sources: List[Dict], max_chars: int = 1000) -> str:
+    """
+    构建RAG提示词：按检索排名列出参考资料（优先使用命中的分块文本），
+    要求模型仅依据资料作答并以 [编号] 标注引用。
+    """
+    blocks = []
+    for number, source in enumerate(sources, start=1):
+        text = source.get('matched_chunk') or source.get('summary') or source.get('content') or ''
+        blocks.append(f"[{number}] {source.get('title') or ''}\n{text[:max_chars]}")
+    context = '\n\n'.join(blocks)
+    return f"""请根据以下参考资料回答问题。只使用参考资料中的信息，并在相关句子后用 [编号] 标注出处；如果资料不足以回答，请直接说明。
+
+参考资料：
+{context}
+
+问题：{question}
+
+回答："""
+
+
+def get_llm_client(config) -> OllamaClient:
+    """根据配置创建Ollama客户端"""
+    return OllamaClient(
+        base_url=config.get('OLLAMA_BASE_URL'),
+        model=config.get('OLLAMA_MODEL'),
+        read_timeout=config.get('RAG_STREAM_READ_TIMEOUT', 60),
+        http_client=get_http_client(config)
+    )
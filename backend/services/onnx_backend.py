@@ -0,0 +1,161 @@
+"""ONNX Runtime 推理后端 - 导出并int8动态量化嵌入模型与交叉编码器，CPU上替代PyTorch推理"""
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = 'model.onnx'
+QUANTIZED_MODEL_FILE = 'model-int8.onnx'
+
+
+def onnx_model_dir(root: str, model_name: str) -> str:
+    """模型导出目录：<ONNX_MODEL_DIR>/<模型名，斜杠替换为双下划线>"""
+    return os.path.join(root, model_name.replace('/', '__'))
+
+
+def _create_session(model_dir: str, quantized: bool, num_threads: int):
+    import onnxruntime as ort
+
+    path = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"未找到ONNX模型 {path}，请先运行 export_onnx_models.py")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    logger.info(f"加载ONNX模型: {path}")
+    return ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+
+class _OnnxModel:
+    """分词器 + InferenceSession，按长度排序分批以减少padding"""
+
+    def __init__(self, model_dir: str, quantized: bool = True, num_threads: int = 0, max_length: int = 256):
+        from transformers import AutoTokenizer
+
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = _create_session(model_dir, quantized, num_threads)
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+    def reset_session(self, num_threads: int = 0):
+        """fork 后重建会话（ONNX Runtime 的线程池不会被子进程继承）"""
+        self.session = _create_session(self.model_dir, self.quantized, num_threads)
+
+    def _run(self, *texts, batch_size: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """分批前向计算，返回按原顺序排列的 (输出, attention_mask)"""
+        count = len(texts[0])
+        order = np.argsort([-len(text) for text in texts[0]], kind='stable')
+        outputs = [None] * count
+        for start in range(0, count, batch_size):
+            batch_ids = order[start:start + batch_size]
+            encoded = self.tokenizer(*[[column[i] for i in batch_ids] for column in texts],
+                                     padding=True, truncation=True, max_length=self.max_length,
+                                     return_tensors='np')
+            feeds = {name: encoded[name].astype('int64') for name in encoded if name in self.input_names}
+            output = self.session.run(None, feeds)[0]
+            for row, i in enumerate(batch_ids):
+                outputs[i] = (output[row], encoded['attention_mask'][row])
+        return outputs
+
+
+class OnnxSentenceEncoder(_OnnxModel):
+    """与 SentenceTransformer.encode 接口一致的句向量编码器（mean pooling）"""
+
+    def get_sentence_embedding_dimension(self) -> int:
+        with open(os.path.join(self.model_dir, 'config.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)['hidden_size']
+
+    def encode(self, sentences: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False) -> np.ndarray:
+        dimension = self.get_sentence_embedding_dimension()
+        if not sentences:
+            return np.zeros((0, dimension), dtype='float32')
+        vectors = np.zeros((len(sentences), dimension), dtype='float32')
+        for i, (token_embeddings, mask) in enumerate(self._run(list(sentences), batch_size=batch_size)):
+            mask = mask[:len(token_embeddings)].astype('float32')[:, None]
+            vectors[i] = (token_embeddings * mask).sum(axis=0) / max(mask.sum(), 1e-9)
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+
+class OnnxCrossEncoder(_OnnxModel):
+    """与 sentence_transformers.CrossEncoder.predict 接口一致的交叉编码器（单标签输出取sigmoid）"""
+
+    def __init__(self, model_dir: str, quantized: bool = True, num_threads: int = 0, max_length: int = 512):
+        super().__init__(model_dir, quantized, num_threads, max_length)
+
+    def predict(self, sentences: List[Tuple[str, str]], batch_size: int = 32,
+                show_progress_bar: bool = False) -> np.ndarray:
+        if not sentences:
+            return np.zeros(0, dtype='float32')
+        queries = [pair[0] for pair in sentences]
+        texts = [pair[1] for pair in sentences]
+        logits = np.stack([output for output, _ in self._run(queries, texts, batch_size=batch_size)])
+        if logits.shape[1] == 1:
+            return (1 / (1 + np.exp(-logits[:, 0]))).astype('float32')
+        return logits
+
+
+def export_model(model_name: str, output_dir: str, cross_encoder: bool = False,
+                 quantize: bool = True, opset: int = 14) -> str:
+    """
+    导出 HuggingFace 模型为ONNX（动态 batch / 序列长度），并可选int8动态量化
+    （权重int8、激活运行时量化，适合CPU上的Transformer推理）。返回导出目录。
+    """
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model_class = AutoModelForSequenceClassification if cross_encoder else AutoModel
+    model = model_class.from_pretrained(model_name)
+    model.eval()
+
+    sample = tokenizer(['样例查询', 'sample query'], ['样例文本', 'sample text'] if cross_encoder else None,
+                       padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    output_name = 'logits' if cross_encoder else 'token_embeddings'
+    dynamic_axes[output_name] = {0: 'batch'} if cross_encoder else {0: 'batch', 1: 'sequence'}
+
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), model_path,
+            input_names=input_names, output_names=[output_name],
+            dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True
+        )
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(output_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+    logger.info(f"已导出ONNX模型: {model_name} -> {output_dir}")
+    return output_dir
+
+
+def load_embedding_model(model_name: str, backend: str = 'torch', onnx_root: Optional[str] = None,
+                         quantized: bool = True, num_threads: int = 0, device: Optional[str] = None):
+    """按推理后端加载嵌入模型（torch: SentenceTransformer；onnx: OnnxSentenceEncoder）"""
+    if backend == 'onnx':
+        return OnnxSentenceEncoder(onnx_model_dir(onnx_root, model_name), quantized, num_threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=device)
+
+
+def load_cross_encoder(model_name: str, backend: str = 'torch', onnx_root: Optional[str] = None,
+                       quantized: bool = True, num_threads: int = 0, max_length: int = 512):
+    """按推理后端加载交叉编码器（torch: CrossEncoder；onnx: OnnxCrossEncoder）"""
+    if backend == 'onnx':
+        return OnnxCrossEncoder(onnx_model_dir(onnx_root, model_name), quantized, num_threads, max_length)
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name, max_length=max_length)
@@ -0,0 +1,186 @@
+"""查询缓存 - 查询向量与检索结果的两级缓存（进程内LRU + Redis）"""
+import base64
+import hashlib
+import json
+import logging
+import secrets
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from services.cache import TTLCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class TieredCache:
+    """
+    两级缓存：进程内LRU在前，Redis在后（多个worker共享）。
+    Redis不可用时自动降级为仅进程内缓存，不影响查询。
+    """
+
+    def __init__(self, namespace: str, redis_client=None, maxsize: int = 1024, ttl: float = 300,
+                 encode: Callable[[Any], bytes] = None, decode: Callable[[bytes], Any] = None):
+        self.namespace = namespace
+        self.redis = redis_client
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.encode = encode or (lambda value: json.dumps(value).encode('utf-8'))
+        self.decode = decode or (lambda data: json.loads(data))
+        self.redis_hits = 0
+
+    def _redis_key(self, key: str) -> str:
+        return f'news_rag:{self.namespace}:{key}'
+
+    def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not None or self.redis is None:
+            return value
+        try:
+            data = self.redis.get(self._redis_key(key))
+        except Exception as e:
+            logger.warning(f"读取Redis缓存失败: {e}")
+            return None
+        if data is None:
+            return None
+        value = self.decode(data)
+        self.redis_hits += 1
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any):
+        self.local.set(key, value)
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self._redis_key(key), self.encode(value), ex=int(self.ttl))
+        except Exception as e:
+            logger.warning(f"写入Redis缓存失败: {e}")
+
+    def stats(self) -> Dict:
+        return dict(self.local.stats(), redis_hits=self.redis_hits)
+
+
+class QueryCache:
+    """
+    语义查询缓存：
+      - 一级：(模型, 推理后端, 规范化查询文本) → 查询向量（与索引无关，可长期缓存）
+      - 二级：(推理后端, 查询, 检索参数/过滤条件, 索引代数) → 排序后的结果列表
+    索引代数在每次向量化批次发布后递增，二级缓存键随之变化，旧结果自然失效。
+    不同推理后端（torch / onnx int8）的向量有数值差异，切换后端后不复用另一后端缓存的向量与结果。
+    """
+
+    def __init__(self, redis_client=None, model_name: str = '', l1_size: int = 1024,
+                 embedding_ttl: float = 86400, result_ttl: float = 600, backend: str = 'torch'):
+        self.model_name = model_name
+        self.backend = backend
+        self.embeddings = TieredCache(
+            'qemb', redis_client, maxsize=l1_size, ttl=embedding_ttl,
+            encode=lambda vector: np.asarray(vector, dtype='float32').tobytes(),
+            decode=lambda data: np.frombuffer(data, dtype='float32').reshape(1, -1)
+        )
+        self.results = TieredCache('qres', redis_client, maxsize=l1_size, ttl=result_ttl)
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _embedding_key(self, query: str) -> str:
+        return f'{self.model_name}:{self.backend}:{self._digest(normalize_query(query))}'
+
+    def _results_key(self, query: str, params: Dict, generation: int) -> str:
+        payload = json.dumps({'q': normalize_query(query), 'p': params}, sort_keys=True, ensure_ascii=False)
+        return f'{self.backend}:g{generation}:{self._digest(payload)}'
+
+    def get_embedding(self, query: str) -> Optional[np.ndarray]:
+        return self.embeddings.get(self._embedding_key(query))
+
+    def set_embedding(self, query: str, vector: np.ndarray):
+        self.embeddings.set(self._embedding_key(query), vector)
+
+    def get_results(self, query: str, params: Dict, generation: int) -> Optional[List[Dict]]:
+        return self.results.get(self._results_key(query, params, generation))
+
+    def set_results(self, query: str, params: Dict, generation: int, results: List[Dict]):
+        self.results.set(self._results_key(query, params, generation), results)
+
+    def stats(self) -> Dict:
+        return {'embeddings': self.embeddings.stats(), 'results': self.results.stats()}
+
+
+class ResultCursors:
+    """
+    分页游标：首次查询把完整排序的候选列表缓存一段时间（TTL），返回不透明游标；
+    后续页只按游标切片，不再重复检索与重排。游标只编码 (列表令牌, 偏移, 每页条数)，
+    列表令牌为随机串，列表中记录创建者，其他用户持有游标也无法读取。
+    """
+
+    def __init__(self, redis_client=None, maxsize: int = 1024, ttl: float = 900):
+        self.lists = TieredCache('qcur', redis_client, maxsize=maxsize, ttl=ttl)
+
+    def open(self, owner: str, query: str, mode: str, hits: List[Dict]) -> str:
+        """缓存排序后的候选列表，返回列表令牌"""
+        token = secrets.token_urlsafe(12)
+        self.lists.set(token, {'owner': owner, 'query': query, 'mode': mode, 'hits': hits})
+        return token
+
+    def get(self, token: str, owner: str) -> Optional[Dict]:
+        """读取候选列表，过期或不属于该用户时返回None"""
+        entry = self.lists.get(token)
+        if entry is None or entry.get('owner') != owner:
+            return None
+        return entry
+
+    @staticmethod
+    def encode(token: str, offset: int, page_size: int) -> str:
+        payload = json.dumps({'t': token, 'o': offset, 'n': page_size}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode(cursor: str):
+        """解析游标为 (令牌, 偏移, 每页条数)，格式错误时抛出 ValueError"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            token, offset, page_size = str(payload['t']), int(payload['o']), int(payload['n'])
+        except Exception:
+            raise ValueError('游标格式错误')
+        if offset < 0 or page_size <= 0:
+            raise ValueError('游标格式错误')
+        return token, offset, page_size
+
+
+def _create_redis_client(config):
+    redis_url = config.get('REDIS_URL')
+    if redis_url and config.get('QUERY_CACHE_USE_REDIS', True):
+        try:
+            import redis
+            # 超时要短：缓存未命中时宁可重新计算，也不能让Redis抖动拖慢查询
+            return redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.05)
+        except Exception as e:
+            logger.warning(f"初始化Redis查询缓存失败，仅使用进程内缓存: {e}")
+    return None
+
+
+def create_query_cache(config) -> QueryCache:
+    """根据配置创建查询缓存（REDIS_URL 不可用时仅使用进程内缓存）"""
+    backend = config.get('INFERENCE_BACKEND', 'torch')
+    if backend == 'onnx' and config.get('ONNX_QUANTIZED', True):
+        backend = 'onnx-int8'
+    return QueryCache(
+        _create_redis_client(config),
+        model_name=config.get('EMBEDDING_MODEL', ''),
+        backend=backend,
+        l1_size=config.get('QUERY_CACHE_SIZE', 1024),
+        embedding_ttl=config.get('QUERY_EMBEDDING_CACHE_TTL', 86400),
+        result_ttl=config.get('QUERY_RESULT_CACHE_TTL', 600)
+    )
+
+
+def create_result_cursors(config) -> ResultCursors:
+    """创建分页游标存储（与查询缓存共用Redis，多个worker间游标通用）"""
+    return ResultCursors(
+        _create_redis_client(config),
+        maxsize=config.get('QUERY_CACHE_SIZE', 1024),
+        ttl=config.get('SEARCH_CURSOR_TTL', 900)
+    )
@@ -0,0 +1,208 @@
+"""查询分阶段耗时 - 记录每次查询各阶段耗时与候选数，按时间窗口统计分位数"""
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# first_token 为RAG问答从请求开始到首个生成片段的耗时
+STAGES = ('embed', 'ann', 'bm25', 'rerank', 'hydrate', 'llm', 'first_token', 'total')
+COUNTS = ('vector_candidates', 'keyword_candidates', 'rerank_candidates', 'results')
+
+# 直方图桶上界（毫秒，近似对数刻度），最后一个桶收纳更慢的请求
+HISTOGRAM_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class StageTimer:
+    """
+    单次查询的分阶段计时器：
+      with timer.stage('embed'): ...
+      timer.count('vector_candidates', 40)
+    未执行的阶段不记录（与耗时为0区分）。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.cache_hit = False
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def add(self, name: str, milliseconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + milliseconds
+
+    def count(self, name: str, value: int):
+        self.counts[name] = int(value)
+
+    def finish(self) -> float:
+        """记录总耗时并返回（毫秒）"""
+        self.timings['total'] = (time.perf_counter() - self.started) * 1000
+        return self.timings['total']
+
+
+def encode_sample(query_type: str, timer: StageTimer, timestamp: float) -> str:
+    """
+    紧凑编码：'<时间戳>|<类型>|<缓存命中>|<各阶段毫秒，逗号分隔>|<各计数，逗号分隔>'，
+    未执行的阶段/计数为空串。每条约60字节。
+    """
+    stages = ','.join(f'{timer.timings[name]:.1f}' if name in timer.timings else '' for name in STAGES)
+    counts = ','.join(str(timer.counts[name]) if name in timer.counts else '' for name in COUNTS)
+    return f'{timestamp:.3f}|{query_type}|{int(timer.cache_hit)}|{stages}|{counts}'
+
+
+def decode_sample(data: str) -> Dict:
+    timestamp, query_type, cache_hit, stages, counts = data.split('|')[:5]
+    return {
+        'timestamp': float(timestamp),
+        'type': query_type,
+        'cache_hit': cache_hit == '1',
+        'timings': {name: float(value) for name, value in zip(STAGES, stages.split(',')) if value},
+        'counts': {name: int(value) for name, value in zip(COUNTS, counts.split(',')) if value}
+    }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩法分位数（输入需已排序）"""
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(values: List[float], histogram: bool = True) -> Dict:
+    values = sorted(values)
+    summary = {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 2),
+        'p50': round(_percentile(values, 50), 2),
+        'p95': round(_percentile(values, 95), 2),
+        'p99': round(_percentile(values, 99), 2),
+        'max': round(values[-1], 2)
+    }
+    if histogram:
+        buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for value in values:
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+        labels = [f'<={bound}' for bound in HISTOGRAM_BUCKETS] + [f'>{HISTOGRAM_BUCKETS[-1]}']
+        summary['histogram'] = dict(zip(labels, buckets))
+    return summary
+
+
+class QueryMetrics:
+    """
+    查询耗时样本存储：Redis有序集合（分值为时间戳，多个worker/节点共享），
+    Redis不可用时退化为进程内环形缓冲。写入时按保留时长与样本上限裁剪。
+    """
+
+    REDIS_KEY = 'news_rag:query_metrics'
+
+    def __init__(self, redis_client=None, retention_seconds: int = 7 * 86400, max_samples: int = 200000):
+        self.redis = redis_client
+        self.retention_seconds = retention_seconds
+        self.max_samples = max_samples
+        self._local = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, query_type: str, timer: StageTimer):
+        """记录一次查询（失败只记录警告，不影响查询）"""
+        now = time.time()
+        sample = encode_sample(query_type, timer, now)
+        if self.redis is not None:
+            try:
+                # 成员后缀随机串，避免同一毫秒内的相同样本被合并
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.zadd(self.REDIS_KEY, {f'{sample}|{uuid.uuid4().hex[:6]}': now})
+                pipe.zremrangebyscore(self.REDIS_KEY, 0, now - self.retention_seconds)
+                pipe.zremrangebyrank(self.REDIS_KEY, 0, -self.max_samples - 1)
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"写入查询耗时失败，改为进程内记录: {e}")
+        with self._lock:
+            self._local.append(sample)
+
+    def samples(self, window_seconds: float) -> List[Dict]:
+        since = time.time() - window_seconds
+        raw = None
+        if self.redis is not None:
+            try:
+                raw = [item.decode('utf-8') if isinstance(item, bytes) else item
+                       for item in self.redis.zrangebyscore(self.REDIS_KEY, since, '+inf')]
+            except Exception as e:
+                logger.warning(f"读取查询耗时失败，使用进程内记录: {e}")
+        if raw is None:
+            with self._lock:
+                raw = list(self._local)
+        samples = [decode_sample(item) for item in raw]
+        return [sample for sample in samples if sample['timestamp'] >= since]
+
+    def stats(self, window_seconds: float = 3600, query_type: Optional[str] = None,
+              include_cache_hits: bool = False) -> Dict:
+        """时间窗口内各阶段耗时（毫秒）与候选数的分位数；默认排除缓存命中的查询"""
+        samples = self.samples(window_seconds)
+        if query_type:
+            samples = [sample for sample in samples if sample['type'] == query_type]
+        cache_hits = sum(1 for sample in samples if sample['cache_hit'])
+        if not include_cache_hits:
+            samples = [sample for sample in samples if not sample['cache_hit']]
+
+        stages = {}
+        for name in STAGES:
+            values = [sample['timings'][name] for sample in samples if name in sample['timings']]
+            if values:
+                stages[name] = summarize(values)
+        counts = {}
+        for name in COUNTS:
+            values = [sample['counts'][name] for sample in samples if name in sample['counts']]
+            if values:
+                counts[name] = summarize(values, histogram=False)
+        return {
+            'window_seconds': window_seconds,
+            'type': query_type,
+            'queries': len(samples),
+            'cache_hits': cache_hits,
+            'stages_ms': stages,
+            'counts': counts
+        }
+
+
+# ========== 进程内共享的查询耗时存储 ==========
+_query_metrics: Optional[QueryMetrics] = None
+_query_metrics_lock = threading.Lock()
+
+
+def get_query_metrics(config) -> QueryMetrics:
+    """获取进程内共享的查询耗时存储（REDIS_URL 不可用时仅进程内记录）"""
+    global _query_metrics
+    if _query_metrics is None:
+        with _query_metrics_lock:
+            if _query_metrics is None:
+                redis_client = None
+                redis_url = config.get('REDIS_URL')
+                if redis_url:
+                    try:
+                        import redis
+                        redis_client = redis.Redis.from_url(redis_url, socket_timeout=0.05,
+                                                            socket_connect_timeout=0.05)
+                    except Exception as e:
+                        logger.warning(f"初始化Redis查询耗时存储失败，仅进程内记录: {e}")
+                _query_metrics = QueryMetrics(
+                    redis_client,
+                    retention_seconds=config.get('QUERY_METRICS_RETENTION', 7 * 86400),
+                    max_samples=config.get('QUERY_METRICS_MAX_SAMPLES', 200000)
+                )
+    return _query_metrics
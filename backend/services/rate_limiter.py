@@ -0,0 +1,170 @@
+"""按主机限速 - Redis令牌桶（全集群共享），替代抓取器中的固定 time.sleep"""
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# 预约式令牌桶：令牌不足时仍然扣减（允许欠账），返回需要等待的秒数，
+# 调用方等待后即可发出请求，无需轮询。等待超过 max_wait 时不预约，由调用方改期。
+# 时间取自 Redis 服务器，各 worker 之间不受本机时钟偏差影响。
+_RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+if wait > max_wait then
+    return {0, tostring(wait)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity + 1) / rate) + 60)
+return {1, tostring(wait)}
+"""
+
+
+class RateLimited(Exception):
+    """主机令牌桶需要等待的时间超过上限，调用方应改期重试（如 Celery retry）"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host} 限速中，{retry_after:.1f}s 后重试")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class HostRateLimiter:
+    """
+    按主机的令牌桶限速器：每个主机每 interval_for(url) 秒补充一个令牌，最多积攒 burst 个。
+    补充速率只由限速器决定（配置的 interval 与 robots.txt 的 Crawl-delay 中的较大者），
+    RSS、网页抓取器与异步抓取引擎对同一主机使用同一速率，桶的实际速率不随调用方变化。
+      - reserve(url) 预约一次请求，返回需要等待的秒数（多数情况下为0），
+        等待超过 max_wait 时不预约并抛出 RateLimited（异步抓取引擎在事件循环上等待，不占用线程）
+      - wait(url) 供同步抓取器使用：只在等待不超过 inline_wait 时原地等待，
+        否则抛出 RateLimited，由任务改期执行，不让worker长时间空等
+    Redis 不可用时退化为进程内令牌桶（只约束本进程）。
+    """
+
+    REDIS_PREFIX = 'news_rag:ratelimit:'
+
+    def __init__(self, redis_client=None, interval: float = 0.25, policies=None, burst: float = 2,
+                 max_wait: float = 5.0, inline_wait: float = 1.0):
+        self.redis = redis_client
+        # 同一主机相邻请求的最小间隔（秒）；policies 为 CrawlPolicyCache，提供各主机的 Crawl-delay
+        self.interval = interval
+        self.policies = policies
+        self.burst = burst
+        self.max_wait = max_wait
+        self.inline_wait = inline_wait
+        self._script = redis_client.register_script(_RESERVE_SCRIPT) if redis_client is not None else None
+        self._local: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+        self.deferred = 0
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    def interval_for(self, url: str) -> float:
+        """url 所在主机的请求间隔（秒）：配置的间隔与 robots.txt 的 Crawl-delay 中的较大者"""
+        interval = self.interval
+        if self.policies is not None:
+            try:
+                interval = max(interval, self.policies.crawl_delay(url))
+            except Exception as e:
+                logger.warning(f"读取Crawl-delay失败: {e}")
+        return interval
+
+    def _reserve_local(self, host: str, rate: float, max_wait: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._local.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + max(0.0, now - ts) * rate)
+            wait = (1 - tokens) / rate if tokens < 1 else 0.0
+            if wait > max_wait:
+                return False, wait
+            self._local[host] = (tokens - 1, now)
+            return True, wait
+
+    def reserve(self, url: str, max_wait: Optional[float] = None) -> float:
+        """
+        预约一次对 url 所在主机的请求，返回需要等待的秒数；
+        需要等待超过 max_wait（默认为构造参数 max_wait）时不预约，抛出 RateLimited
+        """
+        interval = self.interval_for(url)
+        if interval <= 0:
+            return 0.0
+        if max_wait is None:
+            max_wait = self.max_wait
+        host = self.host_key(url)
+        rate = 1.0 / interval
+        granted, wait = None, 0.0
+        if self._script is not None:
+            try:
+                granted, wait = self._script(keys=[self.REDIS_PREFIX + host], args=[rate, self.burst, max_wait])
+                granted, wait = bool(int(granted)), float(wait)
+            except Exception as e:
+                logger.warning(f"Redis限速不可用，使用进程内令牌桶: {e}")
+                granted = None
+        if granted is None:
+            granted, wait = self._reserve_local(host, rate, max_wait)
+        if not granted:
+            self.deferred += 1
+            raise RateLimited(host, wait)
+        return wait
+
+    def wait(self, url: str):
+        """预约并等待到可以发出请求（只在令牌不足时等待，且不超过 inline_wait），否则抛出 RateLimited"""
+        wait = self.reserve(url, self.inline_wait)
+        if wait > 0:
+            self.waited_seconds += wait
+            time.sleep(wait)
+
+    def stats(self) -> Dict:
+        return {'waited_seconds': round(self.waited_seconds, 3), 'deferred': self.deferred}
+
+
+# ========== 进程内共享的限速器 ==========
+_rate_limiter: Optional[HostRateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(config=None) -> HostRateLimiter:
+    """获取进程内共享的按主机限速器（首次调用时按配置连接Redis）"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                if config is None:
+                    # 抓取器可能在应用上下文之外创建，此时直接读取默认配置
+                    from config.config import Config
+                    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+                redis_client = None
+                redis_url = config.get('REDIS_URL')
+                if redis_url:
+                    try:
+                        import redis
+                        redis_client = redis.Redis.from_url(redis_url, socket_timeout=0.5,
+                                                            socket_connect_timeout=0.5)
+                    except Exception as e:
+                        logger.warning(f"初始化Redis限速器失败，使用进程内令牌桶: {e}")
+                from services.crawl_policy import get_crawl_policy_cache
+                _rate_limiter = HostRateLimiter(
+                    redis_client,
+                    interval=config.get('CRAWL_HOST_INTERVAL', 0.25),
+                    policies=get_crawl_policy_cache(config),
+                    burst=config.get('CRAWL_HOST_BURST', 2),
+                    max_wait=config.get('CRAWL_RATE_MAX_WAIT', 5.0),
+                    inline_wait=config.get('CRAWL_RATE_INLINE_WAIT', 1.0)
+                )
+    return _rate_limiter
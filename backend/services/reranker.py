@@ -0,0 +1,129 @@
+"""结果重排 - 交叉编码器批量打分与得分缓存"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from services.cache import TTLCache, query_hash
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    交叉编码器重排：
+      - 候选的 (查询, 文本) 对在一次批量前向计算中打分
+      - (查询哈希, 候选键) → 得分 缓存在带TTL的LRU中，重复查询和翻页不再调用模型
+      - latency_budget_ms 限制单次需要模型打分的候选数：按历史单对耗时估算，
+        超出预算的候选保持检索顺序排在重排结果之后
+    """
+
+    def __init__(self, model_name: str, top_n: int = 30, latency_budget_ms: float = 300,
+                 cache_size: int = 10000, cache_ttl: float = 3600, max_length: int = 512,
+                 backend: str = 'torch', onnx_root: Optional[str] = None, onnx_quantized: bool = True,
+                 num_threads: int = 0):
+        # ms-marco 系列交叉编码器发布在 cross-encoder 组织下
+        self.model_name = model_name if '/' in model_name else f'cross-encoder/{model_name}'
+        self.top_n = top_n
+        self.latency_budget_ms = latency_budget_ms
+        self.max_length = max_length
+        self.backend = backend
+        self.onnx_root = onnx_root
+        self.onnx_quantized = onnx_quantized
+        self.num_threads = num_threads
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._model = None
+        self._lock = threading.Lock()
+        # 单个候选对的平均打分耗时（毫秒，指数滑动平均）
+        self._ms_per_pair: Optional[float] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from services.onnx_backend import load_cross_encoder
+                    logger.info(f"加载重排模型: {self.model_name}（{self.backend}）")
+                    self._model = load_cross_encoder(
+                        self.model_name, self.backend, self.onnx_root,
+                        self.onnx_quantized, self.num_threads, self.max_length
+                    )
+        return self._model
+
+    def _budget_pairs(self) -> int:
+        """按延迟预算估算本次最多可打分的候选数"""
+        if not self.latency_budget_ms or not self._ms_per_pair:
+            return self.top_n
+        return max(1, min(self.top_n, int(self.latency_budget_ms / self._ms_per_pair)))
+
+    def _score(self, query: str, texts: List[str]) -> List[float]:
+        """一次批量前向计算打分，并更新单对耗时估计"""
+        start = time.perf_counter()
+        scores = self.model.predict([(query, text) for text in texts],
+                                    batch_size=len(texts), show_progress_bar=False)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        per_pair = elapsed_ms / len(texts)
+        self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+        if self.latency_budget_ms and elapsed_ms > self.latency_budget_ms:
+            logger.warning(f"重排耗时 {elapsed_ms:.0f}ms 超出预算 {self.latency_budget_ms}ms（{len(texts)} 个候选）")
+        return [float(score) for score in scores]
+
+    def rerank(self, query: str, candidates: List[Dict]) -> List[Dict]:
+        """
+        重排候选列表。候选需包含 'key'（缓存键，如分块ID）和 'text'（参与打分的文本）。
+        返回新列表：前 top_n 个候选按 rerank_score 降序，其余保持原顺序追加在后。
+        """
+        if not candidates:
+            return []
+        head = candidates[:self.top_n]
+        tail = candidates[self.top_n:]
+        qhash = query_hash(query)
+
+        scores: Dict[int, float] = {}
+        pending = []
+        for i, candidate in enumerate(head):
+            cached = self.cache.get((qhash, candidate['key']))
+            if cached is not None:
+                scores[i] = cached
+            else:
+                pending.append(i)
+
+        budget = self._budget_pairs()
+        if len(pending) > budget:
+            tail = [head[i] for i in pending[budget:]] + tail
+            pending = pending[:budget]
+
+        if pending:
+            fresh = self._score(query, [head[i]['text'] for i in pending])
+            for i, score in zip(pending, fresh):
+                scores[i] = score
+                self.cache.set((qhash, head[i]['key']), score)
+
+        reranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [dict(head[i], rerank_score=score) for i, score in reranked] + tail
+
+
+# ========== 进程内共享的重排器 ==========
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker(config) -> CrossEncoderReranker:
+    """获取进程内共享的重排器（模型与缓存只初始化一次）"""
+    global _reranker
+
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker(
+                    config['RERANK_MODEL'],
+                    top_n=config.get('RERANK_TOP_N', 30),
+                    latency_budget_ms=config.get('RERANK_LATENCY_BUDGET_MS', 300),
+                    cache_size=config.get('RERANK_CACHE_SIZE', 10000),
+                    cache_ttl=config.get('RERANK_CACHE_TTL', 3600),
+                    backend=config.get('INFERENCE_BACKEND', 'torch'),
+                    onnx_root=config.get('ONNX_MODEL_DIR'),
+                    onnx_quantized=config.get('ONNX_QUANTIZED', True),
+                    num_threads=config.get('ONNX_NUM_THREADS', 0)
+                )
+    return _reranker
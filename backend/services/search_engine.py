@@ -0,0 +1,212 @@
+"""语义检索引擎 - 查询向量化 + FAISS检索 + BM25混合检索"""
+import logging
+from typing import Dict, List, Optional
+
+from services.chunker import slice_chunk
+from services.embeddings import EmbeddingService, get_embedding_service
+from services.query_cache import QueryCache, ResultCursors, create_query_cache, create_result_cursors
+from services.query_metrics import StageTimer
+from services.reranker import CrossEncoderReranker, get_reranker
+from services.shards import ShardSet, create_shard_set
+
+logger = logging.getLogger(__name__)
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict]], k: int = 60) -> List[Dict]:
+    """
+    倒数排名融合（RRF）：score = Σ 1 / (k + rank)，只依赖名次，
+    无需对向量相似度与BM25得分做归一化。返回按融合得分降序的 [{'document_id', 'score'}]。
+    """
+    fused: Dict[int, float] = {}
+    for hits in ranked_lists:
+        for rank, hit in enumerate(hits, start=1):
+            doc_id = hit['document_id']
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [{'document_id': doc_id, 'score': score} for doc_id, score in ranked]
+
+
+class SemanticSearchEngine:
+    """
+    语义检索引擎（向量检索 + BM25关键词检索，RRF融合，交叉编码器重排）。
+    向量与关键词检索在分片集合上执行：按日期范围扇出到相交的分片，归并各分片的 top_k。
+    """
+
+    MODES = ('hybrid', 'vector', 'keyword')
+
+    def __init__(self, shards: ShardSet, embedder: EmbeddingService,
+                 reranker: Optional[CrossEncoderReranker] = None,
+                 query_cache: Optional[QueryCache] = None,
+                 cursors: Optional[ResultCursors] = None,
+                 default_limit: int = 10, similarity_threshold: float = 0.0,
+                 rrf_k: int = 60, fusion_depth: int = 50, chunk_size: int = 500):
+        self.shards = shards
+        self.embedder = embedder
+        self.reranker = reranker
+        self.query_cache = query_cache
+        self.cursors = cursors or ResultCursors()
+        self.default_limit = default_limit
+        self.similarity_threshold = similarity_threshold
+        self.rrf_k = rrf_k
+        self.fusion_depth = fusion_depth
+        self.chunk_size = chunk_size
+
+    def search(self, query: str, top_k: Optional[int] = None,
+               threshold: Optional[float] = None, mode: str = 'hybrid',
+               rerank: bool = True, filters: Optional[Dict] = None,
+               timer: Optional[StageTimer] = None) -> List[Dict]:
+        """
+        检索并返回按得分降序排列的文档（每篇文档保留得分最高的分块）：
+          [{'document_id', 'score', 'vector_score', 'bm25_score', 'rerank_score',
+            'chunk_id', 'start', 'end'}, ...]
+        hybrid 模式下 score 为RRF融合得分；仅被BM25命中的文档没有分块信息（为None）。
+        启用重排时，前 RERANK_TOP_N 个候选按交叉编码器得分重新排序。
+        filters 为检索前过滤条件（source_type、source_name、start_time/end_time），
+        在ANN检索与BM25检索内部生效，而不是对 top_k 结果做后过滤。
+        timer 用于记录各阶段耗时（embed/ann/bm25/rerank）与候选数。
+        """
+        top_k = top_k or self.default_limit
+        threshold = self.similarity_threshold if threshold is None else threshold
+        if mode not in self.MODES:
+            raise ValueError(f"不支持的检索模式: {mode}")
+
+        rerank = rerank and self.reranker is not None
+        timer = timer or StageTimer()
+
+        # 结果缓存键包含索引代数，任一分片发布新索引后自动失效
+        self.shards.refresh()
+        generation = self.shards.generation
+        filters = {key: value for key, value in (filters or {}).items() if value}
+        cache_params = {'top_k': top_k, 'threshold': threshold, 'mode': mode, 'rerank': rerank,
+                        'filters': {key: str(value) for key, value in filters.items()}}
+        if self.query_cache is not None:
+            cached = self.query_cache.get_results(query, cache_params, generation)
+            if cached is not None:
+                timer.cache_hit = True
+                timer.count('results', len(cached))
+                return [dict(result) for result in cached]
+
+        candidate_count = max(top_k, self.reranker.top_n) if rerank else top_k
+        # 融合时每一路多取候选，避免只在单路排名靠后的文档被截断
+        depth = max(candidate_count, self.fusion_depth) if mode == 'hybrid' else candidate_count
+        vector_hits = self._vector_search(query, depth, threshold, filters, timer) if mode != 'keyword' else []
+        keyword_hits = []
+        if mode != 'vector':
+            with timer.stage('bm25'):
+                keyword_hits = self.shards.keyword_search(query, depth, filters)
+            timer.count('keyword_candidates', len(keyword_hits))
+
+        if mode == 'vector':
+            ranked = vector_hits
+        elif mode == 'keyword':
+            ranked = keyword_hits
+        else:
+            ranked = reciprocal_rank_fusion([vector_hits, keyword_hits], k=self.rrf_k)
+
+        vector_map = {hit['document_id']: hit for hit in vector_hits}
+        keyword_map = {hit['document_id']: hit for hit in keyword_hits}
+        results = []
+        for hit in ranked[:candidate_count]:
+            doc_id = hit['document_id']
+            vector_hit = vector_map.get(doc_id, {})
+            keyword_hit = keyword_map.get(doc_id)
+            results.append({
+                'document_id': doc_id,
+                'score': hit['score'],
+                'vector_score': vector_hit.get('score'),
+                'bm25_score': keyword_hit['score'] if keyword_hit else None,
+                'rerank_score': None,
+                'chunk_id': vector_hit.get('chunk_id'),
+                'start': vector_hit.get('start'),
+                'end': vector_hit.get('end')
+            })
+
+        if rerank and results:
+            timer.count('rerank_candidates', min(len(results), self.reranker.top_n))
+            with timer.stage('rerank'):
+                results = self._rerank(query, results)
+        results = results[:top_k]
+        timer.count('results', len(results))
+
+        if self.query_cache is not None:
+            self.query_cache.set_results(query, cache_params, generation, results)
+        return results
+
+    def _embed_query(self, query: str):
+        """查询向量化（优先命中查询向量缓存）"""
+        if self.query_cache is None:
+            return self.embedder.encode_query(query)
+        vector = self.query_cache.get_embedding(query)
+        if vector is None:
+            vector = self.embedder.encode_query(query)
+            self.query_cache.set_embedding(query, vector)
+        return vector
+
+    def _rerank(self, query: str, results: List[Dict]) -> List[Dict]:
+        """交叉编码器重排：分块命中用分块文本打分，仅关键词命中的文档用标题加正文开头"""
+        from models.document import Document
+        from models.database import db
+
+        doc_ids = [result['document_id'] for result in results[:self.reranker.top_n]]
+        rows = db.session.query(Document.id, Document.title, Document.content).filter(
+            Document.id.in_(doc_ids)
+        ).all()
+        texts = {row.id: (row.title or '', row.content or '') for row in rows}
+
+        candidates = []
+        for result in results:
+            title, content = texts.get(result['document_id'], ('', ''))
+            if result['chunk_id'] is not None:
+                # 分块ID只在分片内唯一，缓存键带上文档ID
+                key = f"{result['document_id']}:{result['chunk_id']}"
+                text = slice_chunk(content, result['start'], result['end'])
+            else:
+                key = f"doc:{result['document_id']}"
+                text = content[:self.chunk_size]
+            candidates.append(dict(result, key=key, text=f"{title}\n{text}" if title else text))
+
+        reranked = self.reranker.rerank(query, candidates)
+        for candidate in reranked:
+            candidate.pop('key', None)
+            candidate.pop('text', None)
+        return reranked
+
+    def _vector_search(self, query: str, top_k: int, threshold: float,
+                       filters: Optional[Dict], timer: StageTimer) -> List[Dict]:
+        """向量检索：查询只向量化一次，再扇出到相交的分片"""
+        if not self.shards.select(filters):
+            return []
+        with timer.stage('embed'):
+            vector = self._embed_query(query)
+        with timer.stage('ann'):
+            hits = self.shards.vector_search(vector, top_k, threshold, filters)
+        timer.count('vector_candidates', len(hits))
+        return hits
+
+
+def init_search_engine(app) -> SemanticSearchEngine:
+    """在应用启动时加载各分片的FAISS索引（内存映射）与关键词索引，并挂载到 app.extensions"""
+    engine = SemanticSearchEngine(
+        create_shard_set(app.config),
+        get_embedding_service(app.config['EMBEDDING_MODEL'], app.config),
+        reranker=get_reranker(app.config) if app.config.get('RERANK_ENABLED', True) else None,
+        query_cache=create_query_cache(app.config) if app.config.get('QUERY_CACHE_ENABLED', True) else None,
+        cursors=create_result_cursors(app.config),
+        default_limit=app.config.get('SEARCH_RESULTS_LIMIT', 10),
+        similarity_threshold=app.config.get('SIMILARITY_THRESHOLD', 0.0),
+        rrf_k=app.config.get('RRF_K', 60),
+        fusion_depth=app.config.get('HYBRID_FUSION_DEPTH', 50),
+        chunk_size=app.config.get('CHUNK_SIZE', 500)
+    )
+    app.extensions['search_engine'] = engine
+    return engine
+
+
+def get_search_engine() -> SemanticSearchEngine:
+    """获取当前应用的语义检索引擎（未初始化时懒加载）"""
+    from flask import current_app
+
+    engine = current_app.extensions.get('search_engine')
+    if engine is None:
+        engine = init_search_engine(current_app)
+    return engine
@@ -0,0 +1,58 @@
+"""分片服务 - 在独立进程/主机上加载部分索引分片，通过HTTP提供检索"""
+import hmac
+import logging
+from typing import List, Optional
+
+import numpy as np
+from flask import Flask, abort, jsonify, request
+
+from services.shards import LocalShard, ShardLayout, decode_filters
+
+logger = logging.getLogger(__name__)
+
+
+def create_shard_app(config_object, keys: Optional[List[str]] = None) -> Flask:
+    """
+    创建分片服务应用，加载 keys 指定的本地分片（默认为本机全部分片）。
+    接口（供 RemoteShard 调用）：
+      POST /shards/<key>/vector   {'vector', 'top_k', 'threshold', 'filters'}
+      POST /shards/<key>/keyword  {'query', 'top_k', 'filters'}
+      GET  /shards/<key>/info
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+    layout = ShardLayout(app.config)
+    shards = {key: LocalShard(key, layout) for key in (keys or layout.local_keys()) if key}
+    logger.info(f"分片服务已加载分片: {sorted(shards)}")
+    token = app.config.get('SEARCH_SHARD_TOKEN')
+
+    def get_shard(key: str) -> LocalShard:
+        if token and not hmac.compare_digest(request.headers.get('X-Shard-Token', ''), token):
+            abort(401)
+        shard = shards.get(key)
+        if shard is None:
+            abort(404)
+        shard.refresh()
+        return shard
+
+    @app.route('/shards/<key>/vector', methods=['POST'])
+    def vector_search(key):
+        shard = get_shard(key)
+        data = request.get_json() or {}
+        query_vector = np.asarray(data['vector'], dtype='float32').reshape(1, -1)
+        results = shard.vector_search(query_vector, int(data['top_k']), float(data.get('threshold', 0.0)),
+                                      decode_filters(data.get('filters')))
+        return jsonify({'results': results})
+
+    @app.route('/shards/<key>/keyword', methods=['POST'])
+    def keyword_search(key):
+        shard = get_shard(key)
+        data = request.get_json() or {}
+        results = shard.keyword_search(data['query'], int(data['top_k']), decode_filters(data.get('filters')))
+        return jsonify({'results': results})
+
+    @app.route('/shards/<key>/info', methods=['GET'])
+    def info(key):
+        return jsonify(get_shard(key).info())
+
+    return app
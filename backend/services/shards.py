@@ -0,0 +1,381 @@
+"""索引分片 - 按时间窗口（月）切分向量与关键词索引，查询按日期范围扇出并归并top-k"""
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.chunk_filters import ChunkAttributes
+from services.chunker import ChunkStore
+from services.keyword_index import document_entry, get_keyword_index
+from services.vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+_SHARD_KEY_RE = re.compile(r'^\d{6}$')
+
+
+class ShardLayout:
+    """
+    分片目录布局：
+      - SEARCH_SHARD_BY=none:  单一分片（键为None），索引位于 FAISS_INDEX_PATH 与 KEYWORD_INDEX_PATH
+      - SEARCH_SHARD_BY=month: 按 Document.created_at 所在月份分片（键为 YYYYMM），
+          向量索引 FAISS_INDEX_PATH/shards/<YYYYMM>/（VectorStore + ChunkStore + ChunkAttributes）
+          关键词索引 <KEYWORD_INDEX_PATH去扩展名>_shards/<YYYYMM>.db
+    每个分片目录自成一体，可整体复制到其他主机由分片服务（run_shard_server.py）加载。
+    """
+
+    SHARDS_DIR = 'shards'
+
+    def __init__(self, config):
+        self.config = config
+        self.partition = config.get('SEARCH_SHARD_BY', 'none')
+        if self.partition not in ('none', 'month'):
+            raise ValueError(f"不支持的分片方式: {self.partition}")
+        self.index_root = config['FAISS_INDEX_PATH']
+        self.keyword_path = config['KEYWORD_INDEX_PATH']
+        self.dimension = config['VECTOR_DIMENSION']
+
+    @property
+    def sharded(self) -> bool:
+        return self.partition != 'none'
+
+    def key_for(self, created_at: Optional[datetime]) -> Optional[str]:
+        """文档所属分片；缺少创建时间的文档归入当月"""
+        if not self.sharded:
+            return None
+        return (created_at or datetime.utcnow()).strftime('%Y%m')
+
+    def index_path(self, key: Optional[str]) -> str:
+        if key is None:
+            return self.index_root
+        return os.path.join(self.index_root, self.SHARDS_DIR, key)
+
+    def keyword_db_path(self, key: Optional[str]) -> str:
+        if key is None:
+            return self.keyword_path
+        base, ext = os.path.splitext(self.keyword_path)
+        return os.path.join(f'{base}_shards', f'{key}{ext or ".db"}')
+
+    def local_keys(self) -> List[Optional[str]]:
+        """本机已有的分片键（向量分片目录与关键词分片文件的并集）"""
+        if not self.sharded:
+            return [None]
+        keys = set()
+        shard_root = os.path.join(self.index_root, self.SHARDS_DIR)
+        if os.path.isdir(shard_root):
+            keys.update(name for name in os.listdir(shard_root) if _SHARD_KEY_RE.match(name))
+        keyword_dir = os.path.dirname(self.keyword_db_path('000000'))
+        if os.path.isdir(keyword_dir):
+            keys.update(os.path.splitext(name)[0] for name in os.listdir(keyword_dir)
+                        if _SHARD_KEY_RE.match(os.path.splitext(name)[0]))
+        return sorted(keys)
+
+    def vector_store(self, key: Optional[str], use_mmap: bool = True) -> VectorStore:
+        return VectorStore(self.index_path(key), self.dimension, use_mmap=use_mmap, index_config=self.config)
+
+
+def shard_overlaps(key: Optional[str], filters: Optional[Dict]) -> bool:
+    """分片（月）是否与过滤条件的日期范围相交；单一分片总是相交"""
+    if key is None or not filters:
+        return True
+    start, end = filters.get('start_time'), filters.get('end_time')
+    if start and key < start.strftime('%Y%m'):
+        return False
+    if end and key > end.strftime('%Y%m'):
+        return False
+    return True
+
+
+def encode_filters(filters: Optional[Dict]) -> Dict:
+    """过滤条件序列化为JSON（datetime 转 ISO 格式），用于远程分片请求"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in (filters or {}).items() if value}
+
+
+def decode_filters(data: Optional[Dict]) -> Dict:
+    filters = dict(data or {})
+    for key in ('start_time', 'end_time'):
+        if filters.get(key):
+            filters[key] = datetime.fromisoformat(filters[key])
+    return filters
+
+
+class LocalShard:
+    """本进程内加载的分片（内存映射的FAISS索引 + 分块存储 + BM25索引）"""
+
+    # 每篇文档可能命中多个分块，多取候选以保证去重后仍有 top_k 篇文档
+    CHUNK_OVERSAMPLE = 4
+
+    def __init__(self, key: Optional[str], layout: ShardLayout):
+        self.key = key
+        self.vector_store = layout.vector_store(key, use_mmap=layout.config.get('FAISS_USE_MMAP', True))
+        self.vector_store.load()
+        self.chunk_store = ChunkStore(self.vector_store.index_path)
+        self.chunk_attrs = ChunkAttributes(self.vector_store.index_path)
+        self.keyword_index = get_keyword_index(layout.keyword_db_path(key))
+
+    @property
+    def generation(self) -> int:
+        return self.vector_store.generation
+
+    def refresh(self):
+        self.vector_store.refresh_if_stale()
+
+    def vector_search(self, query_vector: np.ndarray, top_k: int, threshold: float,
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        """向量检索（按过滤条件限定候选分块），分块命中按文档去重"""
+        allowed = self.chunk_attrs.allowed_ids(filters)
+        if allowed is not None and len(allowed) == 0:
+            return []
+        scores, ids = self.vector_store.search(query_vector, top_k * self.CHUNK_OVERSAMPLE, allowed_ids=allowed)
+
+        hits = [(score, chunk_id) for score, chunk_id in zip(scores[0], ids[0])
+                if chunk_id >= 0 and score >= threshold]
+        if not hits:
+            return []
+        records = self.chunk_store.get([chunk_id for _, chunk_id in hits])
+
+        results = []
+        seen_docs = set()
+        for (score, chunk_id), record in zip(hits, records):
+            doc_id = int(record['doc_id'])
+            if doc_id in seen_docs:
+                continue
+            seen_docs.add(doc_id)
+            results.append({
+                'document_id': doc_id,
+                'chunk_id': int(chunk_id),
+                'start': int(record['start']),
+                'end': int(record['end']),
+                'score': float(score)
+            })
+            if len(results) >= top_k:
+                break
+        return results
+
+    def keyword_search(self, query: str, top_k: int, filters: Optional[Dict] = None) -> List[Dict]:
+        return self.keyword_index.search(query, top_k, filters)
+
+    def info(self) -> Dict:
+        return dict(self.vector_store.memory_report(), key=self.key, generation=self.generation)
+
+
+class RemoteShard:
+    """
+    运行在其他进程/主机上的分片（run_shard_server.py），通过HTTP调用。
+    代数按 generation_ttl 缓存，避免每次查询多一次往返。
+    """
+
+    def __init__(self, key: str, base_url: str, token: Optional[str] = None,
+                 timeout: float = 2.0, generation_ttl: float = 5.0):
+        import requests
+
+        self.key = key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.generation_ttl = generation_ttl
+        self.session = requests.Session()
+        if token:
+            self.session.headers['X-Shard-Token'] = token
+        self._generation = 0
+        self._generation_checked = 0.0
+
+    def _url(self, action: str) -> str:
+        return f'{self.base_url}/shards/{self.key}/{action}'
+
+    def _post(self, action: str, payload: Dict) -> List[Dict]:
+        response = self.session.post(self._url(action), json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['results']
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def refresh(self):
+        if time.monotonic() - self._generation_checked < self.generation_ttl:
+            return
+        self._generation_checked = time.monotonic()
+        try:
+            response = self.session.get(self._url('info'), timeout=self.timeout)
+            response.raise_for_status()
+            self._generation = int(response.json().get('generation', 0))
+        except Exception as e:
+            logger.warning(f"获取远程分片 {self.key} 状态失败: {e}")
+
+    def vector_search(self, query_vector: np.ndarray, top_k: int, threshold: float,
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        return self._post('vector', {
+            'vector': np.asarray(query_vector, dtype='float32').reshape(-1).tolist(),
+            'top_k': top_k,
+            'threshold': threshold,
+            'filters': encode_filters(filters)
+        })
+
+    def keyword_search(self, query: str, top_k: int, filters: Optional[Dict] = None) -> List[Dict]:
+        return self._post('keyword', {'query': query, 'top_k': top_k, 'filters': encode_filters(filters)})
+
+    def info(self) -> Dict:
+        try:
+            response = self.session.get(self._url('info'), timeout=self.timeout)
+            response.raise_for_status()
+            return dict(response.json(), remote=self.base_url)
+        except Exception as e:
+            return {'key': self.key, 'remote': self.base_url, 'error': str(e)}
+
+
+def parse_remote_shards(value: Optional[str]) -> Dict[str, str]:
+    """解析 SEARCH_REMOTE_SHARDS：'202301=http://10.0.0.2:5101,202302=http://10.0.0.2:5101'"""
+    shards = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, url = item.split('=', 1)
+            shards[key.strip()] = url.strip()
+    return shards
+
+
+# 分片扇出使用的共享线程池（FAISS检索与HTTP等待都会释放GIL）
+_fanout_executor: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    global _fanout_executor
+    if _fanout_executor is None:
+        with _fanout_lock:
+            if _fanout_executor is None:
+                _fanout_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard-fanout')
+    return _fanout_executor
+
+
+class ShardSet:
+    """
+    查询侧的分片集合：
+      - 本地分片按目录自动发现（每 discover_interval 秒检查一次新分片），SEARCH_REMOTE_SHARDS 中的分片走HTTP
+      - 查询只扇出到与日期范围相交的分片，各分片返回按文档去重的 top_k，归并后取全局 top_k
+      - 单个分片失败只记录警告，返回其余分片的结果
+    向量得分（余弦）在分片间可直接比较；BM25的IDF按分片统计，跨分片归并是近似的。
+    """
+
+    def __init__(self, layout: ShardLayout, remote_shards: Optional[Dict[str, str]] = None,
+                 token: Optional[str] = None, timeout: float = 2.0, fanout_workers: int = 8,
+                 discover_interval: float = 5.0):
+        self.layout = layout
+        self.timeout = timeout
+        self.fanout_workers = fanout_workers
+        self.discover_interval = discover_interval
+        self.shards: Dict[Optional[str], object] = {
+            key: RemoteShard(key, url, token, timeout) for key, url in (remote_shards or {}).items()
+        }
+        self._remote_keys = set(self.shards)
+        self._discovered_at = 0.0
+        self._lock = threading.Lock()
+        self._discover()
+
+    def _discover(self):
+        """加载新出现的本地分片（如新月份的第一批文档）"""
+        self._discovered_at = time.monotonic()
+        for key in self.layout.local_keys():
+            if key in self.shards:
+                continue
+            with self._lock:
+                if key not in self.shards:
+                    self.shards[key] = LocalShard(key, self.layout)
+                    logger.info(f"加载索引分片: {key or '单一分片'}")
+
+    def refresh(self):
+        if time.monotonic() - self._discovered_at >= self.discover_interval:
+            self._discover()
+        for shard in list(self.shards.values()):
+            shard.refresh()
+
+    @property
+    def generation(self) -> int:
+        """各分片代数之和：任一分片发布新版本后递增，用作查询缓存键的一部分"""
+        return sum(shard.generation for shard in list(self.shards.values()))
+
+    def select(self, filters: Optional[Dict]) -> List:
+        return [shard for key, shard in sorted(self.shards.items(), key=lambda item: item[0] or '')
+                if shard_overlaps(key, filters)]
+
+    def _scatter(self, method: str, shards: List, *args) -> List[List[Dict]]:
+        if len(shards) == 1:
+            return [getattr(shards[0], method)(*args)]
+        executor = _get_executor(self.fanout_workers)
+        futures = [(shard, executor.submit(getattr(shard, method), *args)) for shard in shards]
+        results = []
+        for shard, future in futures:
+            try:
+                results.append(future.result(timeout=self.timeout))
+            except Exception as e:
+                logger.warning(f"分片 {shard.key} 检索失败，忽略该分片: {e}")
+        return results
+
+    @staticmethod
+    def _merge(result_lists: List[List[Dict]], top_k: int) -> List[Dict]:
+        merged = sorted((hit for hits in result_lists for hit in hits), key=lambda hit: hit['score'], reverse=True)
+        results = []
+        seen = set()
+        for hit in merged:
+            if hit['document_id'] in seen:
+                continue
+            seen.add(hit['document_id'])
+            results.append(hit)
+            if len(results) >= top_k:
+                break
+        return results
+
+    def vector_search(self, query_vector: np.ndarray, top_k: int, threshold: float,
+                      filters: Optional[Dict] = None) -> List[Dict]:
+        shards = self.select(filters)
+        if not shards:
+            return []
+        return self._merge(self._scatter('vector_search', shards, query_vector, top_k, threshold, filters), top_k)
+
+    def keyword_search(self, query: str, top_k: int, filters: Optional[Dict] = None) -> List[Dict]:
+        shards = self.select(filters)
+        if not shards:
+            return []
+        return self._merge(self._scatter('keyword_search', shards, query, top_k, filters), top_k)
+
+    def memory_report(self) -> Dict:
+        shards = [shard.info() for _, shard in sorted(self.shards.items(), key=lambda item: item[0] or '')]
+        local = [info for info in shards if 'remote' not in info]
+        return {
+            'partition': self.layout.partition,
+            'shard_count': len(shards),
+            'remote_shards': len(self._remote_keys),
+            'ntotal': sum(info.get('ntotal', 0) for info in shards),
+            'index_bytes': sum(info.get('index_bytes', 0) for info in local),
+            'shards': shards
+        }
+
+
+def create_shard_set(config) -> ShardSet:
+    """根据配置创建查询侧分片集合"""
+    return ShardSet(
+        ShardLayout(config),
+        remote_shards=parse_remote_shards(config.get('SEARCH_REMOTE_SHARDS')),
+        token=config.get('SEARCH_SHARD_TOKEN'),
+        timeout=config.get('SEARCH_SHARD_TIMEOUT', 2.0),
+        fanout_workers=config.get('SEARCH_SHARD_FANOUT_WORKERS', 8)
+    )
+
+
+def index_keywords(config, documents) -> int:
+    """将文档按所属分片写入关键词索引，返回索引的文档数"""
+    layout = ShardLayout(config)
+    groups: Dict[Optional[str], List] = {}
+    for doc in documents:
+        groups.setdefault(layout.key_for(doc.created_at), []).append(doc)
+    count = 0
+    for key, docs in groups.items():
+        keyword_index = get_keyword_index(layout.keyword_db_path(key))
+        count += keyword_index.add_documents(document_entry(doc) for doc in docs)
+    return count
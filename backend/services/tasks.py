@@ -3,6 +3,7 @@ import sys
 import os
 from datetime import datetime
 import logging
+import math
 import threading
 
 # 添加项目路径
@@ -11,7 +12,11 @@ if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
 
 from celery_app import celery
-from services.fetchers import RSSFetcher, WebFetcher, AgentFetcher
+from services.crawl_engine import create_crawler
+from services.crawl_policy import get_crawl_policy_cache
+from services.fetchers import HTTP_VALIDATORS_KEY, RSSFetcher, WebFetcher, AgentFetcher
+from services.http_client import get_http_client
+from services.rate_limiter import RateLimited, get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +48,143 @@ def get_flask_app():
     return _flask_app
 
 
+def index_document_keywords(app, documents):
+    """将新保存的文档按所属分片增量写入关键词倒排索引（失败不影响抓取结果）"""
+    from services.shards import index_keywords
+    
+    if not documents:
+        return 0
+    try:
+        count = index_keywords(app.config, documents)
+        logger.info(f"关键词索引已更新: {count} 篇文档")
+        return count
+    except Exception as e:
+        logger.error(f"更新关键词索引失败: {e}")
+        return 0
+
+
+def create_duplicate_checker(app):
+    """创建近重复检查器（未启用或索引不可用时返回None，按原有精确去重处理）"""
+    if not app.config.get('NEAR_DUPLICATE_ENABLED', True):
+        return None
+    from services.dedup import DuplicateChecker, get_near_duplicate_index
+    try:
+        index = get_near_duplicate_index(app.config['NEAR_DUPLICATE_INDEX_PATH'],
+                                         app.config.get('NEAR_DUPLICATE_MAX_DISTANCE', 3))
+        return DuplicateChecker(index, app.config.get('NEAR_DUPLICATE_TEXT_CHARS', 2000))
+    except Exception as e:
+        logger.error(f"初始化近重复索引失败: {e}")
+        return None
+
+
+class KnownEntries:
+    """
+    某来源已入库文档的链接集合与标题集合。首次访问时一次查询载入，
+    源未变化（304）时不会被访问，也就不查询文档表。
+    链接集合同时包含近重复索引中记录的该来源重复文章链接（未单独入库）。
+    """
+
+    def __init__(self, source_name: str, duplicate_index=None):
+        self.source_name = source_name
+        self.duplicate_index = duplicate_index
+        self._links = None
+        self._titles = None
+
+    def _load(self):
+        from models.document import Document
+        from models.database import db
+
+        rows = db.session.query(Document.source_url, Document.title).filter(
+            Document.source_name == self.source_name
+        ).all()
+        self._links = {row.source_url for row in rows if row.source_url}
+        self._titles = {row.title for row in rows if row.title}
+        if self.duplicate_index is not None:
+            try:
+                self._links |= self.duplicate_index.linked_urls(self.source_name)
+            except Exception as e:
+                logger.error(f"读取近重复链接失败: {e}")
+
+    @property
+    def links(self) -> set:
+        if self._links is None:
+            self._load()
+        return self._links
+
+    @property
+    def titles(self) -> set:
+        if self._titles is None:
+            self._load()
+        return self._titles
+
+
+class PendingFetches:
+    """
+    数据源抓取任务的排队标记（按数据源一个 Redis 键，SET NX 占用）：
+    调度器加入队列前先占用，任务改期或失败重试时延长有效期，任务结束时清除。
+    已有排队、改期或等待重试的任务时调度器跳过该数据源，同一数据源不会出现多条并行的改期链。
+    标记设有效期（CRAWL_PENDING_TTL），worker异常退出未清除时自动失效；Redis 不可用时不做限制。
+    """
+
+    REDIS_PREFIX = 'news_rag:fetch_pending:'
+
+    def __init__(self, redis_client=None, ttl: float = 900):
+        self.redis = redis_client
+        self.ttl = ttl
+
+    def claim(self, source_id: int) -> bool:
+        """占用排队标记，已被占用时返回False"""
+        if self.redis is None:
+            return True
+        try:
+            return bool(self.redis.set(self.REDIS_PREFIX + str(source_id), 1, nx=True, ex=int(self.ttl)))
+        except Exception as e:
+            logger.warning(f"占用数据源 {source_id} 排队标记失败: {e}")
+            return True
+
+    def extend(self, source_id: int, countdown: float):
+        """任务改期或重试：标记保持到 countdown 秒后的任务执行完"""
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self.REDIS_PREFIX + str(source_id), 1, ex=int(math.ceil(countdown + self.ttl)))
+        except Exception as e:
+            logger.warning(f"延长数据源 {source_id} 排队标记失败: {e}")
+
+    def release(self, source_id: int):
+        if self.redis is None:
+            return
+        try:
+            self.redis.delete(self.REDIS_PREFIX + str(source_id))
+        except Exception as e:
+            logger.warning(f"清除数据源 {source_id} 排队标记失败: {e}")
+
+
+def get_pending_fetches(app) -> PendingFetches:
+    """数据源排队标记（复用限速器的Redis连接）"""
+    return PendingFetches(get_rate_limiter(app.config).redis, app.config.get('CRAWL_PENDING_TTL', 900))
+
+
+def link_duplicate(duplicate, source_name: str, link: str, title: str):
+    """
+    将近重复文章记录到原文档的 extra_metadata['duplicates'] 中（不再单独入库）。
+    duplicate 为已入库文档ID或本批次待提交的文档对象；链接已记录过时不再修改原文档。
+    """
+    from models.document import Document
+    
+    doc = duplicate if isinstance(duplicate, Document) else Document.query.get(duplicate)
+    if doc is None:
+        return
+    metadata = dict(doc.extra_metadata or {})
+    duplicates = list(metadata.get('duplicates', []))
+    if link and any(item.get('url') == link for item in duplicates):
+        return
+    duplicates.append({'source_name': source_name, 'url': link, 'title': title})
+    metadata['duplicates'] = duplicates
+    # JSON列需整体赋值才会被识别为已修改
+    doc.extra_metadata = metadata
+
+
 @celery.task(name='services.tasks.fetch_all_data_sources')
 def fetch_all_data_sources():
     """定时任务：获取所有活跃的数据源"""
@@ -57,6 +199,7 @@ def fetch_all_data_sources():
             
             queued_count = 0
             skipped_count = 0
+            pending = get_pending_fetches(app)
             
             for source in sources:
                 # 检查是否需要抓取（基于fetch_interval）
@@ -67,9 +210,19 @@ def fetch_all_data_sources():
                         skipped_count += 1
                         continue
                 
+                # 已有排队、改期或等待重试的抓取任务（未更新 last_fetch）时不再重复加入队列
+                if not pending.claim(source.id):
+                    logger.info(f"数据源 {source.name} (ID: {source.id}) 已有排队或改期中的抓取任务，跳过")
+                    skipped_count += 1
+                    continue
+                
                 # 异步执行单个数据源抓取
                 logger.info(f"将数据源 {source.name} (ID: {source.id}, 类型: {source.source_type}) 加入抓取队列")
-                fetch_data_source.delay(source.id)
+                try:
+                    fetch_data_source.delay(source.id)
+                except Exception:
+                    pending.release(source.id)
+                    raise
                 queued_count += 1
             
             logger.info(f"抓取任务调度完成: 共 {len(sources)} 个活跃数据源，{queued_count} 个已加入队列，{skipped_count} 个因间隔未到跳过")
@@ -93,14 +246,21 @@ def fetch_all_data_sources():
 
 
 @celery.task(name='services.tasks.fetch_data_source', bind=True, max_retries=3)
-def fetch_data_source(self, source_id: int):
-    """抓取单个数据源"""
+def fetch_data_source(self, source_id: int, deferrals: int = 0):
+    """
+    抓取单个数据源。
+    目标主机限速时重新投递一个新任务（deferrals 计数，上限 CRAWL_MAX_DEFERRALS），
+    不占用失败重试的次数。改期与等待重试期间保留数据源的排队标记，调度器不会再加入新任务。
+    """
     from models.data_source import DataSource
     from models.document import Document
     from models.database import db
     
     # 使用共享的 Flask 应用实例（类似 HTTP keep-alive）
     app = get_flask_app()
+    pending = get_pending_fetches(app)
+    # 改期或等待重试时保留排队标记，其余情况在任务结束时清除
+    keep_pending = False
     with app.app_context():
         try:
             source = DataSource.query.get(source_id)
@@ -114,26 +274,39 @@ def fetch_data_source(self, source_id: int):
             logger.info(f"开始抓取数据源: {source.name} (ID: {source_id}, 类型: {source.source_type}, URL: {source.url})")
             
             articles = []
+            fetcher = None
+            # 上次响应的 ETag / Last-Modified，作为条件请求的校验器
+            validators = (source.config or {}).get(HTTP_VALIDATORS_KEY) or {}
+            duplicate_checker = create_duplicate_checker(app)
+            # 该来源已入库的链接与标题（一次查询载入），抓取器据此在网络请求前跳过已知条目
+            known = KnownEntries(source.name, duplicate_checker.index if duplicate_checker is not None else None)
             
             # 根据类型选择抓取器
             if source.source_type == 'rss':
-                fetcher = RSSFetcher()
-                articles = fetcher.fetch(source.url)
+                fetcher = RSSFetcher(policies=get_crawl_policy_cache(app.config),
+                                     html_parser=app.config.get('HTML_PARSER'),
+                                     limiter=get_rate_limiter(app.config),
+                                     http_client=get_http_client(app.config),
+                                     max_bytes=app.config.get('FETCH_MAX_BYTES'))
+                articles = fetcher.fetch(source.url, validators, known)
                 logger.info(f"RSS抓取完成，获取到 {len(articles)} 篇文章")
                 
             elif source.source_type == 'web':
-                fetcher = WebFetcher()
+                fetcher = WebFetcher(crawler=create_crawler(app.config), html_parser=app.config.get('HTML_PARSER'),
+                                     limiter=get_rate_limiter(app.config),
+                                     http_client=get_http_client(app.config),
+                                     max_bytes=app.config.get('FETCH_MAX_BYTES'))
                 config = source.config or {}
                 # 如果配置了列表选择器，则进行列表页解析 + 详情页遍历
                 if config.get('list_selector'):
-                    articles = fetcher.fetch_list(source.url, config)
+                    articles = fetcher.fetch_list(source.url, config, validators, known)
                     logger.info(f"网页列表抓取完成，获取到 {len(articles)} 篇文章")
                 else:
-                    article = fetcher.fetch(source.url, config)
+                    article = fetcher.fetch(source.url, config, validators)
                     if article:
                         articles = [article]
                         logger.info(f"网页抓取完成，获取到 1 篇文章")
-                    else:
+                    elif not fetcher.not_modified:
                         articles = []
                         logger.warning(f"网页抓取未获取到内容")
                     
@@ -144,9 +317,18 @@ def fetch_data_source(self, source_id: int):
                 db.session.commit()
                 return {'status': 'skipped', 'reason': 'API type not supported'}
             
+            # 源未变化（304）：不解析、不访问文档表，只记录一次成功抓取
+            if fetcher is not None and fetcher.not_modified:
+                source.update_fetch_result(success=True, error_message=None)
+                logger.info(f"数据源 {source.name} 未变化（304），跳过入库")
+                return {'status': 'not_modified', 'source_id': source_id}
+            
             # 保存文章到数据库
             saved_count = 0
-            skipped_count = 0
+            skipped_count = fetcher.skipped_known if fetcher is not None else 0
+            duplicate_count = 0
+            saved_documents = []
+            duplicate_action = app.config.get('NEAR_DUPLICATE_ACTION', 'link')
             for article_data in articles:
                 try:
                     # 检查是否已存在（基于URL和标题的组合，更准确）
@@ -154,28 +336,37 @@ def fetch_data_source(self, source_id: int):
                     title = article_data.get('title', '未命名')
                     
                     # 如果URL存在，优先使用URL检查
-                    if link:
-                        existing = Document.query.filter_by(source_url=link, source_name=source.name).first()
-                        if existing:
-                            logger.debug(f"文章已存在（基于URL）: {link}")
-                            skipped_count += 1
-                            continue
+                    if link and link in known.links:
+                        logger.debug(f"文章已存在（基于URL）: {link}")
+                        skipped_count += 1
+                        continue
                     
                     # 如果URL不存在，使用标题和来源名称检查（避免重复标题）
-                    if title and title != '未命名':
-                        existing = Document.query.filter_by(
-                            title=title,
-                            source_name=source.name
-                        ).first()
-                        if existing:
-                            logger.debug(f"文章已存在（基于标题）: {title}")
-                            skipped_count += 1
+                    if title and title != '未命名' and title in known.titles:
+                        logger.debug(f"文章已存在（基于标题）: {title}")
+                        skipped_count += 1
+                        continue
+                    
+                    # 跨来源近重复检查（转载稿、同稿多频道发布）
+                    content = article_data.get('content', '') or article_data.get('summary', '')
+                    fingerprint_value = None
+                    if duplicate_checker is not None:
+                        fingerprint_value, duplicate = duplicate_checker.check(title, content)
+                        if duplicate is not None:
+                            if duplicate_action == 'link':
+                                link_duplicate(duplicate, source.name, link, title)
+                            # 记录链接，之后的抓取在下载前即跳过该条目
+                            duplicate_checker.remember_link(source.name, link, duplicate)
+                            if link:
+                                known.links.add(link)
+                            logger.debug(f"近重复文章（{duplicate_action}）: {title}")
+                            duplicate_count += 1
                             continue
                     
                     # 创建文档
                     doc = Document(
                         title=title,
-                        content=article_data.get('content', '') or article_data.get('summary', ''),
+                        content=content,
                         summary=article_data.get('summary', '') or (article_data.get('content', '')[:200] if article_data.get('content') else ''),
                         source_type=source.source_type,
                         source_url=link or source.url,
@@ -189,6 +380,12 @@ def fetch_data_source(self, source_id: int):
                     )
                     
                     db.session.add(doc)
+                    saved_documents.append(doc)
+                    # 同一批次内的重复条目也要跳过
+                    known.links.add(doc.source_url)
+                    known.titles.add(title)
+                    if duplicate_checker is not None:
+                        duplicate_checker.remember(fingerprint_value, doc)
                     saved_count += 1
                     logger.debug(f"保存新文章: {title[:50]}...")
                     
@@ -205,6 +402,11 @@ def fetch_data_source(self, source_id: int):
                 db.session.rollback()
                 raise
             
+            # 增量更新关键词索引与近重复索引（提交后才有文档ID）
+            index_document_keywords(app, saved_documents)
+            if duplicate_checker is not None:
+                duplicate_checker.commit_pending()
+            
             # 验证文档是否真的保存到数据库
             actual_count = Document.query.filter_by(source_name=source.name).count()
             logger.info(f"验证：数据库中 {source.name} 的文档数量为 {actual_count}")
@@ -212,22 +414,47 @@ def fetch_data_source(self, source_id: int):
             # 重新获取数据源对象（避免过期）
             source = DataSource.query.get(source_id)
             
+            # 保存本次响应的校验器（重新赋值整个字典，JSON列才会被标记为已修改）
+            new_validators = fetcher.validators if fetcher is not None else {}
+            if new_validators != validators:
+                source.config = dict(source.config or {}, **{HTTP_VALIDATORS_KEY: new_validators})
+            
             # 更新数据源状态（即使没有文章也算成功，因为可能是RSS源没有新内容）
             source.update_fetch_result(
                 success=True,
                 error_message=None
             )
             
-            logger.info(f"数据源 {source.name} 抓取完成，找到 {len(articles)} 篇文章，保存 {saved_count} 篇，跳过 {skipped_count} 篇（已存在），数据库中实际有 {actual_count} 篇，fetch_count已更新为 {source.fetch_count}")
+            logger.info(f"数据源 {source.name} 抓取完成，找到 {len(articles)} 篇文章，保存 {saved_count} 篇，跳过 {skipped_count} 篇（已存在），近重复 {duplicate_count} 篇，数据库中实际有 {actual_count} 篇，fetch_count已更新为 {source.fetch_count}")
+            # 本进程共享连接池的累计统计（命中 = 复用已有连接，未命中 = 新建连接）
+            http_stats = get_http_client(app.config).stats()
+            logger.info(f"HTTP连接池: {http_stats['requests']} 个请求，命中 {http_stats['pool_hits']}，未命中 {http_stats['pool_misses']}，命中率 {http_stats['hit_rate']:.1%}，TLS握手 {http_stats['tls_handshakes']} 次，HTTP/2 请求 {http_stats['http2_requests']} 个")
             
             return {
                 'status': 'success',
                 'source_id': source_id,
                 'articles_found': len(articles),
                 'articles_saved': saved_count,
-                'articles_skipped': skipped_count
+                'articles_skipped': skipped_count,
+                'articles_duplicated': duplicate_count,
+                'http_pool': http_stats
             }
             
+        except RateLimited as e:
+            # 目标主机正被其他worker抓取：改期到令牌可用时再执行，不记为抓取失败，也不消耗重试次数
+            db.session.rollback()
+            max_deferrals = app.config.get('CRAWL_MAX_DEFERRALS', 20)
+            if deferrals >= max_deferrals:
+                # 未更新 last_fetch，下一轮调度会再次加入队列
+                logger.warning(f"数据源 {source_id} 已连续改期 {deferrals} 次，本轮放弃: {e}")
+                return {'status': 'skipped', 'reason': 'rate limited', 'source_id': source_id}
+            logger.info(f"数据源 {source_id} 暂缓抓取（第 {deferrals + 1} 次改期）: {e}")
+            countdown = math.ceil(e.retry_after)
+            pending.extend(source_id, countdown)
+            fetch_data_source.apply_async(args=[source_id], kwargs={'deferrals': deferrals + 1},
+                                          countdown=countdown)
+            keep_pending = True
+            return {'status': 'deferred', 'source_id': source_id, 'retry_after': e.retry_after}
         except Exception as e:
             logger.error(f"抓取数据源 {source_id} 失败: {e}")
             
@@ -240,8 +467,14 @@ def fetch_data_source(self, source_id: int):
                 pass
             
             # 重试
-            raise self.retry(exc=e, countdown=60 * (self.request.retries + 1))
+            countdown = 60 * (self.request.retries + 1)
+            if self.request.retries < self.max_retries:
+                pending.extend(source_id, countdown)
+                keep_pending = True
+            raise self.retry(exc=e, countdown=countdown)
         finally:
+            if not keep_pending:
+                pending.release(source_id)
             # 显式关闭数据库连接，确保连接返回到连接池
             # 这很重要，避免连接泄漏
             try:
@@ -272,12 +505,21 @@ def fetch_with_agent(url: str, query: str = None):
             
             fetcher = AgentFetcher(
                 ollama_url=app_config.OLLAMA_BASE_URL,
-                model=app_config.OLLAMA_MODEL
+                model=app_config.OLLAMA_MODEL,
+                http_client=get_http_client(app.config)
             )
             
             result = fetcher.fetch(url, query)
             
             if result:
+                duplicate_checker = create_duplicate_checker(app)
+                fingerprint_value = None
+                if duplicate_checker is not None:
+                    fingerprint_value, duplicate = duplicate_checker.check(result.get('title'), result.get('content'))
+                    if duplicate is not None:
+                        logger.info(f"智能代理抓取的文章与文档 {duplicate} 近重复: {url}")
+                        return {'status': 'duplicate', 'document_id': duplicate}
+                
                 # 保存到数据库
                 doc = Document(
                     title=result.get('title', '未命名'),
@@ -295,6 +537,10 @@ def fetch_with_agent(url: str, query: str = None):
                 
                 db.session.add(doc)
                 db.session.commit()
+                index_document_keywords(app, [doc])
+                if duplicate_checker is not None:
+                    duplicate_checker.remember(fingerprint_value, doc)
+                    duplicate_checker.commit_pending()
                 
                 logger.info(f"智能代理抓取成功: {url}")
                 return {'status': 'success', 'document_id': doc.id}
@@ -313,4 +559,96 @@ def fetch_with_agent(url: str, query: str = None):
             try:
                 db.session.remove()
             except:
-                pass
\ No newline at end of file
+                pass
+
+
+@celery.task(name='services.tasks.vectorize_documents')
+def vectorize_documents(max_batches: int = None):
+    """定时任务：增量向量化未向量化的文档"""
+    from models.database import db
+    from services.embedding_pool import get_embedding_encoder
+    from services.indexer import DocumentVectorizer
+    from services.shards import ShardLayout
+    
+    # 使用共享的 Flask 应用实例（类似 HTTP keep-alive）
+    app = get_flask_app()
+    with app.app_context():
+        try:
+            app_config = app.config
+            vectorizer = DocumentVectorizer(
+                ShardLayout(app_config),
+                get_embedding_encoder(app_config),
+                batch_size=app_config['VECTORIZE_BATCH_SIZE'],
+                embed_batch_size=app_config['EMBEDDING_BATCH_SIZE'],
+                save_every=app_config['VECTORIZE_SAVE_EVERY'],
+                chunk_size=app_config['CHUNK_SIZE'],
+                chunk_overlap=app_config['CHUNK_OVERLAP'],
+                pipeline_depth=app_config['VECTORIZE_PIPELINE_DEPTH']
+            )
+            try:
+                # 上一轮仍在运行（编码饱和）时直接跳过，避免定时任务在锁上堆积
+                stats = vectorizer.run(max_batches=max_batches or app_config['VECTORIZE_MAX_BATCHES'],
+                                       wait_for_lock=False)
+            except BlockingIOError:
+                logger.info("上一轮向量化仍在进行，跳过本次调度")
+                return {'status': 'skipped', 'reason': 'vectorization in progress'}
+            
+            if stats['vectorized']:
+                logger.info(f"增量向量化完成: {stats['vectorized']} 篇文档，{stats['chunks']} 个分块，{stats['batches']} 批，索引共 {stats['index_total']} 个向量，{stats['docs_per_sec']} 篇/秒")
+            
+            # 规模跨过选型阈值时在后台重建索引，不阻塞本次任务和查询
+            for shard in stats['rebuild_shards']:
+                logger.info(f"分片 {shard or '-'} 规模跨过选型阈值，提交后台重建任务")
+                rebuild_vector_index.delay(shard=shard)
+            return {'status': 'success', **stats}
+            
+        except Exception as e:
+            logger.error(f"增量向量化失败: {e}")
+            try:
+                db.session.rollback()
+            except:
+                pass
+            return {'status': 'error', 'message': str(e)}
+        finally:
+            # 显式关闭数据库连接，确保连接返回到连接池
+            try:
+                db.session.close()
+            except:
+                pass
+            try:
+                db.session.remove()
+            except:
+                pass
+
+
+
+@celery.task(name='services.tasks.rebuild_vector_index')
+def rebuild_vector_index(index_type: str = None, shard: str = None):
+    """后台任务：按语料规模重新选型、训练并发布FAISS索引（未指定分片时检查全部本地分片）"""
+    from services.index_builder import choose_index_spec
+    from services.shards import ShardLayout
+    
+    app = get_flask_app()
+    try:
+        app_config = app.config
+        layout = ShardLayout(app_config)
+        keys = [shard] if shard else layout.local_keys()
+        rebuilt = {}
+        for key in keys:
+            store = layout.vector_store(key)
+            with store.write_lock():
+                store.load(writable=True)
+                if index_type is None and not store.needs_rebuild():
+                    continue
+                spec = None
+                if index_type:
+                    spec = choose_index_spec(store.ntotal, store.dimension, dict(app_config, FAISS_INDEX_TYPE=index_type))
+                spec = store.rebuild(spec)
+            logger.info(f"FAISS索引重建完成: 分片 {key or '-'}，{spec}")
+            rebuilt[key or '-'] = {'index_spec': spec, 'index_total': store.ntotal}
+        if not rebuilt:
+            return {'status': 'skipped', 'reason': 'index type up to date'}
+        return {'status': 'success', 'shards': rebuilt}
+    except Exception as e:
+        logger.error(f"FAISS索引重建失败: {e}")
+        return {'status': 'error', 'message': str(e)}
@@ -0,0 +1,608 @@
+"""FAISS向量存储 - 索引持久化、只读加载与检索（精确检索直接读取内存映射的全精度向量）"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from services.index_builder import (
+    apply_search_params, build_index, choose_index_spec, create_index, exact_knn, needs_rebuild
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _process_rss_bytes() -> int:
+    """当前进程常驻内存（Linux读取/proc，其他平台返回0）"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class VectorStore:
+    """
+    持久化的FAISS向量索引。
+
+    目录结构（FAISS_INDEX_PATH）：
+      - versions/v<代数>/index.faiss: IndexIDMap2(Flat/IVF/HNSW)，向量ID即分块ID（见 ChunkStore）
+      - versions/v<代数>/meta.json:   维度、向量数量、索引代数（generation）、索引规格（index_spec）等元数据
+      - versions/v<代数>/ids.i64:     该版本索引中的分块ID（int64，升序），只读加载精确索引时使用
+      - current:     指向当前版本目录的符号链接，原子替换即发布新版本
+      - vectors.f32: 全精度原始向量，第 i 行为分块 i 的向量，用于重建/重训练索引（只追加，各版本共用）
+    版本目录写完后不再修改。查询进程每次请求只读一次 current 链接，发现新版本后重新加载；
+    旧版本被删除时已打开的文件仍然有效。只读加载时各类索引的内存占用：
+      - Flat（未压缩）：不读取 index.faiss，直接在内存映射的 vectors.f32 上精确计算（MappedFlatIndex），
+        同一节点的所有worker共享同一份页缓存，进程内只保留分块ID
+      - IVF：IO_FLAG_MMAP 只映射倒排表，聚类中心读入进程内存
+      - HNSW 与压缩的 Flat（fp16/pq）：faiss-cpu 1.7.4 不支持映射，图结构与编码读入每个worker的进程内存；
+        重打分读取的全精度向量仍为内存映射
+    向量需预先L2归一化，内积即余弦相似度。
+    """
+
+    INDEX_FILE = 'index.faiss'
+    META_FILE = 'meta.json'
+    IDS_FILE = 'ids.i64'
+    VECTORS_FILE = 'vectors.f32'
+    LOCK_FILE = '.write.lock'
+    VERSIONS_DIR = 'versions'
+    CURRENT_LINK = 'current'
+
+    def __init__(self, index_path: str, dimension: int, use_mmap: bool = True,
+                 index_config: Optional[Dict] = None):
+        self.index_path = index_path
+        self.dimension = dimension
+        self.use_mmap = use_mmap
+        self.index_config = index_config or {}
+        # 压缩索引的候选放大倍数：多取候选后用全精度向量重打分
+        self.rescore_factor = int(self.index_config.get('FAISS_RESCORE_FACTOR', 4))
+        # 过滤后候选不超过该数量时直接对全精度向量精确计算，比在ANN索引中带过滤检索更快
+        self.filter_brute_force_max = int(self.index_config.get('FAISS_FILTER_BRUTE_FORCE_MAX', 50000))
+        self._raw_map: Optional[np.ndarray] = None
+        # 当前索引对象中的向量ID位图，(索引对象, 向量数, 位图)，按加载的版本缓存
+        self._id_bitmap: Optional[Tuple] = None
+        # 保留的历史版本数（含当前版本），便于回滚与排查
+        self.keep_versions = max(1, int(self.index_config.get('FAISS_KEEP_VERSIONS', 3)))
+        self.index = None
+        self.meta: Dict = {}
+        # 当前加载的版本名与目录（早期未分版本的索引直接位于 index_path，版本名为None）
+        self.version: Optional[str] = None
+        self._version_path = index_path
+        self._lock = threading.RLock()
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self._version_path, self.INDEX_FILE)
+
+    @property
+    def meta_file(self) -> str:
+        return os.path.join(self._version_path, self.META_FILE)
+
+    @property
+    def versions_path(self) -> str:
+        return os.path.join(self.index_path, self.VERSIONS_DIR)
+
+    @property
+    def current_link(self) -> str:
+        return os.path.join(self.index_path, self.CURRENT_LINK)
+
+    def current_version(self) -> Optional[str]:
+        """读取已发布的当前版本名（一次 readlink 调用），尚未发布版本时返回None"""
+        try:
+            return os.path.basename(os.readlink(self.current_link))
+        except OSError:
+            return None
+
+    @property
+    def vectors_file(self) -> str:
+        return os.path.join(self.index_path, self.VECTORS_FILE)
+
+    @property
+    def index_spec(self) -> Dict:
+        return self.meta.get('index_spec') or {'type': 'flat', 'dimension': self.dimension}
+
+    @property
+    def ntotal(self) -> int:
+        return int(self.index.ntotal) if self.index is not None else 0
+
+    @property
+    def generation(self) -> int:
+        """索引代数，每次持久化新向量后递增"""
+        return int(self.meta.get('generation', 0))
+
+    def _new_index(self):
+        return create_index({'type': 'flat', 'dimension': self.dimension})
+
+    def load(self, writable: bool = False) -> bool:
+        """
+        加载当前版本的索引。
+        只读模式下，未压缩的Flat索引改为在内存映射的全精度向量上检索（见 MappedFlatIndex），
+        其余索引以 IO_FLAG_MMAP 读取（faiss-cpu 1.7.4 只映射IVF倒排表）；
+        写入模式（向量化任务）需要完整读入内存。
+        索引不存在时创建空索引并返回False。
+        """
+        import faiss
+
+        with self._lock:
+            version = self.current_version()
+            if version is not None:
+                version_path = os.path.join(self.versions_path, version)
+            else:
+                # 兼容未分版本的旧索引（下次发布时迁移为版本目录）
+                version_path = self.index_path
+            index_file = os.path.join(version_path, self.INDEX_FILE)
+            if not os.path.exists(index_file):
+                logger.info(f"FAISS索引不存在，使用空索引: {index_file}")
+                self.index = self._new_index()
+                self.meta = {}
+                self.version = None
+                return False
+
+            meta = self._read_meta(os.path.join(version_path, self.META_FILE))
+            index = None
+            if self.use_mmap and not writable:
+                index = self._load_mapped_flat(version_path, meta)
+            if self.use_mmap and not writable and index is None:
+                try:
+                    index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                except Exception as e:
+                    logger.warning(f"FAISS索引内存映射失败，回退为完整加载: {e}")
+            if index is None:
+                index = faiss.read_index(index_file)
+
+            if index.d != self.dimension:
+                raise ValueError(f"FAISS索引维度 {index.d} 与配置 VECTOR_DIMENSION={self.dimension} 不一致")
+
+            if not isinstance(index, MappedFlatIndex):
+                apply_search_params(index, meta.get('index_spec') or {'type': 'flat'})
+            # 新索引准备好后再整体切换，进行中的查询继续使用旧索引对象
+            self.meta = meta
+            self.index = index
+            self.version = version
+            self._version_path = version_path
+            logger.info(f"加载FAISS索引成功: {index_file}，版本 {version}，向量数 {self.ntotal}")
+            return True
+
+    def _load_mapped_flat(self, version_path: str, meta: Dict) -> Optional['MappedFlatIndex']:
+        """
+        未压缩的Flat索引与 vectors.f32 中对应行完全相同，只读加载时直接映射后者。
+        缺少分块ID文件（早期版本）或全精度向量不完整时返回None，回退为读取 index.faiss。
+        """
+        spec = meta.get('index_spec') or {'type': 'flat'}
+        if spec.get('type', 'flat') != 'flat' or spec.get('compression', 'none') != 'none':
+            return None
+        ids_file = os.path.join(version_path, self.IDS_FILE)
+        if not os.path.exists(ids_file):
+            return None
+        ids = np.fromfile(ids_file, dtype='int64')
+        raw = self.raw_vectors()
+        if len(ids) and int(ids[-1]) >= len(raw):
+            logger.warning(f"全精度向量文件不完整，回退为读取FAISS索引文件: {self.vectors_file}")
+            return None
+        return MappedFlatIndex(raw, ids, self.dimension)
+
+    def _index_ids(self) -> np.ndarray:
+        """当前索引中的全部分块ID"""
+        import faiss
+
+        if isinstance(self.index, MappedFlatIndex):
+            return self.index.ids
+        return faiss.vector_to_array(self.index.id_map).astype('int64')
+
+    def refresh_if_stale(self) -> bool:
+        """发现已发布的新版本时重新加载（仅一次readlink调用，开销可忽略）"""
+        version = self.current_version()
+        if version is None or version == self.version:
+            return False
+        with self._lock:
+            if version == self.version:
+                return False
+            self.load()
+            return True
+
+    @contextmanager
+    def write_lock(self, blocking: bool = True):
+        """
+        跨进程写锁，保证同一时间只有一个向量化任务修改索引。
+        blocking=False 时锁已被占用则抛出 BlockingIOError。
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(os.path.join(self.index_path, self.LOCK_FILE), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self, path: Optional[str] = None) -> Dict:
+        try:
+            with open(path or self.meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @property
+    def is_compressed(self) -> bool:
+        return self.index_spec.get('compression', 'none') != 'none'
+
+    def search(self, query_vectors: np.ndarray, top_k: int,
+               allowed_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索最相似的 top_k 个向量，返回 (scores, ids)，不足时 id 为 -1。
+        压缩索引先多取 rescore_factor 倍候选，再用内存映射的全精度向量精确重打分。
+        allowed_ids 为元数据过滤后允许的分块ID，检索只访问这些向量：
+          - 数量较少时直接对全精度向量精确计算（过滤越窄越快）
+          - 否则通过 IDSelectorBitmap 在ANN索引内过滤（MappedFlatIndex 按行掩码过滤）
+        """
+        n = len(query_vectors)
+        empty = np.zeros((n, 0), dtype='float32'), np.zeros((n, 0), dtype='int64')
+        if self.index is None or self.ntotal == 0:
+            return empty
+        query_vectors = np.ascontiguousarray(query_vectors, dtype='float32')
+
+        if allowed_ids is not None:
+            mapped = isinstance(self.index, MappedFlatIndex)
+            if mapped or len(allowed_ids) <= self.filter_brute_force_max:
+                # 精确计算直接读取 vectors.f32，其中可能有尚未发布或崩溃遗留的行：只保留已发布索引中的分块，
+                # 与经过ANN索引的检索结果一致
+                allowed_ids = self._indexed_only(allowed_ids)
+            if len(allowed_ids) == 0:
+                return empty
+            top_k = min(top_k, len(allowed_ids))
+            if len(allowed_ids) <= self.filter_brute_force_max and \
+                    int(allowed_ids[-1]) < len(self._mapped_raw(int(allowed_ids[-1]) + 1)):
+                return self._search_subset(query_vectors, allowed_ids, top_k)
+            if mapped:
+                return self.index.search(query_vectors, top_k, allowed_ids=allowed_ids)
+            params = self._selector_params(allowed_ids)
+        else:
+            top_k = min(top_k, self.ntotal)
+            params = None
+
+        if isinstance(self.index, MappedFlatIndex):
+            return self.index.search(query_vectors, top_k)
+        if not self.is_compressed or self.rescore_factor <= 1:
+            return self.index.search(query_vectors, top_k, params=params)
+
+        _, candidate_ids = self.index.search(query_vectors, min(top_k * self.rescore_factor, self.ntotal),
+                                             params=params)
+        return self._rescore(query_vectors, candidate_ids, top_k)
+
+    def _search_subset(self, query_vectors: np.ndarray, allowed_ids: np.ndarray,
+                       top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """在允许的分块上精确计算内积（allowed_ids 升序，按顺序读取内存映射页）"""
+        vectors = np.asarray(self._mapped_raw(int(allowed_ids[-1]) + 1)[allowed_ids])
+        scores = query_vectors @ vectors.T
+        if top_k < len(allowed_ids):
+            top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        else:
+            top = np.broadcast_to(np.arange(len(allowed_ids)), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), allowed_ids[top]
+
+    def _indexed_id_bitmap(self) -> np.ndarray:
+        """当前索引中向量ID的位图（每个ID 1位，little bitorder），索引对象或向量数变化后重新构建"""
+        index = self.index
+        cached = self._id_bitmap
+        if cached is not None and cached[0] is index and cached[1] == index.ntotal:
+            return cached[2]
+        ids = self._index_ids()
+        mask = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=bool)
+        mask[ids] = True
+        bitmap = np.packbits(mask, bitorder='little')
+        self._id_bitmap = (index, index.ntotal, bitmap)
+        return bitmap
+
+    def _indexed_only(self, allowed_ids: np.ndarray) -> np.ndarray:
+        """过滤掉不在当前索引中的分块ID（保持升序）"""
+        bitmap = self._indexed_id_bitmap()
+        allowed_ids = allowed_ids[allowed_ids < len(bitmap) * 8]
+        return allowed_ids[((bitmap[allowed_ids >> 3] >> (allowed_ids & 7)) & 1).astype(bool)]
+
+    def _selector_params(self, allowed_ids: np.ndarray):
+        """构造带ID位图选择器的检索参数（保留当前的 nprobe / efSearch）"""
+        import faiss
+
+        size = int(allowed_ids[-1]) + 1
+        mask = np.zeros(size, dtype=bool)
+        mask[allowed_ids] = True
+        bitmap = np.packbits(mask, bitorder='little')
+        selector = faiss.IDSelectorBitmap(size, faiss.swig_ptr(bitmap))
+
+        spec = self.index_spec
+        if spec.get('type') == 'ivf':
+            params = faiss.SearchParametersIVF()
+            params.nprobe = int(spec.get('nprobe', 1))
+        elif spec.get('type') == 'hnsw':
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = int(spec.get('ef_search', 16))
+        else:
+            params = faiss.SearchParameters()
+        params.sel = selector
+        # 选择器只持有位图指针，二者需与参数对象同生命周期
+        params.referenced_objects = [selector, bitmap]
+        return params
+
+    def _rescore(self, query_vectors: np.ndarray, candidate_ids: np.ndarray,
+                 top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """用全精度向量重新计算候选的内积并排序（只读取候选所在的页）"""
+        raw = self._mapped_raw(int(candidate_ids.max()) + 1)
+        scores = np.full((len(query_vectors), top_k), -np.inf, dtype='float32')
+        ids = np.full((len(query_vectors), top_k), -1, dtype='int64')
+        for i, (query, candidates) in enumerate(zip(query_vectors, candidate_ids)):
+            candidates = candidates[(candidates >= 0) & (candidates < len(raw))]
+            if len(candidates) == 0:
+                continue
+            exact = np.asarray(raw[candidates]) @ query
+            order = np.argsort(-exact)[:top_k]
+            scores[i, :len(order)] = exact[order]
+            ids[i, :len(order)] = candidates[order]
+        return scores, ids
+
+    def _mapped_raw(self, min_rows: int) -> np.ndarray:
+        """缓存全精度向量的内存映射，文件增长后重新映射"""
+        raw = self._raw_map
+        if raw is None or len(raw) < min_rows:
+            raw = self.raw_vectors()
+            self._raw_map = raw
+        return raw
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        """追加向量（分块ID只分配一次，无需先移除旧向量），同时写入全精度向量文件"""
+        with self._lock:
+            if self.index is None:
+                self.index = self._new_index()
+            ids = np.ascontiguousarray(ids, dtype='int64')
+            vectors = np.ascontiguousarray(vectors, dtype='float32')
+            self._write_raw(vectors, ids)
+            self.index.add_with_ids(vectors, ids)
+
+    def _write_raw(self, vectors: np.ndarray, ids: np.ndarray):
+        """按分块ID定位写入全精度向量（连续ID一次写入）"""
+        if len(ids) == 0:
+            return
+        os.makedirs(self.index_path, exist_ok=True)
+        row_bytes = self.dimension * 4
+        mode = 'r+b' if os.path.exists(self.vectors_file) else 'w+b'
+        with open(self.vectors_file, mode) as f:
+            if np.all(np.diff(ids) == 1):
+                f.seek(int(ids[0]) * row_bytes)
+                f.write(vectors.tobytes())
+            else:
+                for vector_id, vector in zip(ids, vectors):
+                    f.seek(int(vector_id) * row_bytes)
+                    f.write(vector.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def raw_vectors(self) -> np.ndarray:
+        """内存映射全精度向量文件，形状 (rows, dimension)"""
+        rows = os.path.getsize(self.vectors_file) // (self.dimension * 4) if os.path.exists(self.vectors_file) else 0
+        if rows == 0:
+            return np.zeros((0, self.dimension), dtype='float32')
+        return np.memmap(self.vectors_file, dtype='float32', mode='r', shape=(rows, self.dimension))
+
+    def _indexed_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """取出当前索引中全部向量ID及其全精度向量"""
+        import faiss
+
+        ids = self._index_ids()
+        raw = self.raw_vectors()
+        if len(ids) and int(ids.max()) < len(raw):
+            if np.array_equal(ids, np.arange(len(ids))):
+                # 常见情况：分块ID连续，直接使用内存映射切片，不复制
+                return ids, raw[:len(ids)]
+            return ids, np.asarray(raw[ids])
+        # 早期索引没有全精度向量文件：精确索引可直接还原向量
+        if self.index_spec.get('type', 'flat') != 'flat':
+            raise RuntimeError('全精度向量文件缺失，无法重建非精确索引')
+        vectors = faiss.downcast_index(self.index.index).reconstruct_n(0, len(ids))
+        self._write_raw(vectors, ids)
+        return ids, vectors
+
+    def needs_rebuild(self) -> bool:
+        """当前索引类型是否已不适合现有规模"""
+        return needs_rebuild(self.index_spec, self.ntotal, self.dimension, self.index_config)
+
+    def rebuild(self, spec: Optional[Dict] = None) -> Dict:
+        """
+        按语料规模重新选型并构建索引（IVF重新训练），构建完成后持久化发布。
+        调用方需持有写锁；查询进程在新索引发布前继续使用旧索引。
+        """
+        with self._lock:
+            ids, vectors = self._indexed_vectors()
+            spec = spec or choose_index_spec(len(ids), self.dimension, self.index_config)
+            logger.info(f"重建FAISS索引: {self.index_spec.get('type', 'flat')} -> {spec['type']}，向量数 {len(ids)}")
+            self.index = build_index(spec, vectors, ids)
+            self.meta['index_spec'] = spec
+            self.meta['recall'] = self.measure_recall(ids, vectors)
+            self.save()
+            return spec
+
+    def measure_recall(self, ids: np.ndarray, vectors: np.ndarray, k: int = 10,
+                       sample_size: int = 200, seed: int = 7) -> Dict:
+        """
+        以精确检索为基准，测量当前索引（含压缩与重打分）的 recall@k，
+        记录在 meta.json 中供管理后台查看压缩带来的召回损失。
+        """
+        if len(ids) == 0:
+            return {}
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(len(ids), size=min(sample_size, len(ids)), replace=False))
+        queries = np.asarray(vectors[sample], dtype='float32')
+        queries = queries + rng.standard_normal(queries.shape).astype('float32') * 0.05
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        k = min(k, len(ids))
+        truth = ids[exact_knn(queries, vectors, k)]
+        _, found = self.search(queries, k)
+        recall = float(np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))]))
+        logger.info(f"索引 recall@{k} = {recall:.4f}（{len(queries)} 条采样查询）")
+        return {'k': k, 'recall': round(recall, 4), 'queries': len(queries)}
+
+    def memory_report(self) -> Dict:
+        """索引内存占用报告：每向量字节数、索引文件与全精度向量文件大小、当前进程常驻内存"""
+        def file_size(path):
+            try:
+                return os.path.getsize(path)
+            except OSError:
+                return 0
+
+        spec = self.index_spec
+        ntotal = self.ntotal
+        index_bytes = file_size(self.index_file)
+        raw_bytes = file_size(self.vectors_file)
+        return {
+            'index_type': spec.get('type', 'flat'),
+            'compression': spec.get('compression', 'none'),
+            'ntotal': ntotal,
+            'dimension': self.dimension,
+            'index_bytes': index_bytes,
+            'bytes_per_vector': round(index_bytes / ntotal, 1) if ntotal else 0,
+            'raw_vectors_bytes': raw_bytes,
+            'compression_ratio': round(ntotal * self.dimension * 4 / index_bytes, 2) if index_bytes else 0,
+            'rescore_factor': self.rescore_factor if self.is_compressed else 1,
+            'version': self.version,
+            'recall': self.meta.get('recall', {}),
+            'process_rss_bytes': _process_rss_bytes()
+        }
+
+    def save(self, extra_meta: Optional[Dict] = None):
+        """
+        发布新版本：索引与元数据写入新的版本目录（先写临时目录再整体改名），
+        最后原子替换 current 链接。读者要么看到旧版本，要么看到完整的新版本。
+        调用方需持有写锁。
+        """
+        import faiss
+
+        with self._lock:
+            generation = self.generation + 1
+            version = f'v{generation:08d}'
+            version_path = os.path.join(self.versions_path, version)
+            tmp_path = version_path + '.tmp'
+            for path in (tmp_path, version_path):
+                # 上次发布中途失败留下的未发布目录
+                shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(tmp_path)
+
+            faiss.write_index(self.index, os.path.join(tmp_path, self.INDEX_FILE))
+            np.sort(self._index_ids()).tofile(os.path.join(tmp_path, self.IDS_FILE))
+            meta = dict(self.meta)
+            meta.update(extra_meta or {})
+            meta.update({
+                'dimension': self.dimension,
+                'ntotal': self.ntotal,
+                'generation': generation,
+                'version': version
+            })
+            with open(os.path.join(tmp_path, self.META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            _fsync_dir(tmp_path)
+            os.replace(tmp_path, version_path)
+
+            self._publish(version)
+            legacy = self.version is None
+            self.meta = meta
+            self.version = version
+            self._version_path = version_path
+            if legacy:
+                self._remove_legacy_files()
+            self._remove_old_versions()
+            logger.info(f"FAISS索引已发布: 版本 {version}，向量数 {self.ntotal}")
+
+    def _publish(self, version: str):
+        """原子替换 current 符号链接（相对路径，索引目录整体移动后仍然有效）"""
+        tmp_link = self.current_link + '.tmp'
+        try:
+            os.remove(tmp_link)
+        except FileNotFoundError:
+            pass
+        os.symlink(os.path.join(self.VERSIONS_DIR, version), tmp_link)
+        os.replace(tmp_link, self.current_link)
+        _fsync_dir(self.index_path)
+
+    def _remove_legacy_files(self):
+        """迁移到版本目录后删除旧的根目录索引文件（已映射的读者不受影响）"""
+        for name in (self.INDEX_FILE, self.META_FILE):
+            try:
+                os.remove(os.path.join(self.index_path, name))
+            except FileNotFoundError:
+                pass
+
+    def _remove_old_versions(self):
+        """只保留最近 keep_versions 个版本；正在使用旧版本的worker已映射文件，删除后仍可继续读取"""
+        current = self.current_version()
+        versions = sorted(name for name in os.listdir(self.versions_path)
+                          if name.startswith('v') and not name.endswith('.tmp'))
+        for name in versions[:-self.keep_versions]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.versions_path, name), ignore_errors=True)
+
+
+class MappedFlatIndex:
+    """
+    只读的精确索引：在内存映射的 vectors.f32 上分块计算内积并取 top-k，
+    向量不读入进程堆内存，同一节点的所有worker共享同一份页缓存。
+    ids 为该版本索引中的分块ID（升序）；vectors.f32 中不属于该版本的行
+    （尚未发布或崩溃遗留）按行掩码排除，结果与 IndexIDMap2(IndexFlatIP) 一致。
+    """
+
+    BLOCK_ROWS = 65536
+
+    def __init__(self, raw: np.ndarray, ids: np.ndarray, dimension: int):
+        self.d = dimension
+        self.ids = ids
+        self.ntotal = len(ids)
+        rows = int(ids[-1]) + 1 if len(ids) else 0
+        self.raw = raw[:rows]
+        # 分块ID连续（常见情况）时无需掩码
+        self.row_mask: Optional[np.ndarray] = None
+        if rows != len(ids):
+            self.row_mask = np.zeros(rows, dtype=bool)
+            self.row_mask[ids] = True
+
+    def search(self, queries: np.ndarray, k: int,
+               allowed_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (scores, ids)，不足 k 个时 id 为 -1；allowed_ids 需已限定在本索引内"""
+        mask = self.row_mask
+        if allowed_ids is not None:
+            mask = np.zeros(len(self.raw), dtype=bool)
+            mask[allowed_ids] = True
+        best_scores = np.full((len(queries), 0), -np.inf, dtype='float32')
+        best_ids = np.zeros((len(queries), 0), dtype='int64')
+        for start in range(0, len(self.raw), self.BLOCK_ROWS):
+            scores = queries @ np.asarray(self.raw[start:start + self.BLOCK_ROWS]).T
+            if mask is not None:
+                scores[:, ~mask[start:start + scores.shape[1]]] = -np.inf
+            ids = np.broadcast_to(np.arange(start, start + scores.shape[1], dtype='int64'), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_ids = np.concatenate([best_ids, ids], axis=1)
+            if best_scores.shape[1] > k:
+                top = np.argpartition(-best_scores, k, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_ids = np.take_along_axis(best_ids, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        best_ids[np.isneginf(best_scores)] = -1
+        return best_scores, best_ids
+
+
+def _fsync_dir(path: str):
+    """同步目录项，保证改名/替换在掉电后依然可见"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)